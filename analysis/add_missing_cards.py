@@ -17,26 +17,11 @@ import psycopg2.extras
 from dotenv import load_dotenv
 
 load_dotenv()
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from decklist import KNOWN_LANDS  # also imported from here by reset_cards.py
 
 DEFAULT_CSV = Path(__file__).parent / "tags-labeled - KF.csv"
 
-# Land cards to exclude from the analysis queue
-KNOWN_LANDS = frozenset({
-    # Basic lands
-    "Forest", "Island", "Mountain", "Plains", "Swamp",
-    # Non-basic lands
-    "Azorius Chancery", "Blossoming Sands", "Bonders' Enclave", "Buried Ruin",
-    "Canopy Vista", "Chamber of Manipulation", "Command Tower", "Cryptic Caves",
-    "Emergence Zone", "Evolving Wilds", "Fire Nation Palace", "Forge of Heroes",
-    "Gates of Istfell", "Glacial Floodplain", "Krosan Verge", "Minas Tirith",
-    "Mines of Moria", "Moorland Haunt", "Mosswort Bridge", "Myriad Landscape",
-    "Mystifying Maze", "Opal Palace", "Path of Ancestry", "Pit of Offerings",
-    "Reliquary Tower", "Restless Anchorage", "Rogue's Passage", "Sea of Clouds",
-    "Seaside Citadel", "Secret Tunnel", "Selesnya Sanctuary", "Simic Growth Chamber",
-    "Stirring Wildwood", "Terramorphic Expanse", "Thornwood Falls",
-    "Valakut, the Molten Pinnacle", "War Room", "Windbrisk Heights",
-})
-
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Sync KF-labeled cards into cards_to_analyze queue")
@@ -4,15 +4,51 @@ Reads card names from public.cards_to_analyze (status = 'NOT_STARTED'), calls th
 Anthropic API in batches, writes per-card results to public.labeled, and marks each
 analyzed card COMPLETED in the source table.
 
+With --submit-batch, every pending batch goes into a single Message Batches API
+submission instead (cards are marked SUBMITTED and the batch id is recorded in
+public.message_batches); a later --collect run waits for the submissions to end and
+saves their results.
+
+With --claim, workers lease batches from the queue (status IN_PROGRESS, claimed_by,
+claimed_at) using FOR UPDATE SKIP LOCKED, so several processes or machines can drain
+the same table without labeling a card twice; cards leased longer ago than
+--lease-minutes (e.g. by a crashed worker) can be claimed again by any worker.
+Cards that still fail are marked FAILED rather than returned, so a worker never
+re-claims its own dead letters (reset_cards.py or --resume retries them). See
+migrations.py for the columns and indexes this needs.
+
+Rate-limit, overload and server errors are retried with jittered exponential backoff
+(--retries). Batches that still fail are recorded per card in public.dead_letter;
+--resume re-runs only those cards, and dead letters are marked resolved once their
+card is labeled.
+
+With --card-db, oracle text comes from the local Scryfall card database (card_db.py,
+SCRYFALL_BULK_PATH / CARD_DB_PATH) instead of the source table's oracle_text column;
+with --with-oracle-text too, it only fills in cards the table has no text for.
+
 Usage:
     uv run python analysis/analyze_batch.py --prompt prompt.md
     uv run python analysis/analyze_batch.py --prompt prompts/v2.md --batch-size 10 --skip-existing
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --concurrency 8 --rpm 50 --tpm 40000
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --upsert
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt10.md --with-oracle-text --pack --count-tokens
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --stream --table cards_to_analyze2 --with-oracle-text
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt14.md --card-db
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --submit-batch --table cards_to_analyze2
+    uv run python analysis/analyze_batch.py --collect
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --resume
+    uv run python analysis/analyze_batch.py --prompt prompts/prompt12.md --claim --concurrency 4  # on each machine
 """
 
 import argparse
+import itertools
 import json
 import os
+import socket
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 import psycopg2
@@ -23,9 +59,15 @@ load_dotenv()
 
 # Allow importing from the project root
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
 
+import card_db
 import claude_utils
 from app import DEFAULT_MECHANICS
+from batch_packing import CHARS_PER_TOKEN, BatchPacker, calibrate_chars_per_token
+from db import connect
+from migrations import migrate
+from rate_limit import RateLimiter, backoff_delay, estimate_tokens
 
 CREATE_LABELED_TABLE = """
 CREATE TABLE IF NOT EXISTS public.labeled (
@@ -38,13 +80,56 @@ CREATE TABLE IF NOT EXISTS public.labeled (
 );
 """
 
+# Needed by --upsert; creating it fails if public.labeled already holds duplicates
+LABELED_UNIQUE_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS labeled_card_prompt_model_key
+    ON public.labeled (card_name, prompt_file, model);
+"""
+
+INSERT_LABELED_SQL = "INSERT INTO public.labeled (card_name, prompt_file, model, raw_json) VALUES %s"
+
+UPSERT_LABELED_SQL = INSERT_LABELED_SQL + """
+ON CONFLICT (card_name, prompt_file, model)
+DO UPDATE SET raw_json = EXCLUDED.raw_json, analyzed_at = NOW()
+"""
+
+CREATE_DEAD_LETTER_TABLE = """
+CREATE TABLE IF NOT EXISTS public.dead_letter (
+    id           SERIAL PRIMARY KEY,
+    source_table TEXT NOT NULL,
+    card_id      INTEGER NOT NULL,
+    card_name    TEXT NOT NULL,
+    prompt_file  TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    error        TEXT,
+    failures     INTEGER NOT NULL DEFAULT 1,
+    failed_at    TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    resolved_at  TIMESTAMPTZ
+);
+CREATE UNIQUE INDEX IF NOT EXISTS dead_letter_open_key
+    ON public.dead_letter (source_table, card_id, prompt_file, model) WHERE resolved_at IS NULL;
+"""
+
+CREATE_MESSAGE_BATCHES_TABLE = """
+CREATE TABLE IF NOT EXISTS public.message_batches (
+    batch_id     TEXT PRIMARY KEY,
+    prompt_file  TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    source_table TEXT NOT NULL,
+    card_batches JSONB NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'SUBMITTED',
+    submitted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    collected_at TIMESTAMPTZ
+);
+"""
+
 
 VALID_TABLES = ("cards_to_analyze", "cards_to_analyze2")
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Batch MTG card analyzer")
-    parser.add_argument("--prompt", required=True, help="Path to prompt template .md file")
+    parser.add_argument("--prompt", help="Path to prompt template .md file (required unless --collect)")
     parser.add_argument("--mechanics", help="Path to mechanics .md file (default: app DEFAULT_MECHANICS)")
     parser.add_argument("--batch-size", type=int, default=20, help="Cards per API call (default: 20)")
     parser.add_argument("--model", default=claude_utils.DEFAULT_MODEL, help="Claude model to use")
@@ -66,7 +151,79 @@ def parse_args():
         action="store_true",
         help="Include oracle_text from the source table in the card data sent to Claude",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--card-db",
+        action="store_true",
+        help="Add oracle text from the local Scryfall card database (card_db.py) to the card data",
+    )
+    parser.add_argument("--lease-minutes", type=float, default=30.0,
+                        help="With --claim: also claim cards leased longer ago than this (default: 30)")
+    parser.add_argument("--worker-id", default=None, help="With --claim: lease owner name (default: host:pid)")
+    parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Overwrite existing public.labeled rows for the same card/prompt/model instead of adding duplicates",
+    )
+    parser.add_argument(
+        "--cache-prompt",
+        action="store_true",
+        help="Send the prompt template as cached system blocks and the card list last (prompt caching)",
+    )
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of API calls in flight at once (default: 1)")
+    parser.add_argument("--rpm", type=float, default=None, help="Rate limit: API requests per minute (default: unlimited)")
+    parser.add_argument("--tpm", type=float, default=None, help="Rate limit: estimated input tokens per minute (default: unlimited)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--submit-batch",
+        action="store_true",
+        help="Submit all pending batches as one Message Batches API request and exit",
+    )
+    mode.add_argument(
+        "--collect",
+        action="store_true",
+        help="Wait for submitted Message Batches to end and save their results",
+    )
+    mode.add_argument(
+        "--resume",
+        action="store_true",
+        help="Retry only the cards in public.dead_letter for this prompt/model",
+    )
+    mode.add_argument(
+        "--claim",
+        action="store_true",
+        help="Lease batches from the queue with FOR UPDATE SKIP LOCKED so several workers can share it",
+    )
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Retries per batch for rate-limit/overload/server errors before dead-lettering (default: 5)")
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Size batches by token budget instead of --batch-size (see batch_packing.py)",
+    )
+    parser.add_argument("--input-budget", type=int, default=6000, help="With --pack: card-data input tokens per call (default: 6000)")
+    parser.add_argument("--output-budget", type=int, default=12000,
+                        help="With --pack: predicted output tokens per call, below max_tokens 16000 (default: 12000)")
+    parser.add_argument("--output-tokens-per-card", type=int, default=80,
+                        help="With --pack: predicted output tokens per card besides its name (default: 80)")
+    parser.add_argument("--max-cards", type=int, default=100, help="With --pack: cards per call cap (default: 100)")
+    parser.add_argument("--count-tokens", action="store_true",
+                        help="With --pack: calibrate token estimates with the token counting endpoint")
+    parser.add_argument("--no-bisect", dest="bisect", action="store_false",
+                        help="Don't re-submit cards missing from an unparseable or partial response in halves")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the queue through a server-side cursor, one batch at a time, instead of loading it all up front",
+    )
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Seconds between --collect status polls (default: 60)")
+    args = parser.parse_args()
+    if not args.collect and not args.prompt:
+        parser.error("--prompt is required unless --collect is given")
+    if args.pack and args.claim:
+        parser.error("--pack cannot be combined with --claim (claims use --batch-size)")
+    if args.stream and (args.submit_batch or args.collect or args.claim or args.resume):
+        parser.error("--stream cannot be combined with --submit-batch, --collect, --claim or --resume")
+    return args
 
 
 def load_text_file(path: str, label: str) -> str:
@@ -77,64 +234,663 @@ def load_text_file(path: str, label: str) -> str:
         sys.exit(1)
 
 
-def fetch_cards(conn, prompt_file: str, model: str, skip_existing: bool, table: str = "cards_to_analyze", with_oracle_text: bool = False) -> list[dict]:
-    extra_col = ", oracle_text" if with_oracle_text else ""
-    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        if skip_existing:
-            cur.execute(
-                f"""
-                SELECT c.id, c.card_name{extra_col}
-                FROM public.{table} c
-                WHERE c.status = 'NOT_STARTED'
-                  AND NOT EXISTS (
+# Cards (aliased c) without a public.labeled row for (prompt_file, model)
+NOT_LABELED_FILTER = """NOT EXISTS (
                     SELECT 1 FROM public.labeled l
                     WHERE l.card_name = c.card_name
                       AND l.prompt_file = %s
                       AND l.model = %s
-                  )
+                  )"""
+
+
+def _queue_query(select: str, table: str, prompt_file: str, model: str, skip_existing: bool):
+    """(sql, params) selecting NOT_STARTED cards (aliased c) from table, in id order."""
+    filter_sql = f"AND {NOT_LABELED_FILTER}" if skip_existing else ""
+    params = (prompt_file, model) if skip_existing else ()
+    return f"SELECT {select} FROM public.{table} c WHERE c.status = 'NOT_STARTED' {filter_sql}", params
+
+
+def fetch_cards(conn, prompt_file: str, model: str, skip_existing: bool, table: str = "cards_to_analyze", with_oracle_text: bool = False) -> list[dict]:
+    extra_col = ", c.oracle_text" if with_oracle_text else ""
+    sql, params = _queue_query(f"c.id, c.card_name{extra_col}", table, prompt_file, model, skip_existing)
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(sql + " ORDER BY c.id", params)
+        return cur.fetchall()
+
+
+def count_cards(conn, prompt_file: str, model: str, skip_existing: bool, table: str = "cards_to_analyze") -> int:
+    """Number of cards fetch_cards would return, without fetching them."""
+    sql, params = _queue_query("COUNT(*)", table, prompt_file, model, skip_existing)
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+
+
+def count_cards_in_background(progress: "Progress", prompt_file: str, model: str, skip_existing: bool,
+                              table: str = "cards_to_analyze") -> threading.Thread:
+    """Set progress.total_cards from count_cards, run on its own connection and thread.
+
+    The anti-join COUNT(*) can take as long as the whole query on a large table, so
+    --stream starts on the first batch straight away and shows the total once known.
+    """
+    def count():
+        try:
+            conn = connect()
+            try:
+                progress.total_cards = count_cards(conn, prompt_file, model, skip_existing, table)
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            print(f"Warning: could not count cards: {e}", file=sys.stderr)
+
+    thread = threading.Thread(target=count, name="count-cards", daemon=True)
+    thread.start()
+    return thread
+
+
+def iter_card_batches(read_conn, prompt_file: str, model: str, skip_existing: bool, batch_size: int,
+                      table: str = "cards_to_analyze", with_oracle_text: bool = False):
+    """Yield fetch_cards' rows in batches of batch_size from a named (server-side) cursor.
+
+    Only one batch at a time is held in memory, and the first batch is available as
+    soon as the query starts returning rows. read_conn must be a connection used for
+    nothing else: committing on it would close the cursor.
+    """
+    extra_col = ", c.oracle_text" if with_oracle_text else ""
+    sql, params = _queue_query(f"c.id, c.card_name{extra_col}", table, prompt_file, model, skip_existing)
+    with read_conn.cursor(name="analyze_batch_cards", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = batch_size
+        cur.execute(sql + " ORDER BY c.id", params)
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                return
+            yield batch
+
+
+# --- Work-queue claims (--claim) ---
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_cards(conn, table: str, batch_size: int, worker_id: str, prompt_file: str, model: str,
+                skip_existing: bool = False, with_oracle_text: bool = False,
+                lease_minutes: float = 30.0) -> list[dict]:
+    """Lease up to batch_size cards to worker_id and return them.
+
+    Claims NOT_STARTED cards and cards whose lease is older than lease_minutes (e.g.
+    from a crashed worker), so a stuck lease is picked up by whichever worker claims
+    next. FOR UPDATE SKIP LOCKED lets any number of workers claim from the same queue
+    at once without blocking on, or double-claiming, each other's rows. Claimed cards
+    are IN_PROGRESS until saved, failed, released, or their lease expires.
+    """
+    extra_col = ", c.oracle_text" if with_oracle_text else ""
+    filter_sql = f"AND {NOT_LABELED_FILTER}" if skip_existing else ""
+    params = (prompt_file, model) if skip_existing else ()
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            f"""
+            UPDATE public.{table} c
+            SET status = 'IN_PROGRESS', claimed_by = %s, claimed_at = NOW()
+            WHERE c.id IN (
+                SELECT c.id FROM public.{table} c
+                WHERE (
+                    c.status = 'NOT_STARTED'
+                    OR (c.status = 'IN_PROGRESS' AND c.claimed_at < NOW() - %s * INTERVAL '1 minute')
+                ) {filter_sql}
                 ORDER BY c.id
-                """,
-                (prompt_file, model),
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
             )
-        else:
-            cur.execute(
-                f"SELECT id, card_name{extra_col} FROM public.{table} WHERE status = 'NOT_STARTED' ORDER BY id"
-            )
-        return cur.fetchall()
+            RETURNING c.id, c.card_name{extra_col}
+            """,
+            (worker_id, lease_minutes, *params, batch_size),
+        )
+        rows = sorted(cur.fetchall(), key=lambda row: row["id"])
+    conn.commit()
+    return rows
+
+
+def release_cards(conn, table: str, card_ids: list, worker_id: str) -> int:
+    """Return this worker's still-claimed cards among card_ids to the queue."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE public.{table}
+            SET status = 'NOT_STARTED', claimed_by = NULL, claimed_at = NULL
+            WHERE id = ANY(%s) AND status = 'IN_PROGRESS' AND claimed_by = %s
+            """,
+            (card_ids, worker_id),
+        )
+        released = cur.rowcount
+    conn.commit()
+    return released
+
+
+def fail_cards(conn, table: str, card_ids: list, worker_id: str) -> int:
+    """Mark this worker's claimed cards among card_ids FAILED, so they are not claimed again."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE public.{table}
+            SET status = 'FAILED'
+            WHERE id = ANY(%s) AND status = 'IN_PROGRESS' AND claimed_by = %s
+            """,
+            (card_ids, worker_id),
+        )
+        failed = cur.rowcount
+    conn.commit()
+    return failed
+
+
+def iter_claimed_batches(conn, args, save_model: str, worker_id: str):
+    """Yield freshly claimed batches until the queue is empty."""
+    while True:
+        batch = claim_cards(conn, args.table, args.batch_size, worker_id, args.prompt, save_model,
+                            args.skip_existing, args.with_oracle_text, args.lease_minutes)
+        if not batch:
+            return
+        yield batch
 
 
-def format_card_data(batch: list[dict]) -> str:
+def run_claimed(conn, api_key: str, prompt_template: str, mechanics: str, args, save_model: str, worker_id: str,
+                total: int) -> int:
+    """run_batches over batches claimed by worker_id; returns the number of cards saved.
+
+    Cards that could not be labeled are dead-lettered and marked FAILED; anything
+    else still claimed after its batch (e.g. a result saved under another name) goes
+    back to the queue.
+    """
+    def dead_letter(cards, error):
+        record_dead_letters(conn, cards, error, args.table, args.prompt, save_model)
+        fail_cards(conn, args.table, [row["id"] for row in cards], worker_id)
+
+    return run_batches(
+        conn, api_key, iter_claimed_batches(conn, args, save_model, worker_id), prompt_template, mechanics,
+        args, save_model, total,
+        on_batch_done=lambda batch: release_cards(conn, args.table, [row["id"] for row in batch], worker_id),
+        on_batch_failed=dead_letter,
+    )
+
+
+# Set by --card-db: fills in oracle text for format_card_data
+ORACLE_DB = None
+
+
+def format_card_data(batch: list[dict], oracle_db=None) -> str:
+    """One line per card: "Card Name | Oracle Text" when oracle text is available, else the name.
+
+    oracle_db (default ORACLE_DB), a card_db.CardDB, supplies oracle text for rows without any.
+    """
+    oracle_db = oracle_db or ORACLE_DB
+    if oracle_db is not None:
+        lines = []
+        for row in batch:
+            oracle_text = row.get("oracle_text") or oracle_db.oracle_text(row["card_name"])
+            lines.append(f"{row['card_name']} | {oracle_text}" if oracle_text else row["card_name"])
+        return "\n".join(lines)
     if batch and batch[0].get("oracle_text"):
         return "\n".join(f"{row['card_name']} | {row['oracle_text']}" for row in batch)
     return "\n".join(row["card_name"] for row in batch)
 
 
-def save_results(conn, results: list, batch: list[dict], prompt_file: str, model: str, table: str = "cards_to_analyze"):
+def save_results(conn, results: list, batch: list[dict], prompt_file: str, model: str, table: str = "cards_to_analyze",
+                 upsert: bool = False):
+    """Write one batch's results in a single transaction.
+
+    All rows go into public.labeled in one multi-row INSERT and the analyzed cards are
+    marked COMPLETED with one UPDATE, so a batch costs two round trips regardless of
+    its size. With upsert, a card already labeled for this prompt_file/model is
+    overwritten instead of duplicated (requires LABELED_UNIQUE_INDEX). With table=None
+    the source table's status column is left alone (see run_matrix.py).
+    """
     batch_by_name = {row["card_name"].lower(): row["id"] for row in batch}
 
-    with conn.cursor() as cur:
-        for card_result in results:
-            card_name = card_result.get("card_name") or card_result.get("name")
-            if not card_name:
-                print(f"  Warning: skipping result with no card_name: {card_result}", file=sys.stderr)
-                continue
+    rows = {} if upsert else []
+    completed_ids = []
+    for card_result in results:
+        card_name = card_result.get("card_name") or card_result.get("name")
+        if not card_name:
+            print(f"  Warning: skipping result with no card_name: {card_result}", file=sys.stderr)
+            continue
+        row = (card_name, prompt_file, model, json.dumps(card_result))
+        if upsert:
+            # ON CONFLICT cannot touch the same row twice in one statement; keep the last result
+            rows[card_name] = row
+        else:
+            rows.append(row)
+        card_id = batch_by_name.get(card_name.lower())
+        if card_id is not None:
+            completed_ids.append(card_id)
 
+    with conn.cursor() as cur:
+        if rows:
+            psycopg2.extras.execute_values(
+                cur,
+                UPSERT_LABELED_SQL if upsert else INSERT_LABELED_SQL,
+                list(rows.values()) if upsert else rows,
+                page_size=max(len(rows), 1),
+            )
+        if completed_ids and table is not None:
             cur.execute(
-                """
-                INSERT INTO public.labeled (card_name, prompt_file, model, raw_json)
-                VALUES (%s, %s, %s, %s)
-                """,
-                (card_name, prompt_file, model, json.dumps(card_result)),
+                f"UPDATE public.{table} SET status = 'COMPLETED' WHERE id = ANY(%s)",
+                (completed_ids,),
             )
 
-            card_id = batch_by_name.get(card_name.lower())
-            if card_id is not None:
-                cur.execute(
-                    f"UPDATE public.{table} SET status = 'COMPLETED' WHERE id = %s",
-                    (card_id,),
-                )
+    conn.commit()
+
+
+# analyze_one_batch error kinds: the API call itself failed, or its response was unusable
+ERROR_API = "api"
+ERROR_PARSE = "parse"
+
+
+def analyze_one_batch(api_key: str, batch: list[dict], prompt_template: str, mechanics: str, model: str,
+                      temperature: float = None, limiter: RateLimiter = None, cache_prompt: bool = False,
+                      usage: dict = None, max_retries: int = 0):
+    """Call the API for one batch; runs on worker threads.
+
+    Returns (results, error_message, error_kind), where error_kind is ERROR_API or
+    ERROR_PARSE on failure and None on success.
+
+    Retryable API errors (rate limits, overload, 5xx, connection errors) are retried
+    up to max_retries times with jittered exponential backoff, honoring retry-after.
+    The SDK's own retries are off, so this loop is the only one.
+    usage, if given, is filled with the token counts of the last response.
+    """
+    card_data = format_card_data(batch)
+    prompt, system = claude_utils.build_request_prompt(prompt_template, card_data, mechanics, cache_prompt)
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            # With cache_prompt this counts only the card list: cached reads don't use input token quota
+            limiter.acquire(estimate_tokens(prompt))
+
+        result, error = claude_utils.call_claude(api_key, prompt, model, temperature, system=system, usage=usage,
+                                                 max_retries=0)
+        if error is None:
+            rows, parse_error = to_result_rows(result)
+            return rows, parse_error, ERROR_PARSE if parse_error else None
+
+        err_dict, status = error
+        if not err_dict.get("retryable") or attempt == max_retries:
+            break
+        time.sleep(backoff_delay(attempt, retry_after=err_dict.get("retry_after")))
+
+    attempts = f" after {attempt + 1} attempts" if attempt else ""
+    error = f"ERROR (HTTP {err_dict.get('upstream_status') or status}){attempts}: {err_dict.get('error')}"
+    return None, error, ERROR_API
+
+
+def _result_name(row: dict) -> str:
+    return card_db.normalize_name(row.get("card_name") or row.get("name") or "")
 
+
+def _use_requested_names(rows: list, batch: list[dict]):
+    """Rename rows to the batch's spelling of their card (matched with card_db.normalize_name),
+    so "Lim-Dul's Vault" for "Lim-Dûl's Vault" is saved, and counted, as that card."""
+    requested = {card_db.normalize_name(card["card_name"]): card["card_name"] for card in batch}
+    for row in rows:
+        card_name = requested.get(_result_name(row))
+        if card_name is not None:
+            row["card_name"] = card_name
+
+
+def analyze_bisecting(api_key: str, batch: list[dict], prompt_template: str, mechanics: str, model: str,
+                      temperature: float = None, limiter: RateLimiter = None, cache_prompt: bool = False,
+                      usage: dict = None, max_retries: int = 0, bisect: bool = True):
+    """analyze_one_batch, salvaging what it can from a bad response.
+
+    Returns (rows, failures): every result row worth saving, and a list of
+    (cards, error_message) for cards that could not be labeled. When the response is
+    unparseable or leaves cards out, the affected cards are re-submitted in halves
+    until each one either succeeds or fails alone (a poison card). API errors that
+    survived retries are not split: they fail the whole batch.
+    """
+    call_usage = {}
+    rows, error, error_kind = analyze_one_batch(api_key, batch, prompt_template, mechanics, model, temperature,
+                                                limiter, cache_prompt, call_usage, max_retries)
+    if usage is not None:
+        claude_utils.add_usage(usage, call_usage)
+    if error_kind == ERROR_API or (error is not None and not bisect):
+        return [], [(batch, error)]
+
+    rows = rows or []
+    _use_requested_names(rows, batch)
+    returned = {_result_name(row) for row in rows}
+    missing = [card for card in batch if card_db.normalize_name(card["card_name"]) not in returned]
+    if not missing:
+        return rows, []
+    if len(batch) == 1 or not bisect:
+        return rows, [(missing, error or "ERROR: card missing from response")]
+
+    # Re-submit only what's missing, in halves; a response that dropped a single
+    # card straight away is retried alone
+    halves = [missing] if len(missing) == 1 else [missing[: len(missing) // 2], missing[len(missing) // 2:]]
+    failures = []
+    for half in halves:
+        half_rows, half_failures = analyze_bisecting(api_key, half, prompt_template, mechanics, model, temperature,
+                                                     limiter, cache_prompt, usage, max_retries, bisect)
+        wanted = {card_db.normalize_name(card["card_name"]) for card in half}
+        rows.extend(row for row in half_rows if _result_name(row) in wanted)
+        failures.extend(half_failures)
+    return rows, failures
+
+
+def to_result_rows(result):
+    """Convert a parsed response into [{"card_name": ..., **tags}] rows. Returns (rows, error_message)."""
+    if isinstance(result, dict):
+        return [{"card_name": k, **v} for k, v in result.items()], None
+    if isinstance(result, list):
+        return result, None
+    return None, f"ERROR: expected JSON object or list, got {type(result).__name__}"
+
+
+class Progress:
+    """Throughput and ETA reporting for a batch run; total_cards may be None until known."""
+
+    def __init__(self, total_cards: int = None):
+        self.total_cards = total_cards
+        self.done_cards = 0
+        self.saved = 0
+        self.usage = {}
+        self.started = time.monotonic()
+
+    def update(self, batch_cards: int, saved: int, usage: dict = None):
+        self.done_cards += batch_cards
+        self.saved += saved
+        claude_utils.add_usage(self.usage, usage or {})
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done_cards / elapsed if elapsed > 0 else 0.0
+        total = self.total_cards
+        eta = "?"
+        if total is not None and rate > 0:
+            remaining = max(0, total - self.done_cards)
+            eta = f"{int(remaining / rate) // 60}m{int(remaining / rate) % 60:02d}s"
+        line = f"{self.saved}/{'?' if total is None else total} total saved, {rate:.2f} cards/s, ETA {eta}"
+        cache_read = self.usage.get("cache_read_input_tokens", 0)
+        cache_write = self.usage.get("cache_creation_input_tokens", 0)
+        if cache_read or cache_write:
+            line += f", prompt cache read {cache_read} / write {cache_write} tokens"
+        return line
+
+
+def run_batches(conn, api_key: str, batches, prompt_template: str, mechanics: str, args, save_model: str,
+                total: int, on_batch_done=None, limiter: RateLimiter = None, label: str = "",
+                on_batch_failed=None, progress: "Progress" = None) -> int:
+    """Analyze batches on a pool of `args.concurrency` workers.
+
+    batches may be a list or a lazy iterable (e.g. iter_claimed_batches); it is only
+    advanced on the calling thread. At most 2 × concurrency batches are in flight at
+    once. Workers only talk to the API; every database write happens here, on the
+    calling thread, so save_results keeps using a single connection.
+    on_batch_done(batch), if given, runs after each batch is saved or skipped;
+    on_batch_failed(cards, error_message) runs first for cards that could not be
+    labeled, even after args.retries retries and bisection (e.g. record_dead_letters).
+    limiter defaults to one built from args.rpm/args.tpm; pass a shared one to rate
+    limit several concurrent runs together. label prefixes every progress line.
+    Pass progress to read its totals (e.g. token usage) after the run.
+    """
+    batch_count = f"/{len(batches)}" if hasattr(batches, "__len__") else ""
+    if limiter is None:
+        limiter = RateLimiter(args.rpm, args.tpm)
+    progress = progress or Progress(total)
+    window = max(1, args.concurrency) * 2
+    pending_batches = iter(enumerate(batches, start=1))
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        def submit_next():
+            item = next(pending_batches, None)
+            if item is None:
+                return False
+            batch_num, batch = item
+            usage = {}
+            future = pool.submit(analyze_bisecting, api_key, batch, prompt_template, mechanics,
+                                 args.model, args.temperature, limiter, args.cache_prompt, usage, args.retries,
+                                 args.bisect)
+            in_flight[future] = (batch_num, batch, usage)
+            return True
+
+        while len(in_flight) < window and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_num, batch, usage = in_flight.pop(future)
+                result, failures = future.result()
+                prefix = f"{label}Batch {batch_num}{batch_count} ({len(batch)} cards)"
+                if result:
+                    save_results(conn, result, batch, args.prompt, save_model, args.table, args.upsert)
+                progress.update(len(batch), len(result), usage)
+                for failed_cards, error in failures:
+                    if on_batch_failed is not None:
+                        on_batch_failed(failed_cards, error)
+                    outcome = "dead-lettered" if on_batch_failed is not None else "skipped"
+                    names = ", ".join(card["card_name"] for card in failed_cards[:3])
+                    more = f" +{len(failed_cards) - 3} more" if len(failed_cards) > 3 else ""
+                    print(f"{prefix} {error} — {len(failed_cards)} cards {outcome} ({names}{more}).")
+                if not failures:
+                    print(f"{prefix} done. ({progress.summary()})")
+                elif result:
+                    print(f"{prefix} partially done. ({progress.summary()})")
+                else:
+                    print(f"{prefix} failed. ({progress.summary()})")
+                if on_batch_done is not None:
+                    on_batch_done(batch)
+                submit_next()
+
+    return progress.saved
+
+
+# --- Dead letters (--resume) ---
+
+
+def record_dead_letters(conn, batch: list[dict], error: str, table: str, prompt_file: str, model: str):
+    """Record every card of a batch that ran out of retries; repeat failures bump `failures`."""
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_values(
+            cur,
+            """
+            INSERT INTO public.dead_letter (source_table, card_id, card_name, prompt_file, model, error)
+            VALUES %s
+            ON CONFLICT (source_table, card_id, prompt_file, model) WHERE resolved_at IS NULL
+            DO UPDATE SET error = EXCLUDED.error, failures = dead_letter.failures + 1, failed_at = NOW()
+            """,
+            [(table, row["id"], row["card_name"], prompt_file, model, error) for row in batch],
+        )
+    conn.commit()
+
+
+def fetch_dead_letters(conn, table: str, prompt_file: str, model: str, with_oracle_text: bool = False) -> list[dict]:
+    """Unresolved dead-lettered cards for this prompt/model, in fetch_cards' row format."""
+    extra_col = ", c.oracle_text" if with_oracle_text else ""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            f"""
+            SELECT c.id, c.card_name{extra_col}
+            FROM public.{table} c
+            JOIN public.dead_letter d ON d.card_id = c.id
+            WHERE d.source_table = %s AND d.prompt_file = %s AND d.model = %s AND d.resolved_at IS NULL
+            ORDER BY c.id
+            """,
+            (table, prompt_file, model),
+        )
+        return cur.fetchall()
+
+
+def resolve_dead_letters(conn, table: str, prompt_file: str, model: str) -> int:
+    """Mark dead letters resolved once their card has a public.labeled row; returns the count."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.dead_letter d SET resolved_at = NOW()
+            WHERE d.resolved_at IS NULL AND d.source_table = %s AND d.prompt_file = %s AND d.model = %s
+              AND EXISTS (
+                SELECT 1 FROM public.labeled l
+                WHERE l.card_name = d.card_name AND l.prompt_file = d.prompt_file AND l.model = d.model
+              )
+            """,
+            (table, prompt_file, model),
+        )
+        resolved = cur.rowcount
+    conn.commit()
+    return resolved
+
+
+def make_packer(api_key: str, args, sample: list[dict]) -> BatchPacker:
+    """A BatchPacker from the --pack options, optionally calibrated on sample rows."""
+    chars_per_token = CHARS_PER_TOKEN
+    if args.count_tokens and sample:
+        chars_per_token = calibrate_chars_per_token(
+            claude_utils.get_client(api_key), args.model, format_card_data(sample),
+        )
+        print(f"Token counting: {chars_per_token:.2f} chars/token on {len(sample)} sample cards.")
+    return BatchPacker(
+        lambda card: format_card_data([card]),
+        input_budget=args.input_budget, output_budget=args.output_budget,
+        output_tokens_per_card=args.output_tokens_per_card, max_cards=args.max_cards,
+        chars_per_token=chars_per_token,
+    )
+
+
+def report_resolved(conn, args, save_model: str):
+    resolved = resolve_dead_letters(conn, args.table, args.prompt, save_model)
+    if resolved:
+        print(f"Resolved {resolved} dead-lettered cards.")
+
+
+# --- Message Batches API mode ---
+
+
+def build_batch_requests(batches: list, prompt_template: str, mechanics: str, model: str,
+                         temperature: float = None, cache_prompt: bool = False) -> list[dict]:
+    """One Message Batches request per card batch, with custom_id "batch-<n>"."""
+    requests = []
+    for batch_num, batch in enumerate(batches, start=1):
+        prompt, system = claude_utils.build_request_prompt(
+            prompt_template, format_card_data(batch), mechanics, cache_prompt,
+        )
+        params = {"model": model, "max_tokens": 16000, "messages": [{"role": "user", "content": prompt}]}
+        if system is not None:
+            params["system"] = system
+        if temperature is not None:
+            params["temperature"] = temperature
+        requests.append({"custom_id": f"batch-{batch_num}", "params": params})
+    return requests
+
+
+def iter_message_batch_results(client, batch_id: str, poll_interval: float = 60.0):
+    """Wait for a Message Batch to end, then yield (custom_id, rows, error_message) per request.
+
+    Results are streamed from the results endpoint, so memory use does not grow with
+    the size of the batch.
+    """
+    while True:
+        status = client.messages.batches.retrieve(batch_id)
+        if status.processing_status == "ended":
+            break
+        counts = status.request_counts
+        print(f"  {batch_id}: {status.processing_status} ({counts.processing} processing) — "
+              f"checking again in {poll_interval:.0f}s")
+        time.sleep(poll_interval)
+
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type != "succeeded":
+            yield entry.custom_id, None, f"ERROR: request {entry.result.type}"
+            continue
+        text_block = next((b for b in entry.result.message.content if b.type == "text"), None)
+        if text_block is None:
+            yield entry.custom_id, None, "ERROR: no text block in response"
+            continue
+        rows, error = to_result_rows(claude_utils.parse_claude_response(text_block.text))
+        yield entry.custom_id, rows, error
+
+
+def submit_message_batch(conn, client, batches: list, prompt_template: str, mechanics: str, args,
+                         save_model: str) -> str:
+    """Submit every batch in one Message Batches request and record it in public.message_batches."""
+    requests = build_batch_requests(batches, prompt_template, mechanics, args.model, args.temperature,
+                                    args.cache_prompt)
+    message_batch = client.messages.batches.create(requests=requests)
+    card_batches = {
+        request["custom_id"]: [{"id": row["id"], "card_name": row["card_name"]} for row in batch]
+        for request, batch in zip(requests, batches)
+    }
+    card_ids = [row["id"] for batch in batches for row in batch]
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.message_batches (batch_id, prompt_file, model, source_table, card_batches)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (message_batch.id, args.prompt, save_model, args.table, json.dumps(card_batches)),
+        )
+        cur.execute(
+            f"UPDATE public.{args.table} SET status = 'SUBMITTED' WHERE id = ANY(%s)",
+            (card_ids,),
+        )
     conn.commit()
+    return message_batch.id
+
+
+def collect_message_batches(conn, client, poll_interval: float, upsert: bool = False) -> int:
+    """Save results for every SUBMITTED Message Batch; returns the number of cards written.
+
+    Cards that did not come back (errored requests, unparseable output) are returned
+    to NOT_STARTED so the next run picks them up again.
+    """
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            "SELECT * FROM public.message_batches WHERE status = 'SUBMITTED' ORDER BY submitted_at"
+        )
+        submissions = cur.fetchall()
+
+    if not submissions:
+        print("No submitted batches to collect.")
+        return 0
+
+    processed = 0
+    for submission in submissions:
+        batch_id, table = submission["batch_id"], submission["source_table"]
+        if table not in VALID_TABLES:
+            print(f"Skipping {batch_id}: unknown source table {table!r}.", file=sys.stderr)
+            continue
+        card_batches = submission["card_batches"]
+        print(f"Collecting {batch_id} ({len(card_batches)} requests, "
+              f"{submission['prompt_file']} | {submission['model']})...")
+
+        for custom_id, rows, error in iter_message_batch_results(client, batch_id, poll_interval):
+            batch = card_batches.get(custom_id)
+            if batch is None:
+                print(f"  {custom_id}: unknown custom_id — ignoring.", file=sys.stderr)
+                continue
+            if error is not None:
+                print(f"  {custom_id} ({len(batch)} cards): {error} — cards returned to queue.")
+                continue
+            save_results(conn, rows, batch, submission["prompt_file"], submission["model"], table, upsert)
+            processed += len(rows)
+
+        card_ids = [row["id"] for batch in card_batches.values() for row in batch]
+        with conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE public.{table} SET status = 'NOT_STARTED' WHERE status = 'SUBMITTED' AND id = ANY(%s)",
+                (card_ids,),
+            )
+            cur.execute(
+                "UPDATE public.message_batches SET status = 'COLLECTED', collected_at = NOW() WHERE batch_id = %s",
+                (batch_id,),
+            )
+        conn.commit()
+        print(f"  {batch_id} collected. ({processed} cards written so far)")
+
+    return processed
 
 
 def main():
@@ -145,27 +901,99 @@ def main():
         print("Error: ANTHROPIC_API_KEY environment variable not set.", file=sys.stderr)
         sys.exit(1)
 
-    prompt_template = load_text_file(args.prompt, "prompt")
-    mechanics = load_text_file(args.mechanics, "mechanics") if args.mechanics else DEFAULT_MECHANICS
-
     try:
-        conn = psycopg2.connect(
-            host=os.environ.get("DB_HOST", "localhost"),
-            port=os.environ.get("DB_PORT", 5432),
-            user=os.environ.get("DB_USER"),
-            password=os.environ.get("DB_PASSWORD"),
-            dbname="mtgcards",
-        )
+        conn = connect()
     except psycopg2.OperationalError as e:
         print(f"Error connecting to database: {e}", file=sys.stderr)
         sys.exit(1)
 
     with conn.cursor() as cur:
         cur.execute(CREATE_LABELED_TABLE)
+        cur.execute(CREATE_MESSAGE_BATCHES_TABLE)
+        cur.execute(CREATE_DEAD_LETTER_TABLE)
     conn.commit()
 
+    if args.upsert:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(LABELED_UNIQUE_INDEX)
+            conn.commit()
+        except psycopg2.IntegrityError:
+            print("Error: public.labeled has duplicate (card_name, prompt_file, model) rows; "
+                  "remove them before using --upsert.", file=sys.stderr)
+            sys.exit(1)
+
+    if args.collect:
+        client = claude_utils.get_client(api_key)
+        processed = collect_message_batches(conn, client, args.poll_interval, args.upsert)
+        conn.close()
+        print(f"\nFinished. {processed} cards written to public.labeled.")
+        return
+
+    prompt_template = load_text_file(args.prompt, "prompt")
+    mechanics = load_text_file(args.mechanics, "mechanics") if args.mechanics else DEFAULT_MECHANICS
+
+    if args.card_db:
+        global ORACLE_DB
+        ORACLE_DB = card_db.make_card_db_from_env()
+        if ORACLE_DB is None:
+            print("Error: --card-db needs SCRYFALL_BULK_PATH or a built CARD_DB_PATH index.", file=sys.stderr)
+            sys.exit(1)
+        ORACLE_DB.ensure_loaded()
+
     save_model = args.save_model if args.save_model else args.model
-    cards = fetch_cards(conn, args.prompt, save_model, args.skip_existing, args.table, args.with_oracle_text)
+    temp_str = f", temperature={args.temperature}" if args.temperature is not None else ""
+
+    def dead_letter(batch, error):
+        record_dead_letters(conn, batch, error, args.table, args.prompt, save_model)
+
+    progress = None
+    packer = None
+
+    if args.claim:
+        migrate(conn, [args.table])
+        worker_id = args.worker_id or default_worker_id()
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM public.{args.table} WHERE status = 'NOT_STARTED'")
+            queued = cur.fetchone()[0]
+        print(f"Model: {args.model}{temp_str} -> saving as '{save_model}'")
+        print(f"Worker {worker_id} claiming batches of {args.batch_size} from {queued} queued cards "
+              f"(concurrency {args.concurrency}).")
+        processed = run_claimed(conn, api_key, prompt_template, mechanics, args, save_model, worker_id, queued)
+        report_resolved(conn, args, save_model)
+        conn.close()
+        print(f"\nFinished. {processed} cards written to public.labeled by {worker_id}.")
+        return
+
+    if args.stream:
+        print(f"Model: {args.model}{temp_str} -> saving as '{save_model}'")
+        print(f"Streaming cards in batches of up to {args.batch_size} (concurrency {args.concurrency}).")
+        progress = Progress()
+        count_cards_in_background(progress, args.prompt, save_model, args.skip_existing, args.table)
+        read_conn = connect()
+        batches = iter_card_batches(read_conn, args.prompt, save_model, args.skip_existing, args.batch_size,
+                                    args.table, args.with_oracle_text)
+        if args.pack:
+            sample = next(batches, [])
+            packer = make_packer(api_key, args, sample)
+            batches = packer.pack(itertools.chain(sample, (row for batch in batches for row in batch)))
+        processed = run_batches(conn, api_key, batches, prompt_template, mechanics, args, save_model, None,
+                                on_batch_failed=dead_letter, progress=progress)
+        read_conn.close()
+        report_resolved(conn, args, save_model)
+        if packer is not None:
+            print(packer.summary(progress.usage.get("output_tokens")))
+        conn.close()
+        if progress.done_cards == 0:
+            print("No cards to analyze.")
+        else:
+            print(f"\nFinished. {processed}/{progress.done_cards} cards written to public.labeled.")
+        return
+
+    if args.resume:
+        cards = fetch_dead_letters(conn, args.table, args.prompt, save_model, args.with_oracle_text)
+    else:
+        cards = fetch_cards(conn, args.prompt, save_model, args.skip_existing, args.table, args.with_oracle_text)
     total = len(cards)
 
     if total == 0:
@@ -173,35 +1001,32 @@ def main():
         conn.close()
         return
 
-    batches = [cards[i : i + args.batch_size] for i in range(0, total, args.batch_size)]
-    temp_str = f", temperature={args.temperature}" if args.temperature is not None else ""
+    if args.pack:
+        packer = make_packer(api_key, args, cards[:200])
+        batches = list(packer.pack(cards))
+        print(packer.summary())
+    else:
+        batches = [cards[i : i + args.batch_size] for i in range(0, total, args.batch_size)]
     print(f"Model: {args.model}{temp_str} -> saving as '{save_model}'")
-    print(f"Analyzing {total} cards in {len(batches)} batches of up to {args.batch_size}.")
-
-    processed = 0
-    for batch_num, batch in enumerate(batches, start=1):
-        print(f"Batch {batch_num}/{len(batches)} ({len(batch)} cards)...", end=" ", flush=True)
-
-        card_data = format_card_data(batch)
-        prompt = claude_utils.build_prompt(prompt_template, card_data, mechanics)
 
-        result, error = claude_utils.call_claude(api_key, prompt, args.model, args.temperature)
-
-        if error is not None:
-            err_dict, status = error
-            print(f"ERROR (HTTP {status}): {err_dict.get('error')} — skipping batch.")
-            continue
+    if args.submit_batch:
+        client = claude_utils.get_client(api_key)
+        batch_id = submit_message_batch(conn, client, batches, prompt_template, mechanics, args, save_model)
+        conn.close()
+        print(f"Submitted {total} cards in {len(batches)} requests as Message Batch {batch_id}.")
+        print("Run with --collect to save the results once it has ended.")
+        return
 
-        if isinstance(result, dict):
-            result = [{"card_name": k, **v} for k, v in result.items()]
-        elif not isinstance(result, list):
-            print(f"ERROR: expected JSON object or list, got {type(result).__name__} — skipping batch.")
-            continue
+    batch_desc = "token-packed batches" if args.pack else f"batches of up to {args.batch_size}"
+    print(f"Analyzing {total} cards in {len(batches)} {batch_desc} (concurrency {args.concurrency}).")
 
-        save_results(conn, result, batch, args.prompt, save_model, args.table)
-        processed += len(result)
-        print(f"done. ({processed}/{total} total saved)")
+    progress = Progress(total)
+    processed = run_batches(conn, api_key, batches, prompt_template, mechanics, args, save_model, total,
+                            on_batch_failed=dead_letter, progress=progress)
 
+    report_resolved(conn, args, save_model)
+    if packer is not None:
+        print(packer.summary(progress.usage.get("output_tokens")))
     conn.close()
     print(f"\nFinished. {processed}/{total} cards written to public.labeled.")
 
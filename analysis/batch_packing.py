@@ -0,0 +1,85 @@
+"""Token-budget batch packing for analyze_batch.py --pack.
+
+Instead of a fixed number of cards per call, cards are added to a batch until the
+next one would push the batch's card data past the input budget or its predicted
+output past the output budget (kept under the 16000 max_tokens limit), so batches
+of vanilla creatures get large while batches of planeswalker walls of oracle text
+stay small enough not to truncate.
+
+Input tokens come from a chars-per-token ratio: ~4 by default, or calibrated once
+per run from the token counting endpoint (calibrate_chars_per_token).
+"""
+
+CHARS_PER_TOKEN = 4.0
+
+
+def calibrate_chars_per_token(client, model: str, sample_text: str) -> float:
+    """Measure chars/token on sample_text with the count_tokens endpoint.
+
+    An empty message is counted too, so the per-request overhead isn't attributed
+    to the sample.
+    """
+    def count(text):
+        return client.messages.count_tokens(model=model, messages=[{"role": "user", "content": text}]).input_tokens
+
+    tokens = count(sample_text) - count(".")
+    return len(sample_text) / tokens if tokens > 0 else CHARS_PER_TOKEN
+
+
+class BatchPacker:
+    """Greedy packer of card rows into batches under input and output token budgets."""
+
+    def __init__(self, format_card, input_budget: int = 6000, output_budget: int = 12000,
+                 output_tokens_per_card: int = 80, max_cards: int = 100, chars_per_token: float = CHARS_PER_TOKEN):
+        self.format_card = format_card
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+        self.output_tokens_per_card = output_tokens_per_card
+        self.max_cards = max_cards
+        self.chars_per_token = chars_per_token
+        self.batches = 0
+        self.cards = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def input_tokens_for(self, card: dict) -> int:
+        # +1 for the newline joining it to the previous card
+        return int(len(self.format_card(card)) / self.chars_per_token) + 1
+
+    def output_tokens_for(self, card: dict) -> int:
+        # The card name is echoed back as the JSON key, plus the tags themselves
+        return int(len(card["card_name"]) / self.chars_per_token) + self.output_tokens_per_card
+
+    def pack(self, cards):
+        """Yield batches (lists of card rows) from any iterable of rows, lazily."""
+        batch, batch_in, batch_out = [], 0, 0
+        for card in cards:
+            card_in, card_out = self.input_tokens_for(card), self.output_tokens_for(card)
+            over_budget = batch_in + card_in > self.input_budget or batch_out + card_out > self.output_budget
+            if batch and (over_budget or len(batch) >= self.max_cards):
+                yield self._emit(batch, batch_in, batch_out)
+                batch, batch_in, batch_out = [], 0, 0
+            batch.append(card)
+            batch_in += card_in
+            batch_out += card_out
+        if batch:
+            yield self._emit(batch, batch_in, batch_out)
+
+    def _emit(self, batch, batch_in, batch_out):
+        self.batches += 1
+        self.cards += len(batch)
+        self.input_tokens += batch_in
+        self.output_tokens += batch_out
+        return batch
+
+    def summary(self, actual_output_tokens: int = None) -> str:
+        """Packing efficiency: average batch size and how full the budgets were."""
+        if not self.batches:
+            return "Packing: no batches."
+        line = (f"Packing: {self.cards} cards in {self.batches} batches ({self.cards / self.batches:.1f} cards/batch), "
+                f"input budget {self.input_tokens / (self.batches * self.input_budget):.0%} used, "
+                f"predicted output budget {self.output_tokens / (self.batches * self.output_budget):.0%} used")
+        if actual_output_tokens:
+            line += (f", actual output {actual_output_tokens / (self.batches * self.output_budget):.0%} "
+                     f"({actual_output_tokens / self.cards:.0f} tokens/card)")
+        return line
@@ -0,0 +1,77 @@
+"""Schema migrations for the batch-analysis tables.
+
+Adds the indexes behind fetch_cards' skip-existing anti-join and the queue scans,
+and the claimed_by/claimed_at lease columns used by analyze_batch.py --claim. Every
+statement is idempotent, so the script is safe to re-run; analyze_batch.py --claim
+runs it on startup.
+
+Usage:
+    uv run python analysis/migrations.py
+    uv run python analysis/migrations.py --table cards_to_analyze2
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db import connect
+
+VALID_TABLES = ("cards_to_analyze", "cards_to_analyze2")
+
+LABELED_MIGRATION = """
+CREATE INDEX IF NOT EXISTS labeled_card_prompt_model_idx
+    ON public.labeled (card_name, prompt_file, model);
+"""
+
+# Formatted with a table name from VALID_TABLES
+QUEUE_MIGRATION = """
+ALTER TABLE public.{table}
+    ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+    ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS {table}_status_id_idx ON public.{table} (status, id);
+CREATE INDEX IF NOT EXISTS {table}_card_name_idx ON public.{table} (card_name);
+CREATE INDEX IF NOT EXISTS {table}_lease_idx ON public.{table} (claimed_at) WHERE status = 'IN_PROGRESS';
+"""
+
+
+def table_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s)", (f"public.{table}",))
+    return cur.fetchone()[0] is not None
+
+
+def migrate(conn, tables=VALID_TABLES) -> list[str]:
+    """Apply every migration to the tables that exist; returns the tables migrated."""
+    migrated = []
+    with conn.cursor() as cur:
+        if table_exists(cur, "labeled"):
+            cur.execute(LABELED_MIGRATION)
+            migrated.append("labeled")
+        for table in tables:
+            if table not in VALID_TABLES:
+                raise ValueError(f"Unknown queue table: {table!r}")
+            if table_exists(cur, table):
+                cur.execute(QUEUE_MIGRATION.format(table=table))
+                migrated.append(table)
+    conn.commit()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations for the analysis tables")
+    parser.add_argument("--table", action="append", choices=VALID_TABLES,
+                        help="Queue table to migrate (repeatable; default: all)")
+    args = parser.parse_args()
+
+    conn = connect()
+    migrated = migrate(conn, args.table or VALID_TABLES)
+    conn.close()
+    print(f"Migrated: {', '.join(migrated) or 'nothing (no tables found)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Token-bucket rate limiting and retry backoff for the batch analysis scripts.
+
+A RateLimiter combines a requests/minute bucket and an (estimated) input
+tokens/minute bucket; every API call acquires one request and its token estimate
+before going out. It is thread-safe, so one limiter can be shared by a worker pool.
+"""
+
+import random
+import threading
+import time
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for rate limiting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to `capacity`, refills at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens if available; otherwise return the seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount: float = 1.0):
+        """Block until `amount` tokens have been taken from the bucket."""
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Requests/minute and tokens/minute limits; either may be None (unlimited)."""
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens: int = 0):
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            self.tokens.acquire(tokens)
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 120.0, retry_after: float = None) -> float:
+    """Seconds to wait before retry number `attempt` (0-based).
+
+    Exponential backoff with full jitter, but never sooner than the server's
+    retry-after when it sent one.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
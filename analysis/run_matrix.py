@@ -0,0 +1,230 @@
+"""Run every prompt/model combo in a matrix file, concurrently, in one process.
+
+Replaces run_all_combos.sh. Instead of resetting the shared status column before
+each combo, a card counts as done for a combo when public.labeled has a row for
+(card_name, prompt_file, model) — so combos don't interfere with each other, can run
+side by side, and a crashed run resumes where it stopped when started again.
+
+All combos share one requests/tokens-per-minute limit. After the run, accuracy
+reports are re-rendered only for combos whose labeled rows changed since the last
+render (tracked in --state), and the meta report only if any of them did.
+
+Matrix file format (see combos.txt): one combo per line, '#' starts a comment.
+    <prompt file> <model> [--with-oracle-text] [--temperature T] [--save-model NAME]
+                          [--mechanics FILE] [--batch-size N]
+
+Usage:
+    uv run python analysis/run_matrix.py analysis/combos.txt --parallel 4 --rpm 50 --tpm 80000
+    uv run python analysis/run_matrix.py analysis/combos.txt --dry-run
+    uv run python analysis/run_matrix.py analysis/combos.txt --reports-only
+"""
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import psycopg2.extras
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import analyze_batch
+from app import DEFAULT_MECHANICS
+from db import connect
+from rate_limit import RateLimiter
+
+DEFAULT_STATE_FILE = Path(__file__).parent / ".run_matrix_state.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a prompt/model combo matrix")
+    parser.add_argument("matrix", help="Combo matrix file (see analysis/combos.txt)")
+    parser.add_argument("--table", default="cards_to_analyze2", choices=analyze_batch.VALID_TABLES,
+                        help="Source table to read cards from (default: cards_to_analyze2)")
+    parser.add_argument("--parallel", type=int, default=3, help="Combos run at once (default: 3)")
+    parser.add_argument("--concurrency", type=int, default=2, help="API calls in flight per combo (default: 2)")
+    parser.add_argument("--rpm", type=float, default=None, help="Global rate limit: requests per minute")
+    parser.add_argument("--tpm", type=float, default=None, help="Global rate limit: estimated input tokens per minute")
+    parser.add_argument("--retries", type=int, default=5, help="Retries per batch for retryable API errors (default: 5)")
+    parser.add_argument("--cache-prompt", action="store_true", help="Use the prompt-caching layout (see analyze_batch.py)")
+    parser.add_argument("--state", default=str(DEFAULT_STATE_FILE), help="Report state file")
+    parser.add_argument("--dry-run", action="store_true", help="Only print how many cards each combo still needs")
+    parser.add_argument("--reports-only", action="store_true", help="Skip analysis; render reports for changed combos")
+    parser.add_argument("--no-reports", action="store_true", help="Skip report rendering")
+    return parser.parse_args()
+
+
+# --- Matrix file ---
+
+
+def parse_matrix(text: str) -> list[Namespace]:
+    """Parse combo lines into Namespaces with prompt, model and the per-combo options."""
+    line_parser = argparse.ArgumentParser(prog="combo", add_help=False, exit_on_error=False)
+    line_parser.add_argument("prompt")
+    line_parser.add_argument("model")
+    line_parser.add_argument("--with-oracle-text", action="store_true")
+    line_parser.add_argument("--temperature", type=float, default=None)
+    line_parser.add_argument("--save-model", default=None)
+    line_parser.add_argument("--mechanics", default=None)
+    line_parser.add_argument("--batch-size", type=int, default=20)
+
+    combos = []
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            combo = line_parser.parse_args(shlex.split(line))
+        except (argparse.ArgumentError, SystemExit) as e:
+            raise ValueError(f"line {lineno}: cannot parse combo {line!r}") from e
+        combo.save_model = combo.save_model or combo.model
+        combos.append(combo)
+    return combos
+
+
+def combo_key(combo: Namespace) -> str:
+    return f"{combo.prompt} | {combo.save_model}"
+
+
+# --- Completion tracking ---
+
+
+def missing_cards(conn, table: str, combo: Namespace) -> list[dict]:
+    """Cards in table without a public.labeled row for this combo's prompt/model."""
+    extra_col = ", c.oracle_text" if combo.with_oracle_text else ""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(
+            f"SELECT c.id, c.card_name{extra_col} FROM public.{table} c "
+            f"WHERE {analyze_batch.NOT_LABELED_FILTER} ORDER BY c.id",
+            (combo.prompt, combo.save_model),
+        )
+        return cur.fetchall()
+
+
+def labeled_fingerprint(conn, combo: Namespace) -> list:
+    """(row count, latest analyzed_at) of a combo's labeled rows; changes whenever rows are added."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*), MAX(analyzed_at) FROM public.labeled WHERE prompt_file = %s AND model = %s",
+            (combo.prompt, combo.save_model),
+        )
+        count, latest = cur.fetchone()
+    return [count, latest.isoformat() if latest else None]
+
+
+def load_state(path: str) -> dict:
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path: str, state: dict):
+    tmp = Path(path).with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+# --- Running ---
+
+
+def run_combo(api_key: str, combo: Namespace, args, limiter: RateLimiter) -> int:
+    """Analyze every card this combo is missing; returns the number of cards saved."""
+    label = f"[{combo_key(combo)}] "
+    conn = connect()
+    try:
+        cards = missing_cards(conn, args.table, combo)
+        if not cards:
+            print(f"{label}complete.")
+            return 0
+        template = analyze_batch.load_text_file(combo.prompt, "prompt")
+        mechanics = analyze_batch.load_text_file(combo.mechanics, "mechanics") if combo.mechanics else DEFAULT_MECHANICS
+        batches = [cards[i:i + combo.batch_size] for i in range(0, len(cards), combo.batch_size)]
+        print(f"{label}{len(cards)} cards to analyze in {len(batches)} batches.")
+        run_args = Namespace(
+            prompt=combo.prompt, model=combo.model, temperature=combo.temperature,
+            concurrency=args.concurrency, cache_prompt=args.cache_prompt, upsert=False, retries=args.retries, bisect=True,
+            # No source table: completion is tracked in public.labeled, not the status column
+            table=None,
+        )
+        return analyze_batch.run_batches(conn, api_key, batches, template, mechanics, run_args, combo.save_model,
+                                         len(cards), limiter=limiter, label=label)
+    finally:
+        conn.close()
+
+
+def render_changed_reports(combos: list[Namespace], state_path: str) -> int:
+    """Render accuracy reports for combos whose labeled rows changed, then the meta report."""
+    state = load_state(state_path)
+    conn = connect()
+    try:
+        changed = [(combo, labeled_fingerprint(conn, combo)) for combo in combos]
+    finally:
+        conn.close()
+    changed = [(combo, fp) for combo, fp in changed if fp[0] and state.get(combo_key(combo)) != fp]
+
+    for combo, fingerprint in changed:
+        print(f"Rendering accuracy report: {combo_key(combo)}")
+        subprocess.run(["Rscript", "analysis/render_accuracy_report.R", combo.prompt, combo.save_model], check=True)
+        state[combo_key(combo)] = fingerprint
+        save_state(state_path, state)
+
+    if changed:
+        print("Rendering meta report")
+        subprocess.run(["Rscript", "analysis/render_meta_report.R"], check=True)
+    else:
+        print("No combos changed since the last render; reports are up to date.")
+    return len(changed)
+
+
+def main():
+    args = parse_args()
+    os.chdir(Path(__file__).parent.parent)
+    combos = parse_matrix(Path(args.matrix).read_text(encoding="utf-8"))
+    for combo in combos:
+        for path in filter(None, (combo.prompt, combo.mechanics)):
+            if not Path(path).is_file():
+                print(f"Error: file not found for combo {combo_key(combo)}: {path}", file=sys.stderr)
+                sys.exit(1)
+
+    if args.dry_run:
+        conn = connect()
+        for combo in combos:
+            print(f"{combo_key(combo)}: {len(missing_cards(conn, args.table, combo))} cards missing")
+        conn.close()
+        return
+
+    if not args.reports_only:
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            print("Error: ANTHROPIC_API_KEY environment variable not set.", file=sys.stderr)
+            sys.exit(1)
+        limiter = RateLimiter(args.rpm, args.tpm)
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+            futures = {pool.submit(run_combo, api_key, combo, args, limiter): combo for combo in combos}
+            for future in as_completed(futures):
+                combo = futures[future]
+                try:
+                    saved = future.result()
+                    print(f"[{combo_key(combo)}] finished, {saved} cards saved.")
+                except Exception as e:
+                    failed.append(combo)
+                    print(f"[{combo_key(combo)}] failed: {e}", file=sys.stderr)
+        if failed:
+            print(f"{len(failed)} combos failed; re-run to resume them.", file=sys.stderr)
+
+    if not args.no_reports:
+        render_changed_reports(combos, args.state)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
+import json
 import os
-import re
 import secrets
+import threading
+import time
 
+import anthropic
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 
-from claude_utils import DEFAULT_MODEL, build_prompt, call_claude
+import card_db
+import jobs
+import result_store
+import sharding
+import single_flight
+from claude_utils import (
+    DEFAULT_MODEL,
+    CardStreamParser,
+    add_usage,
+    api_error_response,
+    build_request_prompt,
+    call_claude,
+    parse_claude_response,
+    stream_claude,
+)
+from decklist import normalize_card_name, parse_card_line, parse_decklist
 from oauth_routes import oauth_bp
+from prompt_registry import PromptRegistry
+from result_cache import content_hash, make_cache_from_env
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,9 +45,37 @@ app.register_blueprint(oauth_bp)
 
 PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "prompts")
 
-prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "prompt12.md")
-with open(prompt_path) as f:
-    PROMPT_TEMPLATE = f.read()
+DEFAULT_PROMPT_FILE = "prompt12"
+# Default when ORACLE_TEXT supplies the oracle text: prompt12 reading it instead of recalling it
+DEFAULT_ORACLE_PROMPT_FILE = "prompt14"
+
+# Prompt templates, loaded once and reloaded when the file changes (see prompt_registry.py)
+PROMPTS = PromptRegistry()
+
+# Cache-friendly prompt layout (static instructions in cached system blocks, card list last)
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Per-card result cache (see result_cache.py); None when RESULT_CACHE_BACKEND=off
+RESULT_CACHE = make_cache_from_env()
+
+# Card art index built from a Scryfall bulk export (see card_db.py); None when not configured
+CARD_DB = card_db.make_card_db_from_env()
+ART_MAX_NAMES = 200
+
+# Add each card's oracle text from CARD_DB to the card list sent to the model
+ORACLE_TEXT = CARD_DB is not None and os.environ.get("ORACLE_TEXT", "").strip().lower() in ("1", "true", "yes", "on")
+
+# Background analyses for "async": true requests (see jobs.py)
+JOBS = jobs.make_job_queue_from_env()
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "") or 0.5)
+
+# Finished analyses, saved under a content-addressed id and served from /r/<id>
+# (see result_store.py); None when RESULT_STORE_BACKEND=off
+RESULT_STORE = result_store.make_result_store_from_env()
+
+# Identical concurrent model calls share one upstream request (see single_flight.py);
+# None when SINGLE_FLIGHT=off
+SINGLE_FLIGHT = single_flight.make_single_flight_from_env()
 
 # Default mechanics definitions (from analysis/mechanics.md)
 DEFAULT_MECHANICS = """- ramp: Increases your mana production above the curve by adding new mana sources or mana itself (Birds of Paradise, Cultivate, Sol Ring, Dockside Extortionist). Includes treasures, rituals, and other effects which increase the amount of mana you have available.  Does not include mana fixing or untapping effects.
@@ -56,23 +104,59 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/api/prompts", methods=["GET"])
+def list_prompts():
+    """List the prompt templates available as prompt_file values."""
+    return jsonify({
+        "prompts": [prompt.to_dict() for prompt in PROMPTS.list(PROMPTS_DIR)],
+        "default": DEFAULT_PROMPT_FILE,
+    })
+
+
+@app.route("/api/art", methods=["GET"])
+def get_art():
+    """Art crop URLs for many cards in one request: /api/art?names=Sol Ring|Cultivate.
+
+    Returns {"art": {name: url or null}}. Responses carry an ETag and may be cached
+    for a day; the art for a name only changes when the bulk file is replaced.
+    """
+    if CARD_DB is None:
+        return jsonify({"error": "Card art index is not configured."}), 503
+    names = list(dict.fromkeys(name.strip() for name in request.args.get("names", "").split("|") if name.strip()))
+    if not names:
+        return jsonify({"error": "names is required."}), 400
+    if len(names) > ART_MAX_NAMES:
+        return jsonify({"error": f"At most {ART_MAX_NAMES} names per request."}), 400
+
+    response = jsonify({"art": CARD_DB.art_urls(names)})
+    response.set_etag(content_hash(CARD_DB.version + "\x1f" + "|".join(names)))
+    response.cache_control.public = True
+    response.cache_control.max_age = 24 * 3600
+    return response.make_conditional(request)
+
+
 @app.route("/api/default-mechanics", methods=["GET"])
 def get_default_mechanics():
     """Return default mechanics for UI initialization."""
     return jsonify({"mechanics": DEFAULT_MECHANICS})
 
 
-@app.route("/analyze", methods=["POST"])
-def analyze():
-    data = request.get_json(silent=True)
+def _analysis_params(data):
+    """Validate an /analyze request body.
+
+    Returns (params, None) on success or (None, (response, status)) on failure.
+    """
     if not data:
-        return jsonify({"error": "Request body must be JSON."}), 400
+        return None, (jsonify({"error": "Request body must be JSON."}), 400)
 
     card_data = data.get("card_data", "").strip()
     if not card_data:
-        return jsonify({"error": "Card data is required"}), 400
+        return None, (jsonify({"error": "Card data is required"}), 400)
     if len(card_data) > 50_000:
-        return jsonify({"error": "Card data too large (max 50,000 characters)."}), 400
+        return None, (jsonify({"error": "Card data too large (max 50,000 characters)."}), 400)
+    card_data = "\n".join(parse_decklist(card_data, CARD_DB.canonical_name if CARD_DB is not None else None))
+    if not card_data:
+        return None, (jsonify({"error": "No cards to analyze (basic lands and utility lands are skipped)."}), 400)
 
     mechanics = data.get("mechanics", "").strip() or DEFAULT_MECHANICS
 
@@ -80,9 +164,9 @@ def analyze():
     if access_password:
         access_code = data.get("access_code", "").strip()
         if not access_code:
-            return jsonify({"error": "Access code required.", "error_type": "access_code_required"}), 403
+            return None, (jsonify({"error": "Access code required.", "error_type": "access_code_required"}), 403)
         if not secrets.compare_digest(access_code, access_password):
-            return jsonify({"error": "Access denied: incorrect access code.", "error_type": "access_code_invalid"}), 403
+            return None, (jsonify({"error": "Access denied: incorrect access code.", "error_type": "access_code_invalid"}), 403)
 
     # Optional overrides
     model = data.get("model", "").strip() or DEFAULT_MODEL
@@ -90,31 +174,366 @@ def analyze():
     prompt_file = data.get("prompt_file")
 
     if prompt_template_override is not None and prompt_file is not None:
-        return jsonify({"error": "Specify prompt_template or prompt_file, not both."}), 400
+        return None, (jsonify({"error": "Specify prompt_template or prompt_file, not both."}), 400)
 
     if prompt_file is not None:
-        if not re.fullmatch(r"[\w\-]+", prompt_file):
-            return jsonify({"error": "Invalid prompt_file name."}), 400
-        file_path = os.path.join(PROMPTS_DIR, prompt_file + ".md")
-        if not os.path.isfile(file_path):
-            return jsonify({"error": f"Prompt file '{prompt_file}' not found."}), 404
-        with open(file_path) as f:
-            active_template = f.read()
+        try:
+            prompt = PROMPTS.get(PROMPTS_DIR, prompt_file)
+        except ValueError:
+            return None, (jsonify({"error": "Invalid prompt_file name."}), 400)
+        if prompt is None:
+            return None, (jsonify({"error": f"Prompt file '{prompt_file}' not found."}), 404)
+        active_template, template_hash = prompt.text, prompt.hash
+        prompt_label = f"prompts/{prompt_file}.md"
     elif prompt_template_override is not None:
         active_template = prompt_template_override
+        template_hash = content_hash(active_template)
+        prompt_label = "inline"
     else:
-        active_template = PROMPT_TEMPLATE
+        default_file = DEFAULT_ORACLE_PROMPT_FILE if ORACLE_TEXT else DEFAULT_PROMPT_FILE
+        prompt = PROMPTS.load(os.path.join(PROMPTS_DIR, default_file + ".md"))
+        active_template, template_hash = prompt.text, prompt.hash
+        prompt_label = f"prompts/{default_file}.md"
 
     api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
     if not api_key:
-        return jsonify({"error": "Server is not configured with an API key. Set ANTHROPIC_API_KEY environment variable."}), 500
+        return None, (jsonify({"error": "Server is not configured with an API key. Set ANTHROPIC_API_KEY environment variable."}), 500)
+
+    return {
+        "api_key": api_key,
+        "card_data": card_data,
+        "mechanics": mechanics,
+        "model": model,
+        "template": active_template,
+        "template_hash": template_hash,
+        "prompt_label": prompt_label,
+    }, None
+
+
+def _partition_cached(params):
+    """Return (cached, card_data_to_send, pending) using RESULT_CACHE when enabled.
+
+    With ORACLE_TEXT, the lines to send come back with their oracle text added.
+    """
+    if RESULT_CACHE is None:
+        cached, card_data, pending = {}, params["card_data"], {}
+    else:
+        cached, uncached_lines, pending = RESULT_CACHE.partition(
+            params["card_data"], params["template"], params["mechanics"], params["model"],
+            template_hash=params["template_hash"],
+        )
+        card_data = "\n".join(uncached_lines)
+    if ORACLE_TEXT and card_data:
+        card_data = CARD_DB.with_oracle_text(card_data)
+    return cached, card_data, pending
+
+
+def _store_cached(params, result: dict, pending: dict):
+    if RESULT_CACHE is not None:
+        RESULT_CACHE.store(result, pending, model=params["model"], prompt_file=params["prompt_label"])
+
+
+def _client_error(error_dict: dict, status: int):
+    """An API error for the browser: the message only, not the upstream status and
+    retry details the batch pipeline uses (see api_error_response)."""
+    return {"error": error_dict["error"]}, status
+
+
+def _analyze(params, report_progress=None):
+    """Run one analysis; returns (response dict, HTTP status).
+
+    report_progress(done, total), if given, is called as shards finish.
+    """
+    model = params["model"]
+
+    cached, card_data, pending = _partition_cached(params)
+    if not card_data:
+        return {"result": cached, "model_used": model}, 200
+
+    sizer = sharding.sizer_for(params["prompt_label"], model)
+    lines = [line for line in card_data.splitlines() if line.strip()]
+    shards = sizer.split(lines)
+    shard_texts = [card_data] if len(shards) == 1 else ["\n".join(shard) for shard in shards]
+    progress = {"done": 0}
+    progress_lock = threading.Lock()
+    if report_progress:
+        report_progress(0, len(shard_texts))
+
+    def call(prompt, system):
+        usage = {}
+        result, error = call_claude(params["api_key"], prompt, model=model, system=system, usage=usage)
+        return result, error, usage
+
+    def analyze_shard(shard_text):
+        prompt, system = build_request_prompt(params["template"], shard_text, params["mechanics"], PROMPT_CACHE)
+        shared = False
+        if SINGLE_FLIGHT is None:
+            result, error, usage = call(prompt, system)
+        else:
+            # Only parsed results are shared (in this process or across workers); errors are retried by each
+            (result, error, usage), shared = SINGLE_FLIGHT.do(
+                single_flight.request_key(prompt, model, system=system), lambda: call(prompt, system),
+                shareable=lambda value: isinstance(value[0], dict),
+            )
+            if shared:
+                # Tokens were spent (and counted) by the request that made the call
+                usage = {}
+        if isinstance(result, dict) and not shared:
+            sizer.observe(sum(1 for line in shard_text.splitlines() if line.strip()), usage.get("output_tokens", 0))
+        if report_progress:
+            with progress_lock:
+                progress["done"] += 1
+                report_progress(progress["done"], len(shard_texts))
+        return result, error, usage
+
+    outcomes = sharding.run_sharded(shard_texts, analyze_shard)
+    merged, raw, first_error, usage = {}, [], None, {}
+    for _text, result, error, shard_usage in outcomes:
+        add_usage(usage, shard_usage)
+        if error:
+            first_error = first_error or error
+        elif isinstance(result, dict):
+            _store_cached(params, result, pending)
+            merged.update(result)
+        else:
+            raw.append(str(result))
+
+    if first_error:
+        return _client_error(*first_error)
+    # Unparseable model output is shown as-is, as it is for a single request
+    response = {"result": "\n\n".join(raw) if raw else {**cached, **merged}, "model_used": model}
+    if usage:
+        response["usage"] = usage
+    return response, 200
+
+
+def _stored_result(params):
+    """Return (result_id, stored response or None); (None, None) when RESULT_STORE is off."""
+    if RESULT_STORE is None:
+        return None, None
+    result_id = result_store.result_id(params["card_data"], params["mechanics"], params["template_hash"],
+                                       params["model"])
+    return result_id, RESULT_STORE.get(result_id)
+
 
-    prompt = build_prompt(active_template, card_data, mechanics)
-    result, error = call_claude(api_key, prompt, model=model)
+def _covers_request(params, result: dict) -> bool:
+    """Whether result has an entry for every card in the request."""
+    returned = {normalize_card_name(card_name) for card_name in result}
+    return all(
+        normalize_card_name(parse_card_line(line)[0]) in returned
+        for line in params["card_data"].splitlines() if line.strip()
+    )
+
+
+def _save_result(params, result_id, result, model: str, truncated: bool = False) -> bool:
+    """Store a finished analysis under result_id.
+
+    Stored results are served as immutable, so only complete ones are kept: not raw
+    text, not cut off, and with every requested card. Anything else is analyzed
+    again next time.
+    """
+    if result_id is None or not isinstance(result, dict) or not result or truncated:
+        return False
+    if not _covers_request(params, result):
+        return False
+    RESULT_STORE.put(result_id, {"result": result, "model_used": model})
+    return True
+
+
+def _analyze_stored(params, report_progress=None):
+    """_analyze, answered from RESULT_STORE when the same analysis was stored before.
+
+    Complete responses carry "result_id", the id to load them again from /r/<result_id>.
+    """
+    result_id, stored = _stored_result(params)
+    if stored is not None:
+        return {**stored, "result_id": result_id}, 200
+    response, status = _analyze(params, report_progress)
+    if status == 200 and _save_result(params, result_id, response["result"], response["model_used"]):
+        response["result_id"] = result_id
+    return response, status
+
+
+def _job_key(params) -> str:
+    """Everything that determines an analysis' result, hashed; identical submissions share a job."""
+    return content_hash("\x1f".join(
+        (params["card_data"], params["mechanics"], params["model"], params["template_hash"])
+    ))
+
+
+def _job_payload(job: dict) -> dict:
+    payload = {"job_id": job["id"], "status": job["status"], "progress": {"done": job["done"], "total": job["total"]}}
+    if job["status"] in jobs.FINISHED:
+        payload["http_status"] = job["http_status"]
+        payload["response"] = job["response"]
+    return payload
+
+
+@app.route("/analyze", methods=["POST"])
+def analyze():
+    """Analyze card_data and return the tags.
+
+    With "async": true the analysis runs in the background instead: the response is
+    202 {"job_id", "status", "coalesced"}, and the result comes from /jobs/<job_id>.
+    An analysis that was stored before (see result_store.py) is answered without a model call.
+    """
+    data = request.get_json(silent=True)
+    params, error = _analysis_params(data)
+    if error:
+        return error
+
+    if data.get("async"):
+        job_id, created = JOBS.submit(_job_key(params), lambda report: _analyze_stored(params, report))
+        response = jsonify({"job_id": job_id, "status": "queued" if created else JOBS.get(job_id)["status"],
+                            "coalesced": not created})
+        return response, 202, {"Location": f"/jobs/{job_id}"}
+
+    response, status = _analyze_stored(params)
+    return jsonify(response), status
+
+
+@app.route("/r/<result_id>", methods=["GET"])
+def get_result(result_id):
+    """A stored analysis: {"result", "model_used", "result_id"}.
+
+    The id is a hash of everything that determined the result, so the response never
+    changes and is served with an ETag and immutable cache headers.
+    """
+    if RESULT_STORE is None:
+        return jsonify({"error": "Result storage is not configured."}), 503
+    stored = RESULT_STORE.get(result_id)
+    if stored is None:
+        return jsonify({"error": "Result not found."}), 404
+
+    response = jsonify({**stored, "result_id": result_id})
+    response.set_etag(result_id)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Job status and progress; once finished, "response" and "http_status" hold what
+    a synchronous /analyze would have returned."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(_job_payload(job))
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-sent events for a job: "progress" whenever it changes, then one "done"
+    carrying the same payload as /jobs/<job_id>."""
+    if JOBS.get(job_id) is None:
+        return jsonify({"error": "Job not found."}), 404
+
+    def generate():
+        last_payload, last_sent = None, time.monotonic()
+        while True:
+            job = JOBS.get(job_id)
+            if job is None:
+                yield _sse("error", {"error": "Job not found."})
+                return
+            payload = _job_payload(job)
+            if job["status"] in jobs.FINISHED:
+                yield _sse("done", payload)
+                return
+            if payload != last_payload:
+                yield _sse("progress", payload)
+                last_payload, last_sent = payload, time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                # Keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(JOB_POLL_INTERVAL)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+def _ndjson(obj) -> str:
+    return json.dumps(obj) + "\n"
+
+
+@app.route("/analyze/stream", methods=["POST"])
+def analyze_stream():
+    """Streaming /analyze: newline-delimited JSON, one line per card as soon as it is tagged.
+
+    Lines are {"card": name, "tags": {...}}, then a final {"done": true, "model_used": ...}
+    (plus "usage" token counts when the API reports them).
+    If the response held no card entries, the final line carries the raw text as "raw".
+    Errors after the stream has started arrive as an {"error": ..., "status": ...} line.
+    Once the result is stored (only complete ones are), the final line also carries its
+    "result_id" (see /r/<id>).
+    """
+    params, error = _analysis_params(request.get_json(silent=True))
     if error:
-        return jsonify(error[0]), error[1]
+        return error
+    model = params["model"]
+    result_id, stored = _stored_result(params)
+    if stored is not None:
+        # Replayed from the result store without calling the model
+        cached, card_data, pending = stored["result"], "", {}
+        model = stored["model_used"]
+    else:
+        cached, card_data, pending = _partition_cached(params)
+
+    def generate():
+        for card_name, tags in cached.items():
+            yield _ndjson({"card": card_name, "tags": tags})
+        if not card_data:
+            done = {"done": True, "model_used": model}
+            if stored is not None or _save_result(params, result_id, cached, model):
+                done["result_id"] = result_id
+            yield _ndjson(done)
+            return
+
+        prompt, system = build_request_prompt(params["template"], card_data, params["mechanics"], PROMPT_CACHE)
+        parser = CardStreamParser()
+        chunks = []
+        fresh = {}
+        usage = {}
+        try:
+            for text in stream_claude(params["api_key"], prompt, model=model, system=system, usage=usage):
+                chunks.append(text)
+                for card_name, tags in parser.feed(text):
+                    if isinstance(tags, dict):
+                        fresh[card_name] = tags
+                        yield _ndjson({"card": card_name, "tags": tags})
+        except anthropic.APIError as e:
+            error_dict, status = _client_error(*api_error_response(e))
+            yield _ndjson({**error_dict, "status": status})
+            return
+
+        done = {"done": True, "model_used": model}
+        if usage:
+            done["usage"] = usage
+        if not fresh and not parser.entries:
+            result = parse_claude_response("".join(chunks))
+            if isinstance(result, dict):
+                fresh = {k: v for k, v in result.items() if isinstance(v, dict)}
+                for card_name, tags in fresh.items():
+                    yield _ndjson({"card": card_name, "tags": tags})
+            else:
+                done["raw"] = result if isinstance(result, str) else json.dumps(result)
+        _store_cached(params, fresh, pending)
+        if "raw" not in done and _save_result(params, result_id, {**cached, **fresh}, model, parser.truncated):
+            done["result_id"] = result_id
+        yield _ndjson(done)
 
-    return jsonify({"result": result, "model_used": model})
+    return Response(generate(), mimetype="application/x-ndjson", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+"""Benchmark: fresh Anthropic client per call vs the shared client registry.
+
+Runs the same sequence of messages.create calls against the local stub server
+(stub_anthropic.py) twice — once building a new client per call, as call_claude
+used to, and once through claude_utils.get_client — and reports per-call latency
+and the number of TCP connections the server saw.
+
+The stub speaks plain HTTP, so the numbers cover client construction and TCP
+connect only; against api.anthropic.com every new connection also pays a TLS
+handshake, which widens the gap.
+
+Usage (from project root):
+    uv run python bench/bench_client_reuse.py --calls 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import anthropic
+
+import claude_utils
+from stub_anthropic import StubAnthropicServer
+
+
+def run(label: str, make_client, calls: int, stub: StubAnthropicServer):
+    stub.connections.clear()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = make_client()
+        client.messages.create(
+            model="claude-stub", max_tokens=16, messages=[{"role": "user", "content": "Sol Ring"}],
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<22} mean {statistics.mean(latencies):7.2f} ms   p50 {statistics.median(latencies):7.2f} ms   "
+          f"p95 {p95:7.2f} ms   connections {len(stub.connections)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with StubAnthropicServer() as stub:
+        os.environ["ANTHROPIC_BASE_URL"] = stub.base_url
+        claude_utils.reset_clients()
+        # Warm up imports and the server thread
+        claude_utils.get_client("sk-bench").messages.create(
+            model="claude-stub", max_tokens=16, messages=[{"role": "user", "content": "warmup"}],
+        )
+
+        run("new client per call", lambda: anthropic.Anthropic(api_key="sk-bench"), args.calls, stub)
+        run("shared client registry", lambda: claude_utils.get_client("sk-bench"), args.calls, stub)
+
+
+if __name__ == "__main__":
+    main()
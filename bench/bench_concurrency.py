@@ -0,0 +1,115 @@
+"""Benchmark: concurrent in-flight analyses one gunicorn instance sustains, per worker class.
+
+For each worker class (sync, gthread, and gevent when it is installed) this starts
+gunicorn with gunicorn.conf.py, pointed at the stub Anthropic API
+(stub_anthropic.py) answering after a fixed --latency, then sends bursts of 1, 2,
+4, ... simultaneous /analyze requests. A burst is sustained when every request
+succeeds within 1.5x the stub latency, i.e. they all waited on the API side by side
+instead of queueing for a worker; the table reports the largest sustained burst.
+The app's caches, result store and single-flight are off (see
+load_test.start_gunicorn), so every request makes its own call to the stub.
+
+Usage (from project root):
+    uv run python bench/bench_concurrency.py --latency 5 --workers 2 --max-burst 256
+"""
+
+import argparse
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import load_test
+from load_test import ROOT, free_port, start_stub, wait_until_up
+
+
+def start_gunicorn(worker_class: str, args, port: int, stub_url: str, state_dir: str) -> subprocess.Popen:
+    """load_test.start_gunicorn with gunicorn.conf.py, configured through its environment variables."""
+    env = {
+        "ANTHROPIC_POOL_SIZE": str(args.max_burst),
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(args.workers),
+        "GUNICORN_WORKER_CLASS": worker_class,
+    }
+    if worker_class == "sync":
+        # gunicorn silently switches sync workers with threads > 1 to gthread
+        env["GUNICORN_THREADS"] = "1"
+    return load_test.start_gunicorn(["-c", str(ROOT / "gunicorn.conf.py")], stub_url, state_dir, env,
+                                    stderr=subprocess.DEVNULL)
+
+
+def burst(app_url: str, size: int, timeout: float) -> tuple:
+    """Send size requests at once; returns (successes, wall seconds)."""
+    limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+    with httpx.Client(base_url=app_url, timeout=timeout, limits=limits) as client:
+        def send(i):
+            try:
+                return client.post("/analyze", json={"card_data": f"Bench Card {i}"}).status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=size) as pool:
+            ok = sum(pool.map(send, range(size)))
+        return ok, time.monotonic() - start
+
+
+def run(worker_class: str, args) -> int:
+    """Largest sustained burst for one worker class."""
+    stub_port, app_port = free_port(), free_port()
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    stub = start_stub(Namespace(latency=f"fixed:{args.latency}", error_rate=0.0, error_status=529), stub_port)
+    app = None
+    sustained = 0
+    state_dir = tempfile.TemporaryDirectory()
+    try:
+        wait_until_up(f"{stub_url}/_stats", stub)
+        app = start_gunicorn(worker_class, args, app_port, stub_url, state_dir.name)
+        wait_until_up(f"{app_url}/", app)
+        size = 1
+        while size <= args.max_burst:
+            ok, wall = burst(app_url, size, timeout=args.latency * 4 + 30)
+            held = ok == size and wall < args.latency * 1.5
+            print(f"  {worker_class:<8} burst {size:4d}: {ok:4d} ok in {wall:6.1f}s"
+                  + ("" if held else "   (queued)"))
+            if not held:
+                break
+            sustained = size
+            size *= 2
+    finally:
+        for process in filter(None, (app, stub)):
+            process.terminate()
+            process.wait(timeout=10)
+        state_dir.cleanup()
+    return sustained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=5.0, help="Stub API latency in seconds (default: 5)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (default: 2)")
+    parser.add_argument("--max-burst", type=int, default=256, help="Largest burst to try (default: 256)")
+    args = parser.parse_args()
+
+    classes = ["sync", "gthread"]
+    if importlib.util.find_spec("gevent"):
+        classes.append("gevent")
+    else:
+        print("(gevent not installed; skipping the gevent worker)")
+
+    results = {worker_class: run(worker_class, args) for worker_class in classes}
+    print(f"\nSustained concurrent analyses, {args.workers} workers, {args.latency:g}s API latency:")
+    for worker_class, sustained in results.items():
+        print(f"  {worker_class:<8} {sustained}")
+
+
+if __name__ == "__main__":
+    main()
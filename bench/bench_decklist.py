@@ -0,0 +1,75 @@
+"""Microbenchmark: parse_decklist on large synthetic Archidekt, Moxfield and MTGO exports.
+
+Each input repeats a pool of distinct cards with basics, known lands, duplicates and
+export annotations mixed in, then reports parse time and how much of the text is
+left to send to the model.
+
+Usage (from project root):
+    uv run python bench/bench_decklist.py --lines 1000 10000
+"""
+
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from decklist import KNOWN_LANDS, parse_decklist
+
+SETS = ["cmr", "c21", "m21", "znr", "khm", "mh2"]
+CATEGORIES = ["Ramp", "Draw", "Removal", "Board Wipe", "Land", "Creature"]
+
+
+def archidekt_line(rng, name):
+    return (f"{rng.randint(1, 4)}x {name} ({rng.choice(SETS)}) {rng.randint(1, 400)} "
+            f"[{rng.choice(CATEGORIES)}] ^Have,#37d67a^")
+
+
+def moxfield_line(rng, name):
+    foil = " *F*" if rng.random() < 0.2 else ""
+    return f"{rng.randint(1, 4)} {name} ({rng.choice(SETS).upper()}) {rng.randint(1, 400)}{foil}"
+
+
+def mtgo_line(rng, name):
+    return f"{rng.randint(1, 4)} {name}"
+
+
+FORMATS = {"archidekt": archidekt_line, "moxfield": moxfield_line, "mtgo": mtgo_line}
+
+
+def synthetic_decklist(fmt: str, n_lines: int, n_cards: int = 2000, seed: int = 0) -> str:
+    """n_lines of export text over n_cards distinct names; about 20% lands."""
+    rng = random.Random(seed)
+    pool = [f"Synthetic Card {i}" for i in range(n_cards)]
+    lands = sorted(KNOWN_LANDS) + ["Snow-Covered Island", "Wastes"]
+    make_line = FORMATS[fmt]
+    lines = []
+    for i in range(n_lines):
+        if i % 250 == 0:
+            lines.append("SIDEBOARD:" if fmt == "mtgo" else "Deck")
+        name = rng.choice(lands) if rng.random() < 0.2 else rng.choice(pool)
+        lines.append(make_line(rng, name))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    for n in args.lines:
+        print(f"{n} lines")
+        for fmt in FORMATS:
+            text = synthetic_decklist(fmt, n)
+            number = max(1, 20000 // n)
+            seconds = min(timeit.repeat(lambda: parse_decklist(text), number=number, repeat=5)) / number
+            cleaned = "\n".join(parse_decklist(text))
+            print(f"  {fmt:<10} {seconds * 1000:8.2f} ms  {n / seconds / 1e6:5.2f} M lines/s  "
+                  f"{len(text) / 1024:6.0f} KiB -> {len(cleaned) / 1024:4.0f} KiB "
+                  f"({len(cleaned.splitlines())} cards)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Microbenchmark: response parsing on large synthetic model outputs.
+
+Compares the old regex-based parse (re.findall over every ``` fence, then json.loads
+on each candidate in reverse, then a second full json.loads attempt) with the
+single-pass CardStreamParser, on complete and truncated responses and when fed in
+small streaming chunks.
+
+Usage (from project root):
+    uv run python bench/bench_parser.py --cards 100 1000 5000
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from claude_utils import CardStreamParser, parse_claude_response, strip_markdown_fences
+
+MECHANICS = ["ramp", "card_advantage", "targeted_disruption", "mass_disruption", "go_wide", "anthem", "etb_effects"]
+TIERS = ["S+ Tier", "S-Tier", "A-Tier", "B-Tier", "C-Tier", "D-Tier"]
+
+
+def legacy_parse(raw_text: str):
+    """The previous extract_fenced_json + parse_claude_response implementation."""
+    fences = re.findall(r"```(?:json)?\s*(.*?)```", raw_text, re.DOTALL)
+    for candidate in reversed(fences):
+        try:
+            return json.loads(candidate.strip())
+        except json.JSONDecodeError:
+            continue
+    text = strip_markdown_fences(raw_text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return raw_text
+
+
+def synthetic_response(n_cards: int, seed: int = 0) -> str:
+    """Recall prose (with mana symbols) followed by a fenced prompt12-style object."""
+    rng = random.Random(seed)
+    names = [f"Synthetic Card {i}" for i in range(n_cards)]
+    recall = "\n".join(f"{name} — {{T}}: Add {{C}}{{C}}. When this enters, draw a card." for name in names)
+    result = {
+        name: {mech: rng.choice(TIERS) for mech in rng.sample(MECHANICS, rng.randint(0, 3))}
+        for name in names
+    }
+    return f"{recall}\n```json\n{json.dumps(result, indent=2)}\n```"
+
+
+def bench(label: str, fn, number: int):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<34} {seconds * 1000:9.3f} ms")
+
+
+def feed_in_chunks(text: str, size: int = 24):
+    parser = CardStreamParser()
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+    return parser.entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    for n in args.cards:
+        text = synthetic_response(n)
+        truncated = text[: int(len(text) * 0.8)]
+        number = max(1, 2000 // n)
+        print(f"{n} cards ({len(text) / 1024:.0f} KiB response)")
+        bench("legacy regex + json.loads", lambda: legacy_parse(text), number)
+        bench("parse_claude_response", lambda: parse_claude_response(text), number)
+        bench("CardStreamParser, 24-char chunks", lambda: feed_in_chunks(text), number)
+
+        legacy_result = legacy_parse(truncated)
+        recovered = parse_claude_response(truncated)
+        legacy_cards = len(legacy_result) if isinstance(legacy_result, dict) else 0
+        print(f"  truncated at 80%: legacy recovers {legacy_cards} cards, "
+              f"new parser recovers {len(recovered)}/{n}")
+
+
+if __name__ == "__main__":
+    main()
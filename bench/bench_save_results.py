@@ -0,0 +1,109 @@
+"""Benchmark: analyze_batch.save_results against a local Postgres.
+
+Compares the previous per-card writer (one INSERT and one UPDATE per card) with the
+bulk writer (one execute_values INSERT and one UPDATE ... WHERE id = ANY per batch),
+and the --upsert variant when public.labeled has LABELED_UNIQUE_INDEX.
+
+Connects with the DB_* environment variables like the analysis scripts. Rows are
+written to public.labeled under prompt_file "bench/save_results" and to a scratch
+public.bench_cards_to_analyze table; both are cleaned up afterwards. Run it against a
+development database — latency to the server dominates the per-card numbers.
+
+Usage (from project root):
+    uv run python bench/bench_save_results.py --batches 50 --batch-size 20
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "analysis"))
+
+import analyze_batch
+from db import connect
+
+BENCH_PROMPT = "bench/save_results"
+BENCH_TABLE = "bench_cards_to_analyze"
+
+
+def legacy_save_results(conn, results, batch, prompt_file, model, table):
+    """The previous save_results: one INSERT and one UPDATE round trip per card."""
+    batch_by_name = {row["card_name"].lower(): row["id"] for row in batch}
+    with conn.cursor() as cur:
+        for card_result in results:
+            card_name = card_result["card_name"]
+            cur.execute(
+                "INSERT INTO public.labeled (card_name, prompt_file, model, raw_json) VALUES (%s, %s, %s, %s)",
+                (card_name, prompt_file, model, json.dumps(card_result)),
+            )
+            card_id = batch_by_name.get(card_name.lower())
+            if card_id is not None:
+                cur.execute(f"UPDATE public.{table} SET status = 'COMPLETED' WHERE id = %s", (card_id,))
+    conn.commit()
+
+
+def reset(conn, total: int):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM public.labeled WHERE prompt_file = %s", (BENCH_PROMPT,))
+        cur.execute(f"DROP TABLE IF EXISTS public.{BENCH_TABLE}")
+        cur.execute(f"CREATE TABLE public.{BENCH_TABLE} (id SERIAL PRIMARY KEY, card_name TEXT, status TEXT)")
+        cur.execute(
+            f"INSERT INTO public.{BENCH_TABLE} (card_name, status) "
+            f"SELECT 'Bench Card ' || g, 'NOT_STARTED' FROM generate_series(1, %s) g",
+            (total,),
+        )
+        cur.execute(f"SELECT id, card_name FROM public.{BENCH_TABLE} ORDER BY id")
+        rows = [{"id": card_id, "card_name": name} for card_id, name in cur.fetchall()]
+    conn.commit()
+    return rows
+
+
+def has_unique_index(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'labeled_card_prompt_model_key'")
+        return cur.fetchone() is not None
+
+
+def run(label: str, conn, save, args):
+    cards = reset(conn, args.batches * args.batch_size)
+    batches = [cards[i:i + args.batch_size] for i in range(0, len(cards), args.batch_size)]
+    start = time.perf_counter()
+    for batch in batches:
+        results = [{"card_name": row["card_name"], "ramp": "C-Tier"} for row in batch]
+        save(conn, results, batch, BENCH_PROMPT, "bench", BENCH_TABLE)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {len(cards) / elapsed:9.0f} rows/s   {elapsed * 1000 / len(batches):7.2f} ms/batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(analyze_batch.CREATE_LABELED_TABLE)
+    conn.commit()
+
+    try:
+        run("per-card INSERT/UPDATE", conn, legacy_save_results, args)
+        run("execute_values + ANY()", conn, analyze_batch.save_results, args)
+        if has_unique_index(conn):
+            run("execute_values upsert", conn,
+                lambda *a: analyze_batch.save_results(*a, upsert=True), args)
+        else:
+            print("(skipping upsert: labeled_card_prompt_model_key index not present)")
+    finally:
+        reset(conn, 0)
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS public.{BENCH_TABLE}")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Load test: drive /analyze under gunicorn at a fixed request rate.
+
+Starts the stub Anthropic API (stub_anthropic.py) with the given latency and error
+rate, starts gunicorn serving app:app (gunicorn.conf.py, with --workers/--threads
+overriding it) with ANTHROPIC_BASE_URL pointed at the stub,
+then sends POST /analyze at --rps for --duration seconds and reports:
+
+- latency p50/p95/p99, measured from each request's scheduled send time, so time
+  spent waiting for a free client thread counts (no coordinated omission);
+- error rate by HTTP status, and requests still unanswered at --timeout;
+- worker saturation: the mean number of stub calls in flight over the run (from
+  the stub's GET /_stats) divided by gunicorn's request slots (workers x threads).
+  Near 100% means requests are queueing for a worker rather than for the API.
+
+Each request asks about --cards random made-up card names, fewer than one shard
+(see sharding.py), so an /analyze request holds one worker slot and one API call.
+The result cache is off unless --result-cache is given, so repeated names still
+reach the stub; the result store and single-flight are always off, and the app's
+on-disk state goes to a temporary directory (see start_gunicorn).
+
+Usage (from project root):
+    uv run python bench/load_test.py --rps 5 --duration 60 --workers 2 --threads 4 --latency lognormal:2,0.5
+    uv run python bench/load_test.py --rps 20 --error-rate 0.05 --error-status 429
+"""
+
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Error: {process.args[0]} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    sys.exit(f"Error: {url} did not come up within {timeout:.0f}s")
+
+
+def start_stub(args, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, str(ROOT / "stub_anthropic.py"), "--port", str(port), "--latency", args.latency,
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+    ]
+    return subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL)
+
+
+def start_gunicorn(gunicorn_args: list, stub_url: str, state_dir: str, env: dict = None,
+                   stderr=None) -> subprocess.Popen:
+    """Start gunicorn serving app:app against the stub API at stub_url.
+
+    So that every request makes its own model call, the result store, single-flight
+    and (unless env turns it back on) the result cache are off, and any file the
+    app writes (job store, SQLite caches, lock files) goes under state_dir rather
+    than the project root. env overrides these defaults.
+    """
+    env = {
+        **os.environ,
+        "ANTHROPIC_BASE_URL": stub_url,
+        "ANTHROPIC_API_KEY": "sk-bench",
+        "RESULT_CACHE_BACKEND": "off",
+        "RESULT_STORE_BACKEND": "off",
+        "SINGLE_FLIGHT": "off",
+        "JOB_STORE_PATH": os.path.join(state_dir, "jobs.sqlite3"),
+        "RESULT_CACHE_PATH": os.path.join(state_dir, "result_cache.sqlite3"),
+        "RESULT_STORE_PATH": os.path.join(state_dir, "results.sqlite3"),
+        "SINGLE_FLIGHT_DIR": os.path.join(state_dir, "single-flight"),
+        **(env or {}),
+    }
+    env.pop("ACCESS_PASSWORD", None)
+    command = [sys.executable, "-m", "gunicorn", *gunicorn_args, "app:app"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stderr=stderr)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def drive(args, app_url: str) -> list:
+    """Send requests at a fixed rate; returns (status or exception name, latency seconds) per request."""
+    results = []
+    lock = threading.Lock()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    client = httpx.Client(base_url=app_url, timeout=args.timeout, limits=limits)
+
+    def send(scheduled: float, card_data: str):
+        try:
+            status = client.post("/analyze", json={"card_data": card_data}).status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        with lock:
+            results.append((status, time.monotonic() - scheduled))
+
+    total = int(args.rps * args.duration)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+        for i in range(total):
+            scheduled = start + i / args.rps
+            time.sleep(max(0.0, scheduled - time.monotonic()))
+            names = [f"Load Test Card {rng.randrange(100_000)}" for _ in range(args.cards)]
+            pool.submit(send, scheduled, "\n".join(names))
+    client.close()
+    return results
+
+
+def report(results: list, stats_before: dict, stats_after: dict, elapsed: float, args):
+    statuses = Counter(status for status, _ in results)
+    ok = sorted(latency for status, latency in results if status == 200)
+    errors = len(results) - statuses[200]
+    print(f"\n{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.2f}/s achieved, "
+          f"{args.rps:g}/s offered)")
+    print(f"latency (200s)  p50 {percentile(ok, 0.50) * 1000:8.0f} ms   p95 {percentile(ok, 0.95) * 1000:8.0f} ms   "
+          f"p99 {percentile(ok, 0.99) * 1000:8.0f} ms")
+    print(f"errors          {errors} ({errors / max(1, len(results)):.1%})"
+          + "".join(f"   {status}: {count}" for status, count in sorted(statuses.items(), key=str) if status != 200))
+
+    slots = args.workers * args.threads
+    busy = stats_after["busy_seconds"] - stats_before["busy_seconds"]
+    calls = stats_after["messages"] - stats_before["messages"]
+    injected = stats_after["errors_injected"] - stats_before["errors_injected"]
+    print(f"upstream        {calls} API calls ({injected} injected errors, retried by the SDK), "
+          f"max {stats_after['max_in_flight']} in flight")
+    print(f"saturation      {busy / elapsed:.2f} calls in flight on average / {slots} worker slots "
+          f"= {busy / elapsed / slots:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rps", type=float, default=5.0, help="Requests per second offered (default: 5)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send for (default: 30)")
+    parser.add_argument("--cards", type=int, default=10, help="Cards per request (default: 10)")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (default: 2)")
+    parser.add_argument("--threads", type=int, default=16, help="gunicorn threads per worker (default: 16)")
+    parser.add_argument("--latency", default="lognormal:1.5,0.4",
+                        help="Stub latency distribution (see stub_anthropic.py; default: lognormal:1.5,0.4)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--error-status", type=int, default=529, help="Status of injected errors (default: 529)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Client-side concurrency cap (default: 256)")
+    parser.add_argument("--result-cache", action="store_true", help="Leave the app's result cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    stub = start_stub(args, stub_port)
+    app = None
+    state_dir = tempfile.TemporaryDirectory()
+    try:
+        wait_until_up(f"{stub_url}/_stats", stub)
+        gunicorn_args = [
+            "--bind", f"127.0.0.1:{app_port}", "--workers", str(args.workers), "--threads", str(args.threads),
+            "--timeout", str(int(args.timeout) + 30),
+        ]
+        env = {"RESULT_CACHE_BACKEND": os.environ.get("RESULT_CACHE_BACKEND", "memory")} if args.result_cache else {}
+        app = start_gunicorn(gunicorn_args, stub_url, state_dir.name, env)
+        wait_until_up(f"{app_url}/", app)
+        print(f"Driving {app_url}/analyze at {args.rps:g} req/s for {args.duration:g}s "
+              f"({args.workers} workers x {args.threads} threads, stub latency {args.latency}, "
+              f"error rate {args.error_rate:g})")
+
+        stats_before = httpx.get(f"{stub_url}/_stats").json()
+        start = time.monotonic()
+        results = drive(args, app_url)
+        elapsed = time.monotonic() - start
+        stats_after = httpx.get(f"{stub_url}/_stats").json()
+        report(results, stats_before, stats_after, elapsed, args)
+    finally:
+        for process in filter(None, (app, stub)):
+            process.terminate()
+            process.wait(timeout=10)
+        state_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Local card database built from a Scryfall bulk-data export.
+
+Download a bulk file ("Oracle Cards" is enough; "Default Cards" works too) from
+https://scryfall.com/docs/api/bulk-data and point SCRYFALL_BULK_PATH at it. The
+JSON is parsed once into a SQLite index at CARD_DB_PATH (default card_db.sqlite3),
+rebuilt whenever the bulk file changes, so workers start without re-parsing it.
+Lookups are served from an in-memory name index loaded from that file.
+
+Besides art for /api/art, it holds each card's oracle text, which /analyze (with
+ORACLE_TEXT=1) and analysis/analyze_batch.py --card-db add to the card list, so the
+model reads the rules text instead of recalling it.
+
+Names match exactly first, then normalized: case, accents, curly apostrophes and
+spacing are ignored, and each face of a double-faced card matches on its own.
+
+    uv run python card_db.py path/to/oracle-cards.json
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+from decklist import parse_card_line
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE cards (
+    name        TEXT PRIMARY KEY,
+    art_crop    TEXT,
+    oracle_text TEXT
+);
+CREATE TABLE names (
+    key  TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def normalize_name(name: str) -> str:
+    """Lookup form of a card name: no accents, straight apostrophes, casefolded, single-spaced."""
+    decomposed = unicodedata.normalize("NFKD", name.replace("’", "'"))
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.split()).casefold()
+
+
+def source_stamp(bulk_path: str) -> str:
+    """Identifies one version of the bulk file; the index is rebuilt when it changes."""
+    stat = os.stat(bulk_path)
+    return f"{SCHEMA_VERSION}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def _art_crop(card: dict):
+    uris = card.get("image_uris") or (card.get("card_faces") or [{}])[0].get("image_uris") or {}
+    return uris.get("art_crop")
+
+
+def _oracle_text(card: dict) -> str:
+    """Oracle text on one line; faces of multi-faced cards are joined with " // "."""
+    if card.get("oracle_text") is not None:
+        texts = [card["oracle_text"]]
+    else:
+        texts = [face.get("oracle_text", "") for face in card.get("card_faces") or []]
+    return " // ".join(" ".join(text.split("\n")) for text in texts)
+
+
+def _lookup_keys(card: dict):
+    yield normalize_name(card["name"])
+    for face in card.get("card_faces") or []:
+        if face.get("name"):
+            yield normalize_name(face["name"])
+
+
+def build_index(bulk_path: str, db_path: str) -> int:
+    """Parse a Scryfall bulk JSON file into a fresh SQLite index; returns the card count.
+
+    The first printing of each card wins. Written to a temporary file and swapped in,
+    so workers reading the old index are never disturbed.
+    """
+    stamp = source_stamp(bulk_path)
+    with open(bulk_path, encoding="utf-8") as f:
+        bulk = json.load(f)
+
+    cards, keys = {}, {}
+    for card in bulk:
+        name = card.get("name")
+        if not name or name in cards or card.get("layout") in ("art_series", "token", "double_faced_token"):
+            continue
+        cards[name] = (name, _art_crop(card), _oracle_text(card))
+        for key in _lookup_keys(card):
+            keys.setdefault(key, name)
+
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.executemany("INSERT INTO cards (name, art_crop, oracle_text) VALUES (?, ?, ?)", cards.values())
+            conn.executemany("INSERT INTO names (key, name) VALUES (?, ?)", keys.items())
+            conn.execute("INSERT INTO meta (key, value) VALUES ('source', ?)", (stamp,))
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return len(cards)
+
+
+class CardDB:
+    """Card lookups from the SQLite index, loaded into memory on first use.
+
+    With bulk_path set, the index is (re)built first if it is missing or was built
+    from a different version of the bulk file.
+    """
+
+    def __init__(self, db_path: str, bulk_path: str = None):
+        self.db_path = db_path
+        self.bulk_path = bulk_path
+        self.version = None
+        self._cards = None
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def _stored_stamp(self):
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            return None
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _load(self):
+        stamp = self._stored_stamp()
+        if self.bulk_path and stamp != source_stamp(self.bulk_path):
+            build_index(self.bulk_path, self.db_path)
+        elif stamp is None or stamp.split(":")[0] != str(SCHEMA_VERSION):
+            raise RuntimeError(f"{self.db_path} is missing or outdated; rebuild it with card_db.py")
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            self._cards = {
+                name: {"art_crop": art_crop, "oracle_text": oracle_text}
+                for name, art_crop, oracle_text in conn.execute("SELECT name, art_crop, oracle_text FROM cards")
+            }
+            self._keys = dict(conn.execute("SELECT key, name FROM names"))
+            self.version = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def ensure_loaded(self):
+        if self._cards is None:
+            with self._lock:
+                if self._cards is None:
+                    self._load()
+
+    def canonical_name(self, name: str):
+        """The card's Scryfall name, or None if it isn't in the index."""
+        self.ensure_loaded()
+        if name in self._cards:
+            return name
+        return self._keys.get(normalize_name(name))
+
+    def art_urls(self, names) -> dict:
+        """{requested name: art_crop URL or None} for each name."""
+        self.ensure_loaded()
+        urls = {}
+        for name in names:
+            canonical = self.canonical_name(name)
+            urls[name] = self._cards[canonical]["art_crop"] if canonical else None
+        return urls
+
+    def oracle_text(self, name: str):
+        """The card's oracle text on one line, or None if it isn't in the index."""
+        canonical = self.canonical_name(name)
+        return self._cards[canonical]["oracle_text"] if canonical else None
+
+    def with_oracle_text(self, card_data: str) -> str:
+        """card_data with each known card's line rewritten as "Card Name | Oracle Text".
+
+        Lines that already carry oracle text, and unknown cards, are left as they are.
+        The name is kept as typed (minus any quantity), since the model echoes it back.
+        """
+        lines = []
+        for line in card_data.splitlines():
+            card_name, existing = parse_card_line(line)
+            oracle_text = None if existing or not card_name else self.oracle_text(card_name)
+            lines.append(f"{card_name} | {oracle_text}" if oracle_text else line)
+        return "\n".join(lines)
+
+
+def make_card_db_from_env():
+    """CardDB from SCRYFALL_BULK_PATH / CARD_DB_PATH, or None when neither a bulk file
+    nor an already-built index is available."""
+    bulk_path = os.environ.get("SCRYFALL_BULK_PATH", "").strip() or None
+    db_path = os.environ.get("CARD_DB_PATH", "").strip() or "card_db.sqlite3"
+    if bulk_path is None and not os.path.exists(db_path):
+        return None
+    return CardDB(db_path, bulk_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python card_db.py <scryfall bulk JSON>")
+    db_path = os.environ.get("CARD_DB_PATH", "").strip() or "card_db.sqlite3"
+    count = build_index(sys.argv[1], db_path)
+    print(f"Indexed {count} cards into {db_path}")
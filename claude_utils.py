@@ -1,19 +1,80 @@
+import functools
 import json
+import os
 import re
+import threading
 
 import anthropic
+import httpx
+
+
+_PLACEHOLDER_RE = re.compile(r"(CARD_LIST_PLACEHOLDER|MECHANICS_PLACEHOLDER|PASS1_RESULTS_PLACEHOLDER)")
+
+
+@functools.lru_cache(maxsize=64)
+def split_template(template: str) -> tuple:
+    """Split a template into alternating literal text and placeholder names.
+
+    Placeholders are kept as separate parts, so filling a template is a single join
+    instead of one full-string replace per placeholder.
+    """
+    return tuple(_PLACEHOLDER_RE.split(template))
+
+
+def fill_template(parts: tuple, values: dict) -> str:
+    """Join split_template() parts, substituting the placeholders found in values."""
+    return "".join(values.get(part, part) for part in parts)
 
 
 def build_prompt(template: str, card_data: str, mechanics: str) -> str:
     """Substitute placeholders into the prompt template."""
-    prompt = template.replace("CARD_LIST_PLACEHOLDER", card_data)
-    return prompt.replace("MECHANICS_PLACEHOLDER", mechanics)
+    return fill_template(split_template(template), {
+        "CARD_LIST_PLACEHOLDER": card_data,
+        "MECHANICS_PLACEHOLDER": mechanics,
+    })
 
 
 def build_feedback_prompt(template: str, card_data: str, mechanics: str, pass1_json: str) -> str:
     """Substitute placeholders into a feedback/review prompt template."""
-    prompt = build_prompt(template, card_data, mechanics)
-    return prompt.replace("PASS1_RESULTS_PLACEHOLDER", pass1_json)
+    return fill_template(split_template(template), {
+        "CARD_LIST_PLACEHOLDER": card_data,
+        "MECHANICS_PLACEHOLDER": mechanics,
+        "PASS1_RESULTS_PLACEHOLDER": pass1_json,
+    })
+
+
+# Stands in for the card list when the template moves into cacheable system blocks
+CARD_LIST_REFERENCE = "(The card list is in the <cards> block of the user message.)"
+
+_CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+
+def build_cached_prompt(template: str, card_data: str, mechanics: str, system: str = None):
+    """Cache-friendly layout of build_prompt. Returns (system_blocks, user_text).
+
+    The template, with the card list replaced by CARD_LIST_REFERENCE, goes into the
+    system prompt with a cache breakpoint before the mechanics (shared by every request
+    with this template) and one after them (shared by requests with the same
+    mechanics). Only the card list, sent last as the user message, varies.
+    """
+    parts = split_template(template)
+    values = {"CARD_LIST_PLACEHOLDER": CARD_LIST_REFERENCE, "MECHANICS_PLACEHOLDER": mechanics}
+    split_at = parts.index("MECHANICS_PLACEHOLDER") if "MECHANICS_PLACEHOLDER" in parts else len(parts)
+
+    blocks = [{"type": "text", "text": system}] if system else []
+    for text in (fill_template(parts[:split_at], values), fill_template(parts[split_at:], values)):
+        if text.strip():
+            blocks.append({"type": "text", "text": text, "cache_control": _CACHE_BREAKPOINT})
+    return blocks, f"<cards>\n{card_data}\n</cards>"
+
+
+def build_request_prompt(template: str, card_data: str, mechanics: str, cache_prompt: bool = False,
+                         system: str = None):
+    """Return (prompt, system) for call_claude/stream_claude in the plain or cached layout."""
+    if cache_prompt:
+        blocks, prompt = build_cached_prompt(template, card_data, mechanics, system)
+        return prompt, blocks
+    return build_prompt(template, card_data, mechanics), system
 
 
 def strip_markdown_fences(text: str) -> str:
@@ -26,56 +87,338 @@ def strip_markdown_fences(text: str) -> str:
     return text.strip()
 
 
-def extract_fenced_json(text: str):
-    """Parse the last fenced code block containing valid JSON, or None.
+_START_RE = re.compile(r'\{\s*["}]|\[\s*[\[{"\]]')
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+_WHITESPACE_RE = re.compile(r"\s*")
+_NUMBER_CHARS_RE = re.compile(r"[-+.0-9eE]*")
+_LITERALS = ("true", "false", "null")
+_decoder = json.JSONDecoder()
+
+
+def _input_ended(e: json.JSONDecodeError, buf: str) -> bool:
+    """True when a decode error only means the text stops early (more may be coming)."""
+    if e.msg.startswith("Unterminated string") or e.pos >= len(buf):
+        return True
+    rest = buf[e.pos:]
+    if e.msg.startswith("Invalid \\uXXXX escape"):
+        # "\u00" at the end of a chunk: the string (and its closing quote) hasn't arrived yet
+        return '"' not in rest
+    rest = rest.rstrip()
+    if _NUMBER_CHARS_RE.fullmatch(rest):
+        return True  # a number cut after "-", "2." or "1e"
+    return e.msg == "Expecting value" and any(lit.startswith(rest) for lit in _LITERALS)
 
-    Handles responses where prose (e.g. recall lines) precedes the JSON block.
+
+class CardStreamParser:
+    """Single-pass, incremental extraction of "Card Name": {...} entries.
+
+    feed() takes text chunks as they arrive and returns the (card_name, tags) pairs
+    completed by each one, so callers can forward cards before the response ends.
+    Recall prose is skipped: an object starts at the first "{" followed by a key or
+    "}" (mana symbols like "{T}" are not), whether or not it sits in a ``` fence.
+    An object that is already complete is decoded in one json call; otherwise each
+    entry's key and value are decoded as soon as they close.
+
+    If the text stops mid-object (e.g. max_tokens was hit), every entry closed so far
+    is still in `entries` and `truncated` is True. A chunk may end anywhere, even
+    inside a number or escape; only text that can never become valid JSON stops the
+    parse, and once inside an object that is final (`truncated` stays True), so nested
+    keys are never mistaken for cards. A top-level JSON array is kept whole in
+    `array` for list-shaped responses.
     """
-    fences = re.findall(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
-    for candidate in reversed(fences):
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._state = "seek"
+        self._key = None
+        self.entries = []
+        self.objects = 0
+        self.array = None
+
+    @property
+    def done(self) -> bool:
+        """At least one object has closed and none is open."""
+        return self.objects > 0 and self._state == "seek"
+
+    @property
+    def truncated(self) -> bool:
+        """An object was still open (or invalid) when the text ended."""
+        return self._state != "seek"
+
+    def feed(self, chunk: str) -> list:
+        self._buf += chunk
+        completed = []
+        while self._step(completed):
+            pass
+        # Keep only the unparsed tail
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        self.entries.extend(completed)
+        return completed
+
+    def _step(self, completed: list) -> bool:
+        """Advance past one token; return False when more input is needed."""
+        buf, pos, state = self._buf, self._pos, self._state
+
+        if state == "invalid":
+            self._pos = len(buf)
+            return False
+
+        if state == "seek":
+            m = _START_RE.search(buf, pos)
+            if m is None:
+                last = max(buf.rfind("{", pos), buf.rfind("[", pos))
+                self._pos = last if last != -1 and not buf[last + 1:].strip() else len(buf)
+                return False
+            if m.group()[0] == "{":
+                # Fast path: the whole object is already here (non-streamed responses)
+                try:
+                    obj, end = _decoder.raw_decode(buf, m.start())
+                except json.JSONDecodeError:
+                    self._pos, self._state = m.start() + 1, "key"
+                    return True
+                completed.extend(obj.items())
+                self.objects += 1
+                self._pos = end
+                return True
+            try:
+                array, end = _decoder.raw_decode(buf, m.start())
+            except json.JSONDecodeError as e:
+                if _input_ended(e, buf):
+                    self._pos = m.start()
+                    return False
+                self._pos = m.start() + 1
+                return True
+            self.array, self._pos = array, end
+            return True
+
+        pos = (_SEPARATOR_RE if state == "key" else _WHITESPACE_RE).match(buf, pos).end()
+        self._pos = pos
+        if pos >= len(buf):
+            return False
+        ch = buf[pos]
+
+        if state == "key":
+            if ch == "}":
+                self.objects += 1
+                self._pos, self._state = pos + 1, "seek"
+                return True
+            if ch != '"':
+                self._state = "invalid"
+                return True
+            try:
+                self._key, end = json.decoder.scanstring(buf, pos + 1)
+            except json.JSONDecodeError as e:
+                if _input_ended(e, buf):
+                    return False
+                self._state = "invalid"
+                return True
+            self._pos, self._state = end, "colon"
+            return True
+
+        if state == "colon":
+            if ch != ":":
+                self._state = "invalid"
+                return True
+            self._pos, self._state = pos + 1, "value"
+            return True
+
+        # state == "value"
         try:
-            return json.loads(candidate.strip())
-        except json.JSONDecodeError:
-            continue
-    return None
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if _input_ended(e, buf):
+                return False
+            self._state = "invalid"
+            return True
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and _NUMBER_CHARS_RE.fullmatch(buf, end):
+            return False  # more digits, a fraction or an exponent may follow in the next chunk
+        completed.append((self._key, value))
+        self._pos, self._state = end, "key"
+        return True
 
 
 def parse_claude_response(raw_text: str):
-    """Extract and parse JSON from the response; return raw string on failure."""
-    parsed = extract_fenced_json(raw_text)
-    if parsed is not None:
-        return parsed
-    text = strip_markdown_fences(raw_text)
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        return raw_text
+    """Extract and parse JSON from the response; return raw string on failure.
+
+    One pass with CardStreamParser: the card object (bare or fenced, after any recall
+    prose) becomes a dict; if the output was cut off, the cards completed before the
+    cut are returned. A list-shaped response is returned as the list.
+    """
+    parser = CardStreamParser()
+    entries = parser.feed(raw_text)
+    if entries or parser.done:
+        return dict(entries)
+    if parser.array is not None:
+        return parser.array
+    return raw_text
 
 
 DEFAULT_MODEL = "claude-opus-4-8"
 
 
-def call_claude(api_key: str, prompt: str, model: str = DEFAULT_MODEL, temperature: float = None, system: str = None):
+# --- Client registry ---
+#
+# One anthropic.Anthropic client (and so one httpx connection pool) per API key per
+# process, so repeat calls reuse warm keep-alive connections instead of paying a
+# fresh TCP/TLS handshake each time. Pool size, keep-alive and timeouts come from:
+#   ANTHROPIC_POOL_SIZE         max connections per client (default 20)
+#   ANTHROPIC_KEEPALIVE_EXPIRY  seconds an idle connection is kept (default 30)
+#   ANTHROPIC_TIMEOUT           read/write timeout in seconds (default 600)
+#   ANTHROPIC_CONNECT_TIMEOUT   connect timeout in seconds (default 10)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """Forked children (gunicorn workers) must not share the parent's sockets."""
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _new_client(api_key: str, max_retries: int = None) -> anthropic.Anthropic:
+    pool_size = int(os.environ.get("ANTHROPIC_POOL_SIZE", "") or 20)
+    keepalive_expiry = float(os.environ.get("ANTHROPIC_KEEPALIVE_EXPIRY", "") or 30)
+    timeout = httpx.Timeout(
+        float(os.environ.get("ANTHROPIC_TIMEOUT", "") or 600),
+        connect=float(os.environ.get("ANTHROPIC_CONNECT_TIMEOUT", "") or 10),
+    )
+    http_client = anthropic.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+    kwargs = {} if max_retries is None else {"max_retries": max_retries}
+    return anthropic.Anthropic(api_key=api_key, http_client=http_client, timeout=timeout, **kwargs)
+
+
+def get_client(api_key: str, max_retries: int = None) -> anthropic.Anthropic:
+    """Return this process's shared client for api_key, creating it on first use.
+
+    max_retries overrides the SDK's own retry count (None keeps its default).
+    Thread-safe; the registry is cleared in forked children.
+    """
+    key = (api_key, max_retries)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _new_client(api_key, max_retries)
+    return client
+
+
+def reset_clients():
+    """Drop all cached clients (used by tests and after configuration changes)."""
+    with _clients_lock:
+        _clients.clear()
+
+
+def call_claude(api_key: str, prompt: str, model: str = DEFAULT_MODEL, temperature: float = None, system=None,
+                usage: dict = None, max_retries: int = None):
     """Call the Anthropic API. Returns (result, error_response) tuple.
 
     On success: (parsed_result, None).
     On failure: (None, (error_dict, status_code)).
 
-    system: optional system prompt (e.g. to enforce JSON-only output).
+    system: optional system prompt (e.g. to enforce JSON-only output), or a list of
+            system blocks from build_cached_prompt.
+    usage: optional dict, filled with the response's token counts (including prompt
+           cache reads and writes).
+    max_retries: SDK retry count; pass 0 when the caller runs its own retry loop.
     """
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        kwargs = dict(model=model, max_tokens=16000, messages=[{"role": "user", "content": prompt}])
-        if temperature is not None:
-            kwargs["temperature"] = temperature
-        if system is not None:
-            kwargs["system"] = system
-        message = client.messages.create(**kwargs)
+        client = get_client(api_key, max_retries)
+        message = client.messages.create(**_message_kwargs(prompt, model, temperature, system))
+        if usage is not None:
+            usage.update(usage_counts(message))
         text_block = next((b for b in message.content if b.type == "text"), None)
         if text_block is None:
             return None, ({"error": f"No text block in response (blocks: {[b.type for b in message.content]})"}, 502)
         return parse_claude_response(text_block.text), None
-    except anthropic.AuthenticationError:
-        return None, ({"error": "Invalid API key"}, 401)
     except anthropic.APIError as e:
-        return None, ({"error": f"API error: {e.message}"}, 502)
+        return None, api_error_response(e)
+
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def add_usage(total: dict, usage: dict):
+    """Accumulate usage_counts() dicts into total."""
+    for field, value in usage.items():
+        total[field] = total.get(field, 0) + value
+
+
+def usage_counts(message) -> dict:
+    """Integer token counts from a response's usage block (missing counts are skipped)."""
+    counts = {}
+    for field in USAGE_FIELDS:
+        value = getattr(getattr(message, "usage", None), field, None)
+        if isinstance(value, int):
+            counts[field] = value
+    return counts
+
+
+def _message_kwargs(prompt, model: str, temperature: float = None, system=None) -> dict:
+    kwargs = dict(model=model, max_tokens=16000, messages=[{"role": "user", "content": prompt}])
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if system is not None:
+        kwargs["system"] = system
+    return kwargs
+
+
+# Upstream statuses worth retrying: timeouts, conflicts, rate limits, overload and server errors
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+
+
+def _retry_after(response) -> float:
+    """Seconds from a response's retry-after-ms / retry-after header, or None."""
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        try:
+            return float(headers.get(header)) / scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def api_error_response(e: anthropic.APIError):
+    """Translate an Anthropic SDK error into an (error_dict, status_code) pair.
+
+    Besides "error", the dict carries upstream_status (the API's HTTP status, None for
+    connection errors), retry_after (seconds, when the API sent one) and retryable,
+    for the batch pipeline's retries; app.py sends browsers only "error".
+    """
+    upstream_status = getattr(e, "status_code", None)
+    details = {
+        "upstream_status": upstream_status,
+        "retry_after": _retry_after(getattr(e, "response", None)),
+        "retryable": isinstance(e, anthropic.APIConnectionError) or upstream_status in RETRYABLE_STATUSES,
+    }
+    if isinstance(e, anthropic.AuthenticationError):
+        return {"error": "Invalid API key", **details}, 401
+    return {"error": f"API error: {e.message}", **details}, 502
+
+
+def stream_claude(api_key: str, prompt: str, model: str = DEFAULT_MODEL, temperature: float = None, system=None,
+                  usage: dict = None):
+    """Stream the response, yielding text chunks as they arrive.
+
+    Feed the chunks to a CardStreamParser to get cards as they complete. usage, if
+    given, is filled with the token counts once the stream ends.
+    Raises anthropic.APIError; see api_error_response.
+    """
+    with get_client(api_key).messages.stream(**_message_kwargs(prompt, model, temperature, system)) as stream:
+        yield from stream.text_stream
+        if usage is not None:
+            usage.update(usage_counts(stream.get_final_message()))
@@ -0,0 +1,56 @@
+"""PostgreSQL connection helper for the app's optional Postgres-backed stores.
+
+Also holds the pieces those stores share: run() for one transaction on a fresh
+connection, load_json() for JSON columns, and LazyStore for opening a store on
+first use.
+"""
+
+import json
+import os
+import threading
+
+import psycopg2
+
+
+def connect():
+    """Open a connection to the mtgcards database using the DB_* environment variables."""
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", 5432),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        dbname="mtgcards",
+    )
+
+
+def run(connect, fn):
+    """Call fn(cursor) in one transaction on a new connection from connect(); returns its result."""
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cur:
+            return fn(cur)
+    finally:
+        conn.close()
+
+
+def load_json(value):
+    """A JSON column's value: SQLite returns the text, psycopg2 already decodes JSONB."""
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class LazyStore:
+    """Base for fronts whose store is opened on first use, so importing the app
+    doesn't touch the database or create a SQLite file."""
+
+    def __init__(self, make_store):
+        self._make_store = make_store
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._make_store()
+        return self._store
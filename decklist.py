@@ -0,0 +1,97 @@
+"""Decklist parsing: turn pasted exports into one canonical line per card.
+
+Handles the text exports of Archidekt, Moxfield and MTGO (and anything close):
+
+    1x Sol Ring (cmr) 472 [Ramp] ^Have,#37d67a^     Archidekt
+    1 Sol Ring (CMR) 472 *F*                         Moxfield
+    1 Sol Ring                                       MTGO
+
+Quantities, set codes, collector numbers, foil markers, Archidekt categories and
+labels, section headers ("Commander", "SIDEBOARD:", ...) and comment lines are
+dropped. Cards are deduplicated by normalized name, and basic lands plus the
+KNOWN_LANDS that never carry a mechanic are removed, so none of it reaches the
+model. "Card Name | Oracle Text" lines keep their oracle text.
+"""
+
+import re
+
+# Land cards to exclude from analysis
+KNOWN_LANDS = frozenset({
+    # Basic lands
+    "Forest", "Island", "Mountain", "Plains", "Swamp",
+    # Non-basic lands
+    "Azorius Chancery", "Blossoming Sands", "Bonders' Enclave", "Buried Ruin",
+    "Canopy Vista", "Chamber of Manipulation", "Command Tower", "Cryptic Caves",
+    "Emergence Zone", "Evolving Wilds", "Fire Nation Palace", "Forge of Heroes",
+    "Gates of Istfell", "Glacial Floodplain", "Krosan Verge", "Minas Tirith",
+    "Mines of Moria", "Moorland Haunt", "Mosswort Bridge", "Myriad Landscape",
+    "Mystifying Maze", "Opal Palace", "Path of Ancestry", "Pit of Offerings",
+    "Reliquary Tower", "Restless Anchorage", "Rogue's Passage", "Sea of Clouds",
+    "Seaside Citadel", "Secret Tunnel", "Selesnya Sanctuary", "Simic Growth Chamber",
+    "Stirring Wildwood", "Terramorphic Expanse", "Thornwood Falls",
+    "Valakut, the Molten Pinnacle", "War Room", "Windbrisk Heights",
+})
+
+BASIC_LANDS = frozenset(
+    [name for basic in ("Plains", "Island", "Swamp", "Mountain", "Forest", "Wastes")
+     for name in (basic, f"Snow-Covered {basic}")]
+)
+
+# Trailing "(SET) 123", "*F*", "[Category]" and "^Label^" annotations, in any order
+_ANNOTATIONS_RE = re.compile(
+    r"(?:\s+\([A-Za-z0-9]{2,6}\)(?:\s+[\w★†-]+)?|\s+\*[A-Za-z]+\*|\s+\[[^\]]*\]|\s+\^[^^]*\^)+$"
+)
+_ANNOTATION_START_RE = re.compile(r"\s[(*[^]")
+_SECTIONS = frozenset({
+    "commander", "commanders", "companion", "deck", "main", "mainboard", "sideboard", "maybeboard",
+    "considering", "token", "tokens",
+})
+
+
+def normalize_card_name(name: str) -> str:
+    """Case- and whitespace-insensitive form of a card name."""
+    return " ".join(name.split()).casefold()
+
+
+_SKIPPED = frozenset(normalize_card_name(name) for name in KNOWN_LANDS | BASIC_LANDS)
+
+
+def parse_card_line(line: str):
+    """Split one card_data line into (card_name, oracle_text).
+
+    Accepts bare names, quantities ("1 Sol Ring", "1x Sol Ring"), the Archidekt and
+    Moxfield annotations above, and the "Card Name | Oracle Text" format used by the
+    oracle-text prompts.
+    """
+    name, _, oracle_text = line.strip().partition(" | ")
+    quantity, _, rest = name.partition(" ")
+    if quantity.rstrip("xX").isdigit():
+        name = rest
+    # Regexes are the slow part of a 10k-line paste: only try them where an annotation can start
+    for match in _ANNOTATION_START_RE.finditer(name):
+        if _ANNOTATIONS_RE.match(name, match.start()):
+            name = name[:match.start()]
+            break
+    return " ".join(name.replace("’", "'").split()), oracle_text.strip()
+
+
+def parse_decklist(text: str, canonical_name=None):
+    """Return the deck's cards as card_data lines, deduplicated and without basics.
+
+    canonical_name(name), if given, maps a parsed name to its proper spelling (or
+    None when unknown), e.g. CardDB.canonical_name.
+    """
+    lines, seen = [], set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("//", "#")) or line.rstrip(":").rstrip().casefold() in _SECTIONS:
+            continue
+        card_name, oracle_text = parse_card_line(line)
+        if canonical_name is not None:
+            card_name = canonical_name(card_name) or card_name
+        normalized = normalize_card_name(card_name)
+        if not normalized or normalized in seen or normalized in _SKIPPED:
+            continue
+        seen.add(normalized)
+        lines.append(f"{card_name} | {oracle_text}" if oracle_text else card_name)
+    return lines
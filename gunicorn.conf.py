@@ -0,0 +1,38 @@
+"""gunicorn settings for app:app (picked up automatically from the project root).
+
+An /analyze request spends nearly all of its 30-90 seconds waiting on the Anthropic
+API, so the default sync worker (one request per process, killed after 30s) starves
+after a couple of users. Workers here are threaded instead: each of WEB_CONCURRENCY
+processes serves GUNICORN_THREADS requests at once, and the blocking client calls
+release the GIL while they wait on the network.
+
+Environment:
+  WEB_CONCURRENCY         worker processes (default 2)
+  GUNICORN_WORKER_CLASS   gthread (default), gevent or sync
+  GUNICORN_THREADS        requests in flight per gthread worker (default 16)
+  GUNICORN_CONNECTIONS    requests in flight per gevent worker (default 200)
+  GUNICORN_TIMEOUT        seconds before a silent worker is restarted (default 180)
+  PORT                    listen port (default 5000)
+
+gevent: `pip install gevent`, then GUNICORN_WORKER_CLASS=gevent. gunicorn
+monkey-patches the standard library before loading the app, which makes the
+anthropic/httpx sync client, the shard thread pool (sharding.run_sharded) and
+psycopg2 waits cooperative, so one process holds hundreds of waiting analyses.
+Raise ANTHROPIC_POOL_SIZE (claude_utils.py) to match, or requests queue for a
+connection instead of a worker.
+
+bench/bench_concurrency.py measures how many concurrent analyses each mode sustains.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "") or 2)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "").strip() or "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "") or 16)
+worker_connections = int(os.environ.get("GUNICORN_CONNECTIONS", "") or 200)
+# Above the longest expected model call; gthread and gevent workers heartbeat while
+# requests wait, so this only catches genuinely stuck workers
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "") or 180)
+graceful_timeout = 60
+keepalive = 5
@@ -0,0 +1,251 @@
+"""Background jobs for /analyze: a job store plus a per-process worker pool.
+
+POST /analyze with "async": true answers right away with a job id; the analysis
+runs on a JobQueue thread and its response is written to the job store, where any
+gunicorn worker can serve GET /jobs/<id> and its SSE progress stream.
+
+A job is keyed by a hash of everything that determines its result. While a job is
+queued or running, submitting the same key again returns that job instead of
+starting another (a unique partial index on key makes this hold across workers).
+
+Stores:
+    SQLiteJobStore   — local file, shared by every worker on the machine (default)
+    PostgresJobStore — public.analysis_jobs in the existing database
+
+Select one with JOB_STORE_BACKEND=sqlite|postgres.
+"""
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+FINISHED = ("done", "failed")
+
+# A running job not updated for this long belonged to a worker that died
+DEFAULT_STALE_SECONDS = 15 * 60
+# Finished jobs are deleted after this long
+DEFAULT_TTL = 24 * 3600
+
+INTERRUPTED = {"error": "The analysis was interrupted. Please try again."}
+
+
+def _job_dict(row) -> dict:
+    job_id, status, done, total, http_status, response, created_at, updated_at = row
+    response = db.load_json(response)
+    return {
+        "id": job_id,
+        "status": status,
+        "done": done,
+        "total": total,
+        "http_status": http_status,
+        "response": response,
+        "created_at": created_at,
+        "updated_at": updated_at,
+    }
+
+
+_COLUMNS = "id, status, done, total, http_status, response, created_at, updated_at"
+
+
+class SQLiteJobStore:
+    """Jobs stored in a local SQLite file."""
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id          TEXT PRIMARY KEY,
+        key         TEXT NOT NULL,
+        status      TEXT NOT NULL,
+        done        INTEGER NOT NULL DEFAULT 0,
+        total       INTEGER NOT NULL DEFAULT 0,
+        http_status INTEGER,
+        response    TEXT,
+        created_at  REAL NOT NULL,
+        updated_at  REAL NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS analysis_jobs_active_key
+        ON analysis_jobs (key) WHERE status IN ('queued', 'running');
+    """
+
+    def __init__(self, path: str, stale_seconds: float = DEFAULT_STALE_SECONDS, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.executescript(self.CREATE_TABLE)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def submit(self, key: str):
+        """Return (job_id, created): a new queued job, or the active job with this key."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = 'failed', http_status = 500, response = ?, updated_at = ? "
+                "WHERE status IN ('queued', 'running') AND updated_at < ?",
+                (json.dumps(INTERRUPTED), now, now - self.stale_seconds),
+            )
+            conn.execute("DELETE FROM analysis_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                         (now - self.ttl,))
+            job_id = uuid.uuid4().hex
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO analysis_jobs (id, key, status, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, key, now, now),
+            ).rowcount
+            if inserted:
+                return job_id, True
+            row = conn.execute(
+                "SELECT id FROM analysis_jobs WHERE key = ? AND status IN ('queued', 'running')", (key,),
+            ).fetchone()
+        if row is None:
+            # The active job finished between the insert and the select
+            return self.submit(key)
+        return row[0], False
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {_COLUMNS} FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def update(self, job_id: str, status: str, done: int = None, total: int = None,
+               http_status: int = None, response: dict = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, done = COALESCE(?, done), total = COALESCE(?, total), "
+                "http_status = COALESCE(?, http_status), response = COALESCE(?, response), updated_at = ? "
+                "WHERE id = ?",
+                (status, done, total, http_status, json.dumps(response) if response is not None else None,
+                 time.time(), job_id),
+            )
+
+
+class PostgresJobStore:
+    """Jobs stored in public.analysis_jobs."""
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS public.analysis_jobs (
+        id          TEXT PRIMARY KEY,
+        key         TEXT NOT NULL,
+        status      TEXT NOT NULL,
+        done        INTEGER NOT NULL DEFAULT 0,
+        total       INTEGER NOT NULL DEFAULT 0,
+        http_status INTEGER,
+        response    JSONB,
+        created_at  DOUBLE PRECISION NOT NULL,
+        updated_at  DOUBLE PRECISION NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS analysis_jobs_active_key
+        ON public.analysis_jobs (key) WHERE status IN ('queued', 'running');
+    """
+
+    def __init__(self, connect=None, stale_seconds: float = DEFAULT_STALE_SECONDS, ttl: float = DEFAULT_TTL):
+        self._connect = connect or db.connect
+        self.stale_seconds = stale_seconds
+        self.ttl = ttl
+        self._run(lambda cur: cur.execute(self.CREATE_TABLE))
+
+    def _run(self, fn):
+        return db.run(self._connect, fn)
+
+    def submit(self, key: str):
+        """Return (job_id, created): a new queued job, or the active job with this key."""
+        now = time.time()
+
+        def submit(cur):
+            cur.execute(
+                "UPDATE public.analysis_jobs SET status = 'failed', http_status = 500, response = %s, updated_at = %s "
+                "WHERE status IN ('queued', 'running') AND updated_at < %s",
+                (json.dumps(INTERRUPTED), now, now - self.stale_seconds),
+            )
+            cur.execute("DELETE FROM public.analysis_jobs WHERE status IN ('done', 'failed') AND updated_at < %s",
+                        (now - self.ttl,))
+            cur.execute(
+                "INSERT INTO public.analysis_jobs (id, key, status, created_at, updated_at) "
+                "VALUES (%s, %s, 'queued', %s, %s) ON CONFLICT DO NOTHING RETURNING id",
+                (uuid.uuid4().hex, key, now, now),
+            )
+            row = cur.fetchone()
+            if row:
+                return row[0], True
+            cur.execute("SELECT id FROM public.analysis_jobs WHERE key = %s AND status IN ('queued', 'running')",
+                        (key,))
+            row = cur.fetchone()
+            return (row[0], False) if row else None
+
+        # None: the active job finished between the insert and the select
+        return self._run(submit) or self.submit(key)
+
+    def get(self, job_id: str):
+        def get(cur):
+            cur.execute(f"SELECT {_COLUMNS} FROM public.analysis_jobs WHERE id = %s", (job_id,))
+            return cur.fetchone()
+
+        row = self._run(get)
+        return _job_dict(row) if row else None
+
+    def update(self, job_id: str, status: str, done: int = None, total: int = None,
+               http_status: int = None, response: dict = None):
+        self._run(lambda cur: cur.execute(
+            "UPDATE public.analysis_jobs SET status = %s, done = COALESCE(%s, done), total = COALESCE(%s, total), "
+            "http_status = COALESCE(%s, http_status), response = COALESCE(%s::jsonb, response), updated_at = %s "
+            "WHERE id = %s",
+            (status, done, total, http_status, json.dumps(response) if response is not None else None,
+             time.time(), job_id),
+        ))
+
+
+# --- Worker pool ---
+
+
+class JobQueue(db.LazyStore):
+    """Runs submitted jobs on a thread pool, recording progress and results in the store
+    (opened on first use)."""
+
+    def __init__(self, make_store, max_workers: int = 4):
+        super().__init__(make_store)
+        self.max_workers = max_workers
+        self._pool = None
+
+    def submit(self, key: str, work):
+        """Queue work(report_progress) -> (response dict, http status) under key.
+
+        Returns (job_id, created); when a job with the same key is already queued or
+        running, work is not run and that job's id comes back with created=False.
+        """
+        job_id, created = self.store.submit(key)
+        if created:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analysis-job")
+            self._pool.submit(self._run, job_id, work)
+        return job_id, created
+
+    def _run(self, job_id: str, work):
+        store = self.store
+        store.update(job_id, "running")
+        try:
+            response, http_status = work(lambda done, total: store.update(job_id, "running", done=done, total=total))
+        except Exception as e:
+            response, http_status = {"error": f"Analysis failed: {e}"}, 500
+        store.update(job_id, "done" if http_status < 400 else "failed", http_status=http_status, response=response)
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+
+def make_job_queue_from_env() -> JobQueue:
+    """Build the configured job queue; the store itself is opened on first use."""
+    backend_name = os.environ.get("JOB_STORE_BACKEND", "sqlite").strip().lower() or "sqlite"
+    max_workers = int(os.environ.get("JOB_WORKERS", "") or 4)
+    if backend_name == "sqlite":
+        path = os.environ.get("JOB_STORE_PATH", "") or "jobs.sqlite3"
+        return JobQueue(lambda: SQLiteJobStore(path), max_workers=max_workers)
+    if backend_name == "postgres":
+        return JobQueue(PostgresJobStore, max_workers=max_workers)
+    raise ValueError(f"Unknown JOB_STORE_BACKEND: {backend_name!r}")
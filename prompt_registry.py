@@ -0,0 +1,82 @@
+"""In-memory registry of prompt templates loaded from prompts/*.md.
+
+Each template is read once, hashed and pre-split around its placeholders; later
+lookups only stat the file and reload it when its mtime or size changes, so edits to
+a prompt are picked up without restarting the server.
+"""
+
+import os
+import re
+import threading
+
+from claude_utils import split_template
+from result_cache import content_hash
+
+PROMPT_NAME_RE = re.compile(r"[\w\-]+")
+
+
+class PromptTemplate:
+    """A loaded template: its text, content hash and placeholder split."""
+
+    def __init__(self, name: str, path: str, text: str, stamp: tuple):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.hash = content_hash(text)
+        self.parts = split_template(text)
+        self.stamp = stamp
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "hash": self.hash, "modified": self.stamp[0] / 1e9}
+
+
+class PromptRegistry:
+    """Thread-safe cache of PromptTemplates keyed by file path, invalidated by mtime."""
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: str):
+        """Return the PromptTemplate at path, or None if the file does not exist."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._templates.get(path)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+        with open(path) as f:
+            text = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        template = PromptTemplate(name, path, text, stamp)
+        with self._lock:
+            self._templates[path] = template
+        return template
+
+    def get(self, directory: str, name: str):
+        """Return prompt <name>.md from directory, or None if it does not exist.
+
+        Raises ValueError for names that are not plain file stems.
+        """
+        if not PROMPT_NAME_RE.fullmatch(name):
+            raise ValueError(f"Invalid prompt name: {name!r}")
+        return self.load(os.path.join(directory, name + ".md"))
+
+    def list(self, directory: str) -> list:
+        """All templates in directory that contain CARD_LIST_PLACEHOLDER, sorted by name."""
+        templates = []
+        for filename in sorted(os.listdir(directory)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".md" or not PROMPT_NAME_RE.fullmatch(name):
+                continue
+            template = self.load(os.path.join(directory, filename))
+            if template is not None and "CARD_LIST_PLACEHOLDER" in template.parts:
+                templates.append(template)
+        return templates
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
@@ -0,0 +1,264 @@
+"""Card-level result cache in front of /analyze.
+
+Each tagged card is cached under (normalized card name, oracle text hash, prompt
+template hash, mechanics hash, model), so staples shared between decklists are only
+sent to the model once per prompt/mechanics/model combination.
+
+Backends:
+    MemoryBackend   — in-process LRU with TTL (default)
+    SQLiteBackend   — local file, shared by every worker on the machine
+    PostgresBackend — public.result_cache in the existing database
+
+Select one with RESULT_CACHE_BACKEND=memory|sqlite|postgres|off. The Postgres
+backend is opened on first use, and a backend that fails is treated as a miss.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import db
+from decklist import normalize_card_name, parse_card_line
+
+
+def content_hash(text: str) -> str:
+    """Stable hex digest of a piece of prompt content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(card_name: str, oracle_text: str, template_hash: str, mechanics_hash: str, model: str) -> str:
+    parts = (normalize_card_name(card_name), content_hash(oracle_text), template_hash, mechanics_hash, model)
+    return content_hash("\x1f".join(parts))
+
+
+# --- Backends ---
+
+
+class MemoryBackend:
+    """In-process LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, card_name, tags = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = (card_name, tags)
+        return found
+
+    def set_many(self, entries):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for entry in entries:
+                self._entries[entry["key"]] = (expires_at, entry["card_name"], entry["tags"])
+                self._entries.move_to_end(entry["key"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """Cache stored in a local SQLite file."""
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS card_cache (
+        key        TEXT PRIMARY KEY,
+        card_name  TEXT NOT NULL,
+        tags       TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path: str, ttl: float = 30 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(self.CREATE_TABLE)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT key, card_name, tags FROM card_cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                (*keys, time.time() - self.ttl),
+            ).fetchall()
+        return {key: (card_name, json.loads(tags)) for key, card_name, tags in rows}
+
+    def set_many(self, entries):
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO card_cache (key, card_name, tags, created_at) VALUES (?, ?, ?, ?)",
+                [(e["key"], e["card_name"], json.dumps(e["tags"]), now) for e in entries],
+            )
+
+
+class PostgresBackend:
+    """Cache stored in public.result_cache.
+
+    Kept apart from public.labeled, which holds the batch-labeling results that the
+    queue filters, dead-letter resolution and reports read.
+    """
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS public.result_cache (
+        cache_key   TEXT PRIMARY KEY,
+        card_name   TEXT NOT NULL,
+        prompt_file TEXT NOT NULL,
+        model       TEXT NOT NULL,
+        raw_json    JSONB NOT NULL,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+    """
+
+    def __init__(self, connect=None):
+        self._connect = connect or db.connect
+        self._run(lambda cur: cur.execute(self.CREATE_TABLE))
+
+    def _run(self, fn):
+        return db.run(self._connect, fn)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        def get_many(cur):
+            cur.execute(
+                "SELECT cache_key, card_name, raw_json FROM public.result_cache WHERE cache_key = ANY(%s)",
+                (keys,),
+            )
+            return cur.fetchall()
+
+        return {key: (card_name, db.load_json(raw_json)) for key, card_name, raw_json in self._run(get_many)}
+
+    def set_many(self, entries):
+        import psycopg2.extras
+
+        # ON CONFLICT DO UPDATE can't touch the same row twice in one statement; keep the last entry
+        entries = {e["key"]: e for e in entries}.values()
+        self._run(lambda cur: psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO public.result_cache (cache_key, card_name, prompt_file, model, raw_json) VALUES %s "
+            "ON CONFLICT (cache_key) DO UPDATE SET card_name = EXCLUDED.card_name, "
+            "raw_json = EXCLUDED.raw_json, created_at = NOW()",
+            [(e["key"], e["card_name"], e["prompt_file"], e["model"], json.dumps(e["tags"])) for e in entries],
+        ))
+
+
+class LazyBackend(db.LazyStore):
+    """Front for a backend (e.g. PostgresBackend) opened on first use."""
+
+    def get_many(self, keys):
+        return self.store.get_many(keys)
+
+    def set_many(self, entries):
+        self.store.set_many(entries)
+
+
+# --- Cache front end ---
+
+
+class CardResultCache:
+    """Splits pasted card data into cached and uncached cards and records fresh results."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def partition(self, card_data: str, template: str, mechanics: str, model: str, template_hash: str = None):
+        """Return (cached, uncached_lines, pending).
+
+        template_hash may be passed when the caller already has it (see prompt_registry).
+
+        cached:         {card_name: tags} for cards already tagged under this
+                        prompt/mechanics/model.
+        uncached_lines: original card_data lines that still need the model.
+        pending:        {normalized name: cache key} for store().
+        """
+        template_hash = template_hash or content_hash(template)
+        mechanics_hash = content_hash(mechanics)
+
+        lines_by_key = OrderedDict()
+        pending = {}
+        for line in card_data.splitlines():
+            if not line.strip():
+                continue
+            card_name, oracle_text = parse_card_line(line)
+            normalized = normalize_card_name(card_name)
+            if normalized in pending:
+                continue
+            key = cache_key(card_name, oracle_text, template_hash, mechanics_hash, model)
+            pending[normalized] = key
+            lines_by_key[key] = line.strip()
+
+        try:
+            hits = self.backend.get_many(lines_by_key)
+        except Exception as e:
+            print(f"Result cache lookup failed, treating as a miss: {e}", file=sys.stderr)
+            hits = {}
+        cached = {card_name: tags for card_name, tags in hits.values()}
+        uncached_lines = [line for key, line in lines_by_key.items() if key not in hits]
+        pending = {name: key for name, key in pending.items() if key not in hits}
+        return cached, uncached_lines, pending
+
+    def store(self, result: dict, pending: dict, model: str, prompt_file: str):
+        """Cache every card in the model's result that was requested in pending."""
+        entries = []
+        for card_name, tags in result.items():
+            key = pending.get(normalize_card_name(card_name))
+            if key is None or not isinstance(tags, dict):
+                continue
+            entries.append({
+                "key": key,
+                "card_name": card_name,
+                "tags": tags,
+                "model": model,
+                "prompt_file": prompt_file,
+            })
+        if not entries:
+            return
+        try:
+            self.backend.set_many(entries)
+        except Exception as e:
+            print(f"Result cache write failed: {e}", file=sys.stderr)
+
+
+def make_cache_from_env():
+    """Build the configured cache, or None when RESULT_CACHE_BACKEND=off."""
+    backend_name = os.environ.get("RESULT_CACHE_BACKEND", "memory").strip().lower() or "memory"
+    if backend_name == "off":
+        return None
+    if backend_name == "memory":
+        max_entries = int(os.environ.get("RESULT_CACHE_SIZE", "") or 10_000)
+        ttl = float(os.environ.get("RESULT_CACHE_TTL", "") or 7 * 24 * 3600)
+        return CardResultCache(MemoryBackend(max_entries=max_entries, ttl=ttl))
+    if backend_name == "sqlite":
+        path = os.environ.get("RESULT_CACHE_PATH", "") or "result_cache.sqlite3"
+        ttl = float(os.environ.get("RESULT_CACHE_TTL", "") or 30 * 24 * 3600)
+        return CardResultCache(SQLiteBackend(path, ttl=ttl))
+    if backend_name == "postgres":
+        return CardResultCache(LazyBackend(PostgresBackend))
+    raise ValueError(f"Unknown RESULT_CACHE_BACKEND: {backend_name!r}")
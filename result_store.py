@@ -0,0 +1,131 @@
+"""Stored /analyze results, addressed by content.
+
+A finished analysis is saved under result_id(): a hash of the normalized card list,
+mechanics, prompt template and model. The same deck analyzed the same way always
+gets the same id, so repeating it (from any worker) returns the stored result
+without a model call, and GET /r/<id> serves it to page reloads and shared links.
+A stored result never changes, so it can be cached forever.
+
+Stores:
+    SQLiteResultStore   — local file, shared by every worker on the machine (default)
+    PostgresResultStore — public.analysis_results in the existing database
+
+Select one with RESULT_STORE_BACKEND=sqlite|postgres|off.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+import db
+from decklist import normalize_card_name, parse_card_line
+from result_cache import content_hash
+
+RESULT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def result_id(card_data: str, mechanics: str, template_hash: str, model: str) -> str:
+    """Content-addressed id of an analysis; card order, case and duplicates don't matter."""
+    cards = set()
+    for line in card_data.splitlines():
+        card_name, oracle_text = parse_card_line(line)
+        if card_name:
+            cards.add(f"{normalize_card_name(card_name)} | {oracle_text}")
+    parts = ("\n".join(sorted(cards)), content_hash(mechanics), template_hash, model)
+    return content_hash("\x1f".join(parts))[:32]
+
+
+class SQLiteResultStore:
+    """Results stored in a local SQLite file."""
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        id         TEXT PRIMARY KEY,
+        response   TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(self.CREATE_TABLE)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, result_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT response FROM analysis_results WHERE id = ?", (result_id,)).fetchone()
+        return db.load_json(row[0]) if row else None
+
+    def put(self, result_id: str, response: dict):
+        """Save a result; the first one stored under an id is kept."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO analysis_results (id, response, created_at) VALUES (?, ?, ?)",
+                (result_id, json.dumps(response), time.time()),
+            )
+
+
+class PostgresResultStore:
+    """Results stored in public.analysis_results."""
+
+    CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS public.analysis_results (
+        id         TEXT PRIMARY KEY,
+        response   JSONB NOT NULL,
+        created_at DOUBLE PRECISION NOT NULL
+    )
+    """
+
+    def __init__(self, connect=None):
+        self._connect = connect or db.connect
+        self._run(lambda cur: cur.execute(self.CREATE_TABLE))
+
+    def _run(self, fn):
+        return db.run(self._connect, fn)
+
+    def get(self, result_id: str):
+        def get(cur):
+            cur.execute("SELECT response FROM public.analysis_results WHERE id = %s", (result_id,))
+            return cur.fetchone()
+
+        row = self._run(get)
+        return db.load_json(row[0]) if row else None
+
+    def put(self, result_id: str, response: dict):
+        """Save a result; the first one stored under an id is kept."""
+        self._run(lambda cur: cur.execute(
+            "INSERT INTO public.analysis_results (id, response, created_at) VALUES (%s, %s, %s) "
+            "ON CONFLICT (id) DO NOTHING",
+            (result_id, json.dumps(response), time.time()),
+        ))
+
+
+class ResultStore(db.LazyStore):
+    """Front for a result store (opened on first use)."""
+
+    def get(self, result_id: str):
+        """The stored response for result_id, or None."""
+        if not RESULT_ID_RE.match(result_id):
+            return None
+        return self.store.get(result_id)
+
+    def put(self, result_id: str, response: dict):
+        self.store.put(result_id, response)
+
+
+def make_result_store_from_env():
+    """Build the configured result store, or None when RESULT_STORE_BACKEND=off."""
+    backend_name = os.environ.get("RESULT_STORE_BACKEND", "sqlite").strip().lower() or "sqlite"
+    if backend_name == "off":
+        return None
+    if backend_name == "sqlite":
+        path = os.environ.get("RESULT_STORE_PATH", "") or "results.sqlite3"
+        return ResultStore(lambda: SQLiteResultStore(path))
+    if backend_name == "postgres":
+        return ResultStore(PostgresResultStore)
+    raise ValueError(f"Unknown RESULT_STORE_BACKEND: {backend_name!r}")
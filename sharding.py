@@ -0,0 +1,79 @@
+"""Adaptive splitting of large card lists into concurrent sub-requests.
+
+Output tokens dominate model latency and a single response is capped at max_tokens,
+so large pastes are split into shards that are analyzed in parallel and merged. The
+shard size comes from the output tokens per card observed on earlier responses for
+the same prompt and model, aiming each shard at a fixed output budget.
+
+Configuration:
+    SHARD_TARGET_OUTPUT_TOKENS  output tokens to aim for per shard (default 2000)
+    SHARD_MAX_CONCURRENCY       shards in flight per request (default 4)
+"""
+
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ShardSizer:
+    """Cards-per-shard chooser driven by an EWMA of output tokens per card."""
+
+    def __init__(self, target_output_tokens: int = 2000, initial_tokens_per_card: float = 20.0,
+                 min_cards: int = 15, max_cards: int = 100, alpha: float = 0.3):
+        self.target_output_tokens = target_output_tokens
+        self.tokens_per_card = initial_tokens_per_card
+        self.min_cards = min_cards
+        self.max_cards = max_cards
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def observe(self, cards: int, output_tokens: int):
+        """Fold one response's output tokens per card into the estimate."""
+        if cards <= 0 or output_tokens <= 0:
+            return
+        with self._lock:
+            self.tokens_per_card += self.alpha * (output_tokens / cards - self.tokens_per_card)
+
+    def shard_size(self) -> int:
+        size = int(self.target_output_tokens / max(self.tokens_per_card, 1e-6))
+        return max(self.min_cards, min(self.max_cards, size))
+
+    def split(self, lines: list) -> list:
+        """Split lines into evenly sized shards no larger than shard_size()."""
+        n_shards = max(1, math.ceil(len(lines) / self.shard_size()))
+        per_shard = math.ceil(len(lines) / n_shards)
+        return [lines[i:i + per_shard] for i in range(0, len(lines), per_shard)]
+
+
+_sizers = {}
+_sizers_lock = threading.Lock()
+
+
+def sizer_for(prompt_label: str, model: str) -> ShardSizer:
+    """The process-wide ShardSizer for a prompt/model pair."""
+    key = (prompt_label, model)
+    with _sizers_lock:
+        if key not in _sizers:
+            target = int(os.environ.get("SHARD_TARGET_OUTPUT_TOKENS", "") or 2000)
+            _sizers[key] = ShardSizer(target_output_tokens=target)
+        return _sizers[key]
+
+
+def reset_sizers():
+    """Forget all observed token rates (used by tests)."""
+    with _sizers_lock:
+        _sizers.clear()
+
+
+def run_sharded(shards: list, analyze_shard):
+    """Run analyze_shard(shard) -> (result, error, usage) over shards concurrently.
+
+    Returns a list of (shard, result, error, usage) in shard order.
+    """
+    if len(shards) == 1:
+        return [(shards[0], *analyze_shard(shards[0]))]
+    max_workers = min(len(shards), int(os.environ.get("SHARD_MAX_CONCURRENCY", "") or 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        outcomes = list(pool.map(analyze_shard, shards))
+    return [(shard, *outcome) for shard, outcome in zip(shards, outcomes)]
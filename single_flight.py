@@ -0,0 +1,154 @@
+"""Single-flight deduplication of identical model calls.
+
+When several users paste the same decklist at once, each /analyze would make the
+same model call. SingleFlight.do(key, fn) runs fn once per key at a time: callers
+arriving while it runs wait and share its value.
+
+Within a process, waiters block on the leader's Future. Across gunicorn workers,
+the leader holds an fcntl lock on <lock_dir>/<key>.lock and leaves its value in
+<key>.json under a fresh random token; a worker that was waiting on the lock reads
+that file instead of calling again if the token changed while it waited (so a value
+from an earlier call is never reused, whatever the filesystem's timestamp
+resolution). Either way only values passing shareable() are handed on. Later repeats
+are the per-card result cache's job, so value files are deleted after result_ttl.
+
+fcntl is POSIX-only; elsewhere, and with lock_dir=None, only in-process calls are
+coalesced.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from result_cache import content_hash
+
+
+def request_key(prompt: str, model: str, temperature=None, system=None) -> str:
+    """Key for a model call: identical prompt, system blocks, model and temperature."""
+    return content_hash(json.dumps([prompt, system, model, temperature], sort_keys=True))
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: str = None, result_ttl: float = 60, lock_timeout: float = 600,
+                 poll_interval: float = 0.05):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, shareable=None):
+        """Return (value, shared): fn()'s value, shared=True when another caller ran it.
+
+        Only values passing shareable(value) (default: all) are handed to other
+        callers; a waiter given anything else makes the call again itself. Values
+        shared across workers must be JSON-serializable and come back decoded from
+        JSON. An exception from fn is raised in every in-process waiter.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            value = future.result()
+            if shareable is None or shareable(value):
+                return value, True
+            return self.do(key, fn, shareable)
+
+        try:
+            value, shared = self._do_across_workers(key, fn, shareable)
+            future.set_result(value)
+            return value, shared
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _do_across_workers(self, key: str, fn, shareable):
+        if not self.lock_dir:
+            return fn(), False
+        # Created on first use, so importing the app doesn't create it
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, key)
+        token_before, _ = self._read(path + ".json")
+        with open(path + ".lock", "a") as lock_file:
+            locked = self._acquire(lock_file)
+            if locked:
+                # Keeps _prune from deleting a lock file that is in use
+                os.utime(path + ".lock")
+            try:
+                token, value = self._read(path + ".json")
+                if token is not None and token != token_before:
+                    return value, True
+                value = fn()
+                if shareable is None or shareable(value):
+                    self._write(path + ".json", value)
+                return value, False
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file) -> bool:
+        """Take the lock, polling without blocking so gevent workers keep serving.
+
+        Gives up after lock_timeout (a hung leader shouldn't hang everyone) and runs unlocked.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(self.poll_interval)
+
+    def _read(self, path: str):
+        """(token, value) of the last value written for a key, or (None, None)."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry["token"], entry["value"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def _write(self, path: str, value):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"token": uuid.uuid4().hex, "value": value}, f)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self):
+        """Delete expired values, and lock files nobody has used for a day."""
+        now = time.time()
+        for entry in os.scandir(self.lock_dir):
+            max_age = self.result_ttl if entry.name.endswith(".json") else 24 * 3600
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def make_single_flight_from_env():
+    """Build the configured SingleFlight, or None when SINGLE_FLIGHT=off."""
+    if os.environ.get("SINGLE_FLIGHT", "").strip().lower() == "off":
+        return None
+    lock_dir = os.environ.get("SINGLE_FLIGHT_DIR", "").strip()
+    if not lock_dir:
+        lock_dir = os.path.join(tempfile.gettempdir(), "mtg-tagger-single-flight")
+    return SingleFlight(lock_dir)
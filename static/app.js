@@ -16,6 +16,8 @@ const STRINGS = {
     unexpectedError:  "An unexpected error occurred.",
     renderError:      "Error rendering results: ",
     networkError:     "Network error: could not reach the server.",
+    jobProgress:      (done, total) => total ? `Analyzing... ${done}/${total} batches` : "Queued...",
+    resultNotFound:   "That saved result is no longer available.",
     mechanicsFallback: '- ramp: Accelerates your mana production...\n- card_advantage: Net positive card advantage...',
 };
 // ────────────────────────────────────────────────────────────────────────────
@@ -49,6 +51,9 @@ let renderFiltersFn = null;
 const scryfallCache = {};
 const scryfallQueue = [];
 let scryfallRunning = false;
+const artBatch = new Map();
+let artBatchTimer = null;
+let artProxyAvailable = true;
 
 // Filter state
 const filterState = {
@@ -56,6 +61,9 @@ const filterState = {
     tiers: new Set(),
     searchText: ""
 };
+const SEARCH_DEBOUNCE_MS = 150;
+let searchTimer = null;
+let filterIndex = null;
 
 function hasActiveFilters() {
     return filterState.mechanics.size > 0 ||
@@ -63,39 +71,147 @@ function hasActiveFilters() {
            filterState.searchText.trim() !== "";
 }
 
-function applyFilters(rows) {
-    if (!hasActiveFilters()) {
-        return rows;
-    }
+// Lookups over the result rows, built once per result so that a filter change is
+// a few set intersections instead of a pass over every row
+function buildFilterIndex(rows) {
+    const index = {
+        rows: rows,
+        byMechanic: new Map(),
+        byTier: new Map(),
+        names: buildNameIndex(rows),
+        sortOrders: {}
+    };
+    rows.forEach((row, id) => {
+        addToIndex(index.byMechanic, row.mechanic, id);
+        addToIndex(index.byTier, row.tierRankVal, id);
+    });
+    return index;
+}
 
-    return rows.filter(row => {
-        // Mechanic filter (OR logic within mechanics)
-        const mechMatch = filterState.mechanics.size === 0 ||
-                         filterState.mechanics.has(row.mechanic);
+function addToIndex(map, key, id) {
+    if (!map.has(key)) map.set(key, new Set());
+    map.get(key).add(id);
+}
 
-        // Tier filter (OR logic within tiers)
-        const tierMatch = filterState.tiers.size === 0 ||
-                         filterState.tiers.has(row.tierRankVal);
+// Distinct lowercased card names, each with the rows that carry it, so a search
+// tests each name once however many mechanic rows it has
+function buildNameIndex(rows) {
+    const idsByName = new Map();
+    rows.forEach((row, id) => {
+        const name = row.card.toLowerCase();
+        if (!idsByName.has(name)) idsByName.set(name, []);
+        idsByName.get(name).push(id);
+    });
+    return { names: [...idsByName], lastQuery: null, lastMatches: null };
+}
 
-        // Search filter (AND logic for card name)
-        const searchMatch = filterState.searchText === "" ||
-                           row.card.toLowerCase().includes(
-                               filterState.searchText.toLowerCase()
-                           );
+// Rows whose card name contains text anywhere, case-insensitively (as the
+// unindexed filter did). While typing extends the previous query, only its
+// matches are tested again
+function searchNames(nameIndex, text) {
+    const query = text.toLowerCase();
+    const candidates = nameIndex.lastQuery !== null && query.startsWith(nameIndex.lastQuery)
+        ? nameIndex.lastMatches
+        : nameIndex.names;
+    const matches = candidates.filter(([name]) => name.includes(query));
+    nameIndex.lastQuery = query;
+    nameIndex.lastMatches = matches;
+    return matches.flatMap(([, ids]) => ids);
+}
 
-        // Combine with AND logic between filter types
-        return mechMatch && tierMatch && searchMatch;
-    });
+// Ids of the rows that pass the filters (OR within mechanics and within tiers,
+// AND between filter types), or null when no filter is active
+function matchingRowIds() {
+    if (!filterIndex || !hasActiveFilters()) return null;
+    const sets = [];
+    if (filterState.mechanics.size > 0) sets.push(unionOf(filterIndex.byMechanic, filterState.mechanics));
+    if (filterState.tiers.size > 0) sets.push(unionOf(filterIndex.byTier, filterState.tiers));
+    if (filterState.searchText !== "") sets.push(new Set(searchNames(filterIndex.names, filterState.searchText)));
+
+    sets.sort((a, b) => a.size - b.size);
+    const [smallest, ...others] = sets;
+    const matches = new Set();
+    for (const id of smallest) {
+        if (others.every(set => set.has(id))) matches.add(id);
+    }
+    return matches;
+}
+
+function unionOf(index, keys) {
+    const ids = new Set();
+    for (const key of keys) {
+        for (const id of index.get(key) || []) ids.add(id);
+    }
+    return ids;
+}
+
+// Row ids in table order for a sort column and direction, sorted once per result
+function sortedRowIds(col, asc) {
+    const key = `${col}:${asc}`;
+    if (!filterIndex.sortOrders[key]) {
+        const rows = filterIndex.rows;
+        let compare;
+        if (col === "card") {
+            compare = (a, b) => rows[a].card.localeCompare(rows[b].card);
+        } else if (col === "mechanic") {
+            compare = (a, b) => rows[a].mechanicLabel.localeCompare(rows[b].mechanicLabel);
+        } else {
+            compare = (a, b) => rows[a].tierRankVal - rows[b].tierRankVal;
+        }
+        filterIndex.sortOrders[key] = rows.map((_, id) => id).sort((a, b) => asc ? compare(a, b) : -compare(a, b));
+    }
+    return filterIndex.sortOrders[key];
 }
 
 function clearAllFilters() {
     filterState.mechanics.clear();
     filterState.tiers.clear();
     filterState.searchText = "";
+    clearTimeout(searchTimer);
     const searchInput = document.getElementById("card-search");
     if (searchInput) searchInput.value = "";
 }
 
+function onFiltersChanged() {
+    if (renderFiltersFn) renderFiltersFn();
+    renderActiveView();
+}
+
+// The filter bar is built once; its handlers read the module-level filter state,
+// so re-rendering the chips (or streaming in more results) keeps the search box and its focus
+function buildFilterBar(filtersEl) {
+    filtersEl.innerHTML = '<div class="filter-header">' +
+        `<input type="text" id="card-search" class="card-search" placeholder="${STRINGS.searchPlaceholder}">` +
+        `<button id="clear-filters" class="clear-filters-btn">${STRINGS.clearFilters}</button>` +
+        '</div>' +
+        '<div class="category-counts" id="filter-chips"></div>' +
+        '<p class="filter-info" id="filter-info"></p>';
+
+    document.getElementById("card-search").addEventListener("input", (e) => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            filterState.searchText = e.target.value.trim();
+            onFiltersChanged();
+        }, SEARCH_DEBOUNCE_MS);
+    });
+
+    document.getElementById("clear-filters").addEventListener("click", () => {
+        clearAllFilters();
+        onFiltersChanged();
+    });
+
+    document.getElementById("filter-chips").addEventListener("click", (e) => {
+        const chip = e.target.closest(".count-chip, .tier-filter");
+        if (!chip) return;
+        const [selected, value] = chip.dataset.mechanic !== undefined
+            ? [filterState.mechanics, chip.dataset.mechanic]
+            : [filterState.tiers, parseInt(chip.dataset.tier)];
+        if (selected.has(value)) { selected.delete(value); }
+        else { selected.add(value); }
+        onFiltersChanged();
+    });
+}
+
 function switchView(view) {
     currentView = view;
     document.getElementById("tab-table").classList.toggle("active", view === "table");
@@ -170,10 +286,10 @@ function dismissError() {
 errorDismiss.addEventListener("click", dismissError);
 errorEl.addEventListener("click", dismissError);
 
+const ESCAPES = { "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" };
+
 function esc(str) {
-    const d = document.createElement("div");
-    d.textContent = str;
-    return d.innerHTML;
+    return String(str).replace(/[&<>"']/g, ch => ESCAPES[ch]);
 }
 
 function tierBadgeClass(tier) {
@@ -192,9 +308,11 @@ function tierRank(tier) {
     return ranks[t] !== undefined ? ranks[t] : 6;
 }
 
-function renderResults(data) {
+// incremental: re-render a result that is still streaming in, keeping the
+// user's filters, view and selected card
+function renderResults(data, incremental = false) {
     // Reset filters when new data arrives
-    clearAllFilters();
+    if (!incremental) clearAllFilters();
 
     // If the API returned a plain string, show it as raw text
     if (typeof data === "string") {
@@ -231,6 +349,7 @@ function renderResults(data) {
     }
     lastRows = rows;
     noMechCountGlobal = noMechCount;
+    filterIndex = buildFilterIndex(rows);
 
     // Category counts with mechanic key mapping
     const counts = {};
@@ -247,16 +366,10 @@ function renderResults(data) {
 
     function renderFilters() {
         const filtersEl = document.getElementById("results-filters");
-        const filteredRows = applyFilters(rows);
-
-        // Filter header with search and clear button
-        let html = '<div class="filter-header">';
-        html += `<input type="text" id="card-search" class="card-search" placeholder="${STRINGS.searchPlaceholder}">`;
-        html += `<button id="clear-filters" class="clear-filters-btn" style="display: ${hasActiveFilters() ? 'inline-block' : 'none'}">${STRINGS.clearFilters}</button>`;
-        html += '</div>';
+        if (!document.getElementById("card-search")) buildFilterBar(filtersEl);
 
         // Category counts
-        html += '<div class="category-counts">';
+        let html = '';
         for (const [label, count] of countsSorted) {
             const mechKey = mechanicKeyMap[label];
             const isActive = filterState.mechanics.has(mechKey);
@@ -277,58 +390,48 @@ function renderResults(data) {
             const isActive = filterState.tiers.has(tier.rank);
             html += `<span class="badge tier-filter ${tier.class}${isActive ? ' active' : ''}" data-tier="${tier.rank}">${tier.label}</span>`;
         }
-        html += '</div></div>'; // tier-filters, category-counts
-
-        if (hasActiveFilters() && filteredRows.length < rows.length) {
-            html += `<p class="filter-info">${STRINGS.showingXofY(filteredRows.length, rows.length)}</p>`;
-        }
-
-        filtersEl.innerHTML = html;
-        attachFilterHandlers();
+        html += '</div>'; // tier-filters
+        document.getElementById("filter-chips").innerHTML = html;
+
+        const matches = matchingRowIds();
+        const filterInfo = document.getElementById("filter-info");
+        const showInfo = matches !== null && matches.size < rows.length;
+        filterInfo.textContent = showInfo ? STRINGS.showingXofY(matches.size, rows.length) : "";
+        filterInfo.style.display = showInfo ? "" : "none";
+        document.getElementById("clear-filters").style.display = hasActiveFilters() ? "inline-block" : "none";
     }
 
     function renderTable() {
-        const filteredRows = applyFilters(rows);
-        filteredRows.sort((a, b) => {
-            let cmp = 0;
-            if (sortCol === "card") {
-                cmp = a.card.localeCompare(b.card);
-            } else if (sortCol === "mechanic") {
-                cmp = a.mechanicLabel.localeCompare(b.mechanicLabel);
-            } else {
-                cmp = a.tierRankVal - b.tierRankVal;
-            }
-            return sortAsc ? cmp : -cmp;
-        });
+        const matches = matchingRowIds();
+        const order = sortedRowIds(sortCol, sortAsc);
+        const ids = matches ? order.filter(id => matches.has(id)) : order;
 
         const arrow = sortAsc ? "▲" : "▼";
         const thCard = `Card${sortCol === "card" ? ' <span class="sort-arrow">' + arrow + '</span>' : ''}`;
         const thMech = `Mechanic${sortCol === "mechanic" ? ' <span class="sort-arrow">' + arrow + '</span>' : ''}`;
         const thTier = `Tier${sortCol === "tier" ? ' <span class="sort-arrow">' + arrow + '</span>' : ''}`;
 
-        if (filteredRows.length === 0 && hasActiveFilters()) {
+        if (ids.length === 0 && hasActiveFilters()) {
             resultsTable.innerHTML = `<div class="empty-filter-state"><p>${STRINGS.noCardsMatch}</p><button id="clear-filters-empty">${STRINGS.clearAllFilters}</button></div>`;
             const clearEmptyBtn = document.getElementById("clear-filters-empty");
             if (clearEmptyBtn) {
                 clearEmptyBtn.addEventListener("click", () => {
                     clearAllFilters();
-                    renderFilters();
-                    renderActiveView();
+                    onFiltersChanged();
                 });
             }
             return;
         }
 
-        let html = '<table class="results-table"><thead><tr>';
+        // Keep the scroll position when streamed-in results re-render the table
+        const previousViewport = resultsTable.querySelector(".table-viewport");
+        const scrollTop = previousViewport ? previousViewport.scrollTop : 0;
+
+        let html = '<div class="table-viewport"><table class="results-table"><thead><tr>';
         html += `<th class="sort-header" data-col="card">${thCard}</th>`;
         html += `<th class="sort-header" data-col="mechanic">${thMech}</th>`;
         html += `<th class="sort-header" data-col="tier">${thTier}</th>`;
-        html += '</tr></thead><tbody>';
-        for (const row of filteredRows) {
-            const cls = tierBadgeClass(row.tier);
-            html += `<tr><td>${esc(row.card)}</td><td>${esc(row.mechanicLabel)}</td><td><span class="badge ${cls}">${esc(row.tier)}</span></td></tr>`;
-        }
-        html += '</tbody></table>';
+        html += '</tr></thead><tbody></tbody></table></div>';
         if (noMechCount > 0) {
             html += `<p class="muted">${STRINGS.noTaggedCount(noMechCount)}</p>`;
         }
@@ -341,54 +444,16 @@ function renderResults(data) {
                 renderTable();
             });
         });
+        const viewport = resultsTable.querySelector(".table-viewport");
+        viewport.scrollTop = scrollTop;
+        mountVirtualTable(viewport, ids, rows);
     }
 
     renderTableFn = renderTable;
     renderFiltersFn = renderFilters;
 
-    function attachFilterHandlers() {
-        const searchInput = document.getElementById("card-search");
-        if (searchInput) {
-            searchInput.value = filterState.searchText;
-            searchInput.addEventListener("input", (e) => {
-                filterState.searchText = e.target.value.trim();
-                renderFilters();
-                renderActiveView();
-            });
-        }
-
-        const clearBtn = document.getElementById("clear-filters");
-        if (clearBtn) {
-            clearBtn.addEventListener("click", () => {
-                clearAllFilters();
-                renderFilters();
-                renderActiveView();
-            });
-        }
-
-        document.querySelectorAll(".count-chip").forEach(chip => {
-            chip.addEventListener("click", () => {
-                const mechanic = chip.getAttribute("data-mechanic");
-                if (filterState.mechanics.has(mechanic)) { filterState.mechanics.delete(mechanic); }
-                else { filterState.mechanics.add(mechanic); }
-                renderFilters();
-                renderActiveView();
-            });
-        });
-
-        document.querySelectorAll(".tier-filter").forEach(badge => {
-            badge.addEventListener("click", () => {
-                const tier = parseInt(badge.getAttribute("data-tier"));
-                if (filterState.tiers.has(tier)) { filterState.tiers.delete(tier); }
-                else { filterState.tiers.add(tier); }
-                renderFilters();
-                renderActiveView();
-            });
-        });
-    }
-
     renderFilters();
-    switchView("tierlist");
+    switchView(incremental ? currentView : "tierlist");
 
     // Raw JSON
     resultsContent.textContent = JSON.stringify(result, null, 2);
@@ -398,27 +463,120 @@ function renderResults(data) {
     // Card detail panel
     lastResult = result;
     const cardNames = Object.keys(result);
-    cardSelect.innerHTML = `<option value="">${STRINGS.selectCard}</option>`;
+    const previousCard = cardSelect.value;
+    let options = `<option value="">${STRINGS.selectCard}</option>`;
     for (const name of cardNames) {
-        cardSelect.innerHTML += `<option value="${esc(name)}">${esc(name)}</option>`;
+        options += `<option value="${esc(name)}">${esc(name)}</option>`;
     }
+    cardSelect.innerHTML = options;
     if (cardNames.length > 0) {
-        cardSelect.value = cardNames[0];
-        renderCardDetail(cardNames[0]);
+        const selected = incremental && previousCard in result ? previousCard : cardNames[0];
+        cardSelect.value = selected;
+        renderCardDetail(selected);
     }
     cardDetail.classList.add("visible");
 }
 
-// Scryfall art fetch with rate-limited queue
+// Results table: only the rows in or near the scrolled viewport are in the DOM, with
+// spacer rows standing in for the rest so the scrollbar still reflects the full list
+const TABLE_OVERSCAN = 10;
+let tableRowHeight = 41; // px, re-measured from the first rendered row
+
+function mountVirtualTable(viewport, ids, rows) {
+    const tbody = viewport.querySelector("tbody");
+    let first = -1;
+    let last = -1;
+    let frame = null;
+
+    function renderWindow() {
+        frame = null;
+        // The viewport is capped below the window height, so the window bounds what can be visible
+        const top = viewport.scrollTop;
+        const start = Math.max(0, Math.floor(top / tableRowHeight) - TABLE_OVERSCAN);
+        const end = Math.min(ids.length, Math.ceil((top + window.innerHeight) / tableRowHeight) + TABLE_OVERSCAN);
+        if (start === first && end === last) return;
+        first = start;
+        last = end;
+
+        let html = tableSpacer(start * tableRowHeight);
+        for (let i = start; i < end; i++) {
+            const row = rows[ids[i]];
+            const cls = tierBadgeClass(row.tier);
+            html += `<tr><td>${esc(row.card)}</td><td>${esc(row.mechanicLabel)}</td><td><span class="badge ${cls}">${esc(row.tier)}</span></td></tr>`;
+        }
+        html += tableSpacer((ids.length - end) * tableRowHeight);
+        tbody.innerHTML = html;
+    }
+
+    renderWindow();
+    const sample = tbody.querySelector("tr:not(.table-spacer)");
+    if (sample && sample.offsetHeight && sample.offsetHeight !== tableRowHeight) {
+        tableRowHeight = sample.offsetHeight;
+        first = -1;
+        renderWindow();
+    }
+    viewport.addEventListener("scroll", () => {
+        if (!frame) frame = requestAnimationFrame(renderWindow);
+    });
+}
+
+function tableSpacer(height) {
+    return height > 0 ? `<tr class="table-spacer"><td colspan="3" style="height:${height}px"></td></tr>` : "";
+}
+
+// Card art: names requested in the same tick are looked up together through the
+// server's /api/art index; if that isn't available, fall back to Scryfall one by one
+const ART_BATCH_SIZE = 100;
+
 async function fetchArtCrop(cardName) {
     const key = cardName.toLowerCase();
     if (key in scryfallCache) return scryfallCache[key];
     return new Promise((resolve) => {
-        scryfallQueue.push({ cardName, key, resolve });
-        if (!scryfallRunning) runScryfallQueue();
+        if (!artProxyAvailable) {
+            queueScryfall(cardName, key, resolve);
+            return;
+        }
+        if (!artBatch.has(key)) artBatch.set(key, { cardName, resolvers: [] });
+        artBatch.get(key).resolvers.push(resolve);
+        if (!artBatchTimer) artBatchTimer = setTimeout(flushArtBatch, 0);
     });
 }
 
+async function flushArtBatch() {
+    artBatchTimer = null;
+    const pending = [...artBatch.entries()];
+    artBatch.clear();
+    for (let i = 0; i < pending.length; i += ART_BATCH_SIZE) {
+        const chunk = pending.slice(i, i + ART_BATCH_SIZE);
+        const names = chunk.map(([, entry]) => entry.cardName).join("|");
+        let art = null;
+        try {
+            const res = await fetch(`/api/art?names=${encodeURIComponent(names)}`);
+            if (res.ok) {
+                art = (await res.json()).art;
+            } else if (res.status === 503) {
+                artProxyAvailable = false;
+            }
+        } catch {
+            art = null;
+        }
+        for (const [key, { cardName, resolvers }] of chunk) {
+            if (art) {
+                scryfallCache[key] = art[cardName] ?? null;
+                resolvers.forEach(resolve => resolve(scryfallCache[key]));
+            } else {
+                resolvers.forEach(resolve => queueScryfall(cardName, key, resolve));
+            }
+        }
+    }
+}
+
+// Fallback: Scryfall's API directly, one rate-limited request at a time
+function queueScryfall(cardName, key, resolve) {
+    scryfallQueue.push({ cardName, key, resolve });
+    if (!scryfallRunning) runScryfallQueue();
+}
+
 async function runScryfallQueue() {
     scryfallRunning = true;
     while (scryfallQueue.length > 0) {
@@ -438,7 +596,31 @@ async function runScryfallQueue() {
     scryfallRunning = false;
 }
 
+// Tier list: tiles are built once per result and filtering only shows or hides
+// them. Art is looked up when a tile first comes near the viewport.
+let tierListIndex = null;   // the filterIndex the current tiles were built for
+let tierTiles = [];         // row id → tile element
+let tierRowEls = new Map(); // tier rank → tier row element
+let artObserver = null;
+
 function renderTierList() {
+    const tierListEl = document.getElementById("results-tierlist");
+    if (tierListIndex !== filterIndex) buildTierList(tierListEl);
+
+    const matches = matchingRowIds();
+    const visibleTiers = new Set();
+    tierTiles.forEach((tile, id) => {
+        const visible = matches === null || matches.has(id);
+        if (tile.hidden === visible) tile.hidden = !visible;
+        if (visible) visibleTiers.add(lastRows[id].tierRankVal);
+    });
+    for (const [rank, rowEl] of tierRowEls) {
+        rowEl.hidden = !visibleTiers.has(rank);
+    }
+    tierListEl.querySelector(".empty-filter-state").hidden = visibleTiers.size > 0 || !hasActiveFilters();
+}
+
+function buildTierList(tierListEl) {
     const TIER_DEFS = [
         { rank: 0, label: "S+", badgeClass: "badge-s" },
         { rank: 1, label: "S",  badgeClass: "badge-s" },
@@ -447,39 +629,35 @@ function renderTierList() {
         { rank: 4, label: "C",  badgeClass: "badge-c" },
         { rank: 5, label: "D",  badgeClass: "badge-d" },
     ];
+    tierListIndex = filterIndex;
 
-    const tierListEl = document.getElementById("results-tierlist");
-    const filteredRows = applyFilters(lastRows);
-
-    if (filteredRows.length === 0 && hasActiveFilters()) {
-        tierListEl.innerHTML = `<div class="empty-filter-state"><p>${STRINGS.tierListNoMatch}</p></div>`;
-        return;
-    }
-
-    // Group filtered rows by tier rank
+    // Group rows by tier rank
     const byTier = {};
-    for (const row of filteredRows) {
+    lastRows.forEach((row, id) => {
         if (!byTier[row.tierRankVal]) byTier[row.tierRankVal] = [];
-        byTier[row.tierRankVal].push(row);
-    }
+        byTier[row.tierRankVal].push(id);
+    });
 
-    let html = '<div class="tierlist">';
+    let html = `<div class="empty-filter-state" hidden><p>${STRINGS.tierListNoMatch}</p></div>`;
+    html += '<div class="tierlist">';
     for (const td of TIER_DEFS) {
-        const tierRows = byTier[td.rank];
-        if (!tierRows || tierRows.length === 0) continue;
-        html += `<div class="tier-row">`;
+        const ids = byTier[td.rank];
+        if (!ids) continue;
+        html += `<div class="tier-row" data-tier="${td.rank}">`;
         html += `<div class="tier-row-label ${td.badgeClass}">${esc(td.label)}</div>`;
         html += `<div class="tier-row-tiles">`;
-        tierRows.forEach((row, i) => {
+        for (const id of ids) {
+            const row = lastRows[id];
             const escapedName = esc(row.card);
-            html += `<div class="card-tile" id="tile-${td.rank}-${i}">`;
+            const key = row.card.toLowerCase();
+            html += `<div class="card-tile" data-row="${id}">`;
             html += `<div class="card-tile-art" data-card="${escapedName}">`;
-            html += `<div class="tile-spinner"></div>`;
+            html += key in scryfallCache ? tileArtHtml(row.card, scryfallCache[key]) : `<div class="tile-spinner"></div>`;
             html += `</div>`;
             html += `<div class="card-tile-name">${escapedName}</div>`;
             html += `<div class="card-tile-mechanic">${esc(row.mechanicLabel)}</div>`;
             html += `</div>`;
-        });
+        }
         html += `</div></div>`;
     }
     if (noMechCountGlobal > 0) {
@@ -488,24 +666,189 @@ function renderTierList() {
     html += '</div>';
     tierListEl.innerHTML = html;
 
-    // Fetch art crops — unique card names from visible tiles
-    const seen = new Set();
-    for (const row of filteredRows) {
-        if (seen.has(row.card)) continue;
-        seen.add(row.card);
-        const cardName = row.card;
+    tierTiles = [];
+    tierListEl.querySelectorAll(".card-tile").forEach(tile => {
+        tierTiles[parseInt(tile.dataset.row)] = tile;
+    });
+    tierRowEls = new Map();
+    tierListEl.querySelectorAll(".tier-row").forEach(rowEl => {
+        tierRowEls.set(parseInt(rowEl.dataset.tier), rowEl);
+    });
+    loadTileArt(tierListEl);
+}
+
+function tileArtHtml(cardName, artUrl) {
+    if (!artUrl) return `<div class="card-tile-placeholder"></div>`;
+    return `<img class="card-tile-img" src="${esc(artUrl)}" alt="${esc(cardName)}" loading="lazy">`;
+}
+
+// Fetch art for the tiles still showing a spinner, by card name, as they scroll
+// into view (hidden tiles never do); every tile of that card is filled at once
+function loadTileArt(tierListEl) {
+    if (artObserver) artObserver.disconnect();
+    artObserver = null;
+
+    const pending = new Map(); // card name → art elements waiting for it
+    tierListEl.querySelectorAll(".card-tile-art").forEach(el => {
+        if (!el.querySelector(".tile-spinner")) return;
+        const cardName = el.dataset.card;
+        if (!pending.has(cardName)) pending.set(cardName, []);
+        pending.get(cardName).push(el);
+    });
+
+    function load(cardName, observer) {
+        const els = pending.get(cardName);
+        if (!els) return;
+        pending.delete(cardName);
+        if (observer) els.forEach(el => observer.unobserve(el));
         fetchArtCrop(cardName).then(artUrl => {
-            const escapedName = esc(cardName);
-            const artEls = tierListEl.querySelectorAll(`[data-card="${escapedName}"]`);
-            artEls.forEach(el => {
-                if (artUrl) {
-                    el.innerHTML = `<img class="card-tile-img" src="${artUrl}" alt="${escapedName}" loading="lazy">`;
+            els.forEach(el => { el.innerHTML = tileArtHtml(cardName, artUrl); });
+        });
+    }
+
+    if (!window.IntersectionObserver) {
+        for (const cardName of [...pending.keys()]) load(cardName, null);
+        return;
+    }
+    artObserver = new IntersectionObserver((entries, observer) => {
+        for (const entry of entries) {
+            if (entry.isIntersecting) load(entry.target.dataset.card, observer);
+        }
+    }, { rootMargin: "300px" });
+    for (const els of pending.values()) {
+        els.forEach(el => artObserver.observe(el));
+    }
+}
+
+// Inputs with more card lines than this run as a background job (/jobs/<id>) instead
+// of one long streaming request that proxies may time out
+const ASYNC_CARD_THRESHOLD = 150;
+const JOB_POLL_MS = 2000;
+
+// Show the error from a non-2xx JSON response; a 403 also forgets the saved access code
+async function showResponseError(res) {
+    const data = await res.json();
+    if (res.status === 403) {
+        localStorage.removeItem("mtg_tagger_access_code");
+        showError(data.error || STRINGS.accessDenied);
+        document.getElementById("access-code").focus();
+        return;
+    }
+    showError(data.error || STRINGS.unexpectedError);
+}
+
+// Wait for a background job to finish, following its SSE progress stream and
+// falling back to polling /jobs/<id> if the stream drops. Resolves to the job payload.
+function waitForJob(jobId, onProgress) {
+    return new Promise((resolve, reject) => {
+        let pollTimer = null;
+
+        async function poll() {
+            try {
+                const res = await fetch(`/jobs/${jobId}`);
+                if (!res.ok) throw new Error((await res.json()).error);
+                const job = await res.json();
+                onProgress(job.progress);
+                if (job.status === "done" || job.status === "failed") {
+                    resolve(job);
                 } else {
-                    el.innerHTML = `<div class="card-tile-placeholder"></div>`;
+                    pollTimer = setTimeout(poll, JOB_POLL_MS);
                 }
-            });
+            } catch (e) {
+                reject(e);
+            }
+        }
+
+        if (!window.EventSource) {
+            poll();
+            return;
+        }
+        const events = new EventSource(`/jobs/${jobId}/events`);
+        events.addEventListener("progress", (e) => onProgress(JSON.parse(e.data).progress));
+        events.addEventListener("done", (e) => {
+            events.close();
+            resolve(JSON.parse(e.data));
         });
+        events.onerror = () => {
+            events.close();
+            if (!pollTimer) poll();
+        };
+    });
+}
+
+async function analyzeAsJob(body, accessCode) {
+    const res = await fetch("/analyze", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ...body, async: true }),
+    });
+    if (!res.ok) {
+        await showResponseError(res);
+        return;
+    }
+    if (accessCode) {
+        localStorage.setItem("mtg_tagger_access_code", accessCode);
+    }
+
+    const { job_id: jobId } = await res.json();
+    btn.textContent = STRINGS.jobProgress(0, 0);
+    const job = await waitForJob(jobId, (progress) => {
+        btn.textContent = STRINGS.jobProgress(progress.done, progress.total);
+    });
+    if (job.http_status >= 400) {
+        showError(job.response.error || STRINGS.unexpectedError);
+        return;
+    }
+    emptyState.classList.add("hidden");
+    renderResults(job.response.result);
+    resultsEl.classList.add("visible");
+    rememberResult(job.response.result_id);
+}
+
+// A stored result's id goes in the page URL (?r=<id>), so reloading or sharing the
+// page shows the result again from /r/<id> without another analysis
+function rememberResult(resultId) {
+    const url = new URL(window.location.href);
+    if (resultId) url.searchParams.set("r", resultId);
+    else url.searchParams.delete("r");
+    history.replaceState(null, "", url);
+}
+
+async function loadStoredResult(resultId) {
+    try {
+        const res = await fetch(`/r/${encodeURIComponent(resultId)}`);
+        if (!res.ok) {
+            rememberResult(null);
+            showError(res.status === 404 ? STRINGS.resultNotFound : STRINGS.unexpectedError);
+            return;
+        }
+        const data = await res.json();
+        emptyState.classList.add("hidden");
+        renderResults(data.result);
+        resultsEl.classList.add("visible");
+    } catch {
+        showError(STRINGS.networkError);
+    }
+}
+
+// Read a newline-delimited JSON response, calling onMessage for each line
+async function readNdjson(res, onMessage) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newline;
+        while ((newline = buffer.indexOf("\n")) !== -1) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) onMessage(JSON.parse(line));
+        }
     }
+    buffer += decoder.decode();
+    if (buffer.trim()) onMessage(JSON.parse(buffer));
 }
 
 btn.addEventListener("click", async () => {
@@ -518,11 +861,13 @@ btn.addEventListener("click", async () => {
         return;
     }
 
+    const btnLabel = btn.textContent;
     btn.disabled = true;
     loading.classList.add("visible");
     rightPanel.classList.add("loading");
     dismissError();
     resultsEl.classList.remove("visible");
+    rememberResult(null);
 
     const body = {
         card_data: cardData,
@@ -530,23 +875,35 @@ btn.addEventListener("click", async () => {
         mechanics: mechanics || undefined
     };
 
+    // Cards stream in one NDJSON line at a time; re-render at most once per frame
+    const streamed = {};
+    let renderScheduled = false;
+
+    function scheduleRender() {
+        if (renderScheduled) return;
+        renderScheduled = true;
+        requestAnimationFrame(() => {
+            renderScheduled = false;
+            renderResults(streamed, resultsEl.classList.contains("visible"));
+            resultsEl.classList.add("visible");
+        });
+    }
+
     try {
-        const res = await fetch("/analyze", {
+        const cardLines = cardData.split("\n").filter(line => line.trim()).length;
+        if (cardLines > ASYNC_CARD_THRESHOLD) {
+            await analyzeAsJob(body, accessCode);
+            return;
+        }
+
+        const res = await fetch("/analyze/stream", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify(body),
         });
 
-        const data = await res.json();
-
         if (!res.ok) {
-            if (res.status === 403) {
-                localStorage.removeItem("mtg_tagger_access_code");
-                showError(data.error || STRINGS.accessDenied);
-                document.getElementById("access-code").focus();
-                return;
-            }
-            showError(data.error || STRINGS.unexpectedError);
+            await showResponseError(res);
             return;
         }
 
@@ -555,8 +912,20 @@ btn.addEventListener("click", async () => {
         }
 
         emptyState.classList.add("hidden");
-        renderResults(data.result);
-        resultsEl.classList.add("visible");
+        await readNdjson(res, (msg) => {
+            if (msg.card !== undefined) {
+                streamed[msg.card] = msg.tags;
+                scheduleRender();
+            } else if (msg.error) {
+                showError(msg.error);
+            } else if (msg.done && msg.raw !== undefined) {
+                renderResults(msg.raw);
+                resultsEl.classList.add("visible");
+            } else if (msg.done) {
+                scheduleRender();
+                rememberResult(msg.result_id);
+            }
+        });
     } catch (e) {
         if (e instanceof TypeError || e instanceof SyntaxError) {
             showError(STRINGS.renderError + e.message);
@@ -565,6 +934,7 @@ btn.addEventListener("click", async () => {
         }
     } finally {
         btn.disabled = false;
+        btn.textContent = btnLabel;
         loading.classList.remove("visible");
         rightPanel.classList.remove("loading");
     }
@@ -681,5 +1051,10 @@ if (savedCode) {
     document.getElementById("access-code").value = savedCode;
 }
 
+const storedResultId = new URLSearchParams(window.location.search).get("r");
+if (storedResultId) {
+    loadStoredResult(storedResultId);
+}
+
 document.getElementById("tab-table").addEventListener("click", () => switchView("table"));
 document.getElementById("tab-tierlist").addEventListener("click", () => switchView("tierlist"));
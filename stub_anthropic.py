@@ -0,0 +1,452 @@
+"""Local stub of the Anthropic Messages API for tests and benchmarks.
+
+Serves POST /v1/messages (including "stream": true as server-sent events),
+/v1/messages/count_tokens and the Message Batches endpoints from an in-process HTTP
+server, so a real anthropic client can be pointed at it with base_url=stub.base_url.
+
+    with StubAnthropicServer(responder=lambda params: '{"Sol Ring": {}}') as stub:
+        client = anthropic.Anthropic(api_key="sk-test", base_url=stub.base_url)
+
+Messages calls can be made slow (latency=fixed_latency(2.0), uniform_latency(...),
+lognormal_latency(...)) and flaky (error_rate=0.05 answers 5% of them with
+error_status, 529 overloaded by default). GET /_stats reports calls in flight, for
+load tests. It also runs standalone, e.g. for bench/load_test.py:
+
+    uv run python stub_anthropic.py --port 8765 --latency lognormal:1.5,0.4 --error-rate 0.02
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_BATCH_PATH_RE = re.compile(r"^/v1/messages/batches/(?P<batch_id>[\w-]+)(?P<results>/results)?$")
+_MECHANIC_RE = re.compile(r"^- (\w+):", re.MULTILINE)
+_CARDS_BLOCK_RE = re.compile(r"<cards>\n(.*?)\n</cards>", re.DOTALL)
+
+TIERS = ("S+ Tier", "S-Tier", "A-Tier", "B-Tier", "C-Tier", "D-Tier")
+
+ERROR_TYPES = {
+    400: "invalid_request_error",
+    429: "rate_limit_error",
+    500: "api_error",
+    529: "overloaded_error",
+}
+
+
+def empty_responder(params: dict) -> str:
+    """Default responder: tag nothing."""
+    return "{}"
+
+
+def _request_text(params: dict) -> str:
+    """All prompt text of a request: system blocks, then message contents."""
+    system = params.get("system") or []
+    parts = [system] if isinstance(system, str) else [block.get("text", "") for block in system]
+    for message in params.get("messages", []):
+        content = message.get("content", "")
+        parts.extend([content] if isinstance(content, str) else [block.get("text", "") for block in content])
+    return "\n".join(parts)
+
+
+def prompt_card_names(params: dict) -> list[str]:
+    """Card names sent in a request built from a prompts/prompt12.md-style template.
+
+    The card list is the <cards> block of the cached layout, or else the paragraph
+    just before "[Mechanics]". "Name | oracle text" lines give their name.
+    """
+    text = _request_text(params)
+    match = _CARDS_BLOCK_RE.search(text)
+    if match:
+        block = match.group(1)
+    else:
+        before = text.split("[Mechanics]", 1)[0].strip()
+        block = before.rsplit("\n\n", 1)[-1]
+    return [line.split(" | ", 1)[0].strip() for line in block.splitlines() if line.strip()]
+
+
+def prompt12_responder(params: dict) -> str:
+    """Canned responder answering in prompts/prompt12.md's output format.
+
+    Each card gets 0-2 of the mechanics named in the request's "- name: ..."
+    definitions, at tiers derived from a hash of the card name, so the same card
+    always gets the same tags.
+    """
+    mechanics = sorted(set(_MECHANIC_RE.findall(_request_text(params))))
+    result = {}
+    for name in prompt_card_names(params):
+        digest = hashlib.sha256(name.lower().encode("utf-8")).digest()
+        tags = {}
+        for i in range(digest[0] % 3 if mechanics else 0):
+            tags[mechanics[digest[1 + i] % len(mechanics)]] = TIERS[digest[3 + i] % len(TIERS)]
+        result[name] = tags
+    return json.dumps(result, indent=1)
+
+
+RESPONDERS = {"empty": empty_responder, "prompt12": prompt12_responder}
+
+
+# --- Latency distributions: callables taking a random.Random and returning seconds ---
+
+
+def fixed_latency(seconds: float):
+    return lambda rng: seconds
+
+
+def uniform_latency(low: float, high: float):
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal_latency(median: float, sigma: float):
+    """Long-tailed latency: median seconds, sigma of the underlying normal."""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def parse_latency(spec: str):
+    """Parse "fixed:S", "uniform:LOW,HIGH" or "lognormal:MEDIAN,SIGMA" (seconds)."""
+    kind, _, args = spec.partition(":")
+    factories = {"fixed": fixed_latency, "uniform": uniform_latency, "lognormal": lognormal_latency}
+    if kind not in factories:
+        raise ValueError(f"Unknown latency distribution: {spec!r}")
+    return factories[kind](*(float(arg) for arg in args.split(",") if arg))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _send_events(self, events):
+        """Write (event, data, delay) server-sent events, sleeping delay before each."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # No Content-Length: the body ends when the connection closes
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event, data, delay in events:
+            if delay:
+                time.sleep(delay)
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def _messages(self):
+        params = self._read_json()
+        with self.stub.in_flight():
+            error = self.stub.injected_error()
+            if error:
+                status, payload, headers = error
+                time.sleep(self.stub.sample_latency() * 0.1)
+                self._send_json(status, payload, headers)
+            elif params.get("stream"):
+                self._send_events(self.stub.stream_events(params))
+            else:
+                time.sleep(self.stub.sample_latency())
+                self._send_json(200, self.stub.create_message(params))
+
+    def do_POST(self):
+        self.stub.record(self)
+        if self.path == "/v1/messages":
+            self._messages()
+        elif self.path == "/v1/messages/count_tokens":
+            self._send_json(200, self.stub.count_tokens(self._read_json()))
+        elif self.path == "/v1/messages/batches":
+            self._send_json(200, self.stub.create_batch(self._read_json()))
+        else:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_GET(self):
+        self.stub.record(self)
+        if self.path == "/_stats":
+            self._send_json(200, self.stub.stats())
+            return
+        match = _BATCH_PATH_RE.match(self.path)
+        batch = self.stub.batches.get(match.group("batch_id")) if match else None
+        if batch is None:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+        elif match.group("results"):
+            body = "".join(json.dumps(line) + "\n" for line in batch["results"])
+            self._send(200, body.encode("utf-8"), content_type="application/binary")
+        else:
+            self._send_json(200, self.stub.poll_batch(batch))
+
+
+class StubAnthropicServer:
+    """Threaded HTTP server answering Messages and Message Batches API calls.
+
+    responder(params) -> text produces the assistant text for each request; raising
+    an exception from it turns a batch entry into an "errored" result.
+    polls_until_ended is how many retrieve calls a batch reports "in_progress".
+
+    Messages calls (not batches) wait latency(rng) seconds, spread over the chunks
+    when streamed, and a random error_rate fraction of them fail with error_status
+    and a retry-after header of retry_after seconds. seed makes both repeatable.
+    """
+
+    def __init__(self, responder=None, polls_until_ended: int = 1, host: str = "127.0.0.1", port: int = 0,
+                 latency=None, error_rate: float = 0.0, error_status: int = 529, retry_after: float = 1.0,
+                 stream_chunk_chars: int = 64, seed: int = None):
+        self.responder = responder or empty_responder
+        self.polls_until_ended = polls_until_ended
+        self.latency = latency or fixed_latency(0.0)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.stream_chunk_chars = stream_chunk_chars
+        self._rng = random.Random(seed)
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._busy_seconds = 0.0
+        self._messages_served = 0
+        self._errors_injected = 0
+        self._started_at = time.monotonic()
+        self.batches = {}
+        self.cached_prefixes = set()
+        self.requests = []
+        self.connections = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def record(self, handler):
+        with self._lock:
+            self.requests.append((handler.command, handler.path))
+            self.connections.add(handler.client_address)
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency(self._rng))
+
+    def injected_error(self):
+        """(status, payload, headers) for a request picked to fail, else None."""
+        with self._lock:
+            if not self.error_rate or self._rng.random() >= self.error_rate:
+                return None
+            self._errors_injected += 1
+        error_type = ERROR_TYPES.get(self.error_status, "api_error")
+        payload = {"type": "error", "error": {"type": error_type, "message": f"stub: injected {self.error_status}"}}
+        # The SDK retries these itself unless max_retries=0; it honors retry-after
+        return self.error_status, payload, {"retry-after": str(self.retry_after), "x-should-retry": "true"}
+
+    def in_flight(self):
+        return _InFlight(self)
+
+    def stats(self) -> dict:
+        """Messages calls served, errors injected, calls in flight now and at most, and
+        busy_seconds (summed call durations: divided by wall time, the mean in flight)."""
+        with self._lock:
+            return {
+                "messages": self._messages_served,
+                "errors_injected": self._errors_injected,
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "busy_seconds": self._busy_seconds,
+                "uptime_seconds": time.monotonic() - self._started_at,
+            }
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}_stub_{next(self._ids)}"
+
+    def _cache_usage(self, params: dict) -> dict:
+        """Mimic prompt caching: system blocks up to the last cache_control breakpoint are
+        written on first sight and read afterwards."""
+        blocks = params.get("system") if isinstance(params.get("system"), list) else []
+        breakpoints = [i for i, block in enumerate(blocks) if block.get("cache_control")]
+        if not breakpoints:
+            return {}
+        prefix = json.dumps(blocks[:breakpoints[-1] + 1], sort_keys=True)
+        with self._lock:
+            hit = prefix in self.cached_prefixes
+            self.cached_prefixes.add(prefix)
+        tokens = len(prefix) // 4
+        return {"cache_read_input_tokens": tokens if hit else 0, "cache_creation_input_tokens": 0 if hit else tokens}
+
+    def count_tokens(self, params: dict) -> dict:
+        """~4 characters per token over the message text, plus a fixed per-request overhead."""
+        text = "".join(str(m.get("content", "")) for m in params.get("messages", []))
+        return {"input_tokens": 8 + len(text) // 4}
+
+    def build_message(self, params: dict, text: str) -> dict:
+        prompt_chars = len(json.dumps(params.get("messages", [])))
+        return {
+            "id": self._next_id("msg"),
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model", ""),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": prompt_chars // 4,
+                "output_tokens": max(1, len(text) // 4),
+                **self._cache_usage(params),
+            },
+        }
+
+    def create_message(self, params: dict) -> dict:
+        return self.build_message(params, self.responder(params))
+
+    def stream_events(self, params: dict):
+        """(event, data, delay) tuples of a streamed message, with the sampled latency
+        split evenly between the text chunks."""
+        message = self.create_message(params)
+        text = message["content"][0]["text"]
+        chunks = [text[i:i + self.stream_chunk_chars] for i in range(0, len(text), self.stream_chunk_chars)] or [""]
+        delay = self.sample_latency() / len(chunks)
+        start = {**message, "content": [], "stop_reason": None,
+                 "usage": {**message["usage"], "output_tokens": 1}}
+        yield "message_start", {"type": "message_start", "message": start}, 0
+        yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}}, 0
+        for chunk in chunks:
+            yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": chunk}}, delay
+        yield "content_block_stop", {"type": "content_block_stop", "index": 0}, 0
+        yield "message_delta", {"type": "message_delta",
+                                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": message["usage"]["output_tokens"]}}, 0
+        yield "message_stop", {"type": "message_stop"}, 0
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = self._next_id("msgbatch")
+        results = []
+        for request in body.get("requests", []):
+            try:
+                result = {"type": "succeeded", "message": self.create_message(request["params"])}
+            except Exception as e:
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": str(e)}}}
+            results.append({"custom_id": request["custom_id"], "result": result})
+        batch = {"id": batch_id, "polls": 0, "results": results}
+        with self._lock:
+            self.batches[batch_id] = batch
+        return self._batch_object(batch)
+
+    def poll_batch(self, batch: dict) -> dict:
+        with self._lock:
+            batch["polls"] += 1
+        return self._batch_object(batch)
+
+    def _batch_object(self, batch: dict) -> dict:
+        ended = batch["polls"] >= self.polls_until_ended
+        succeeded = sum(1 for r in batch["results"] if r["result"]["type"] == "succeeded")
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else len(batch["results"]),
+                "succeeded": succeeded if ended else 0,
+                "errored": len(batch["results"]) - succeeded if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": "2026-01-01T00:00:00Z",
+            "expires_at": "2026-01-02T00:00:00Z",
+            "ended_at": "2026-01-01T00:01:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+
+class _InFlight:
+    """Context manager counting a Messages call as in flight for stats()."""
+
+    def __init__(self, stub: StubAnthropicServer):
+        self.stub = stub
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        with self.stub._lock:
+            self.stub._in_flight += 1
+            self.stub._max_in_flight = max(self.stub._max_in_flight, self.stub._in_flight)
+
+    def __exit__(self, *exc):
+        with self.stub._lock:
+            self.stub._in_flight -= 1
+            self.stub._messages_served += 1
+            self.stub._busy_seconds += time.monotonic() - self.started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stub Anthropic API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=parse_latency, default=fixed_latency(0.0),
+                        help='Messages latency: "fixed:S", "uniform:LOW,HIGH" or "lognormal:MEDIAN,SIGMA" (seconds)')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of Messages calls that fail")
+    parser.add_argument("--error-status", type=int, default=529, choices=sorted(ERROR_TYPES),
+                        help="HTTP status of injected errors (default: 529)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after seconds on injected errors")
+    parser.add_argument("--responder", default="prompt12", choices=sorted(RESPONDERS))
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubAnthropicServer(
+        responder=RESPONDERS[args.responder], host=args.host, port=args.port, latency=args.latency,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after, seed=args.seed,
+    )
+    print(f"Stub Anthropic API listening on {stub.base_url}", flush=True)
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+"""Tests for the batch analysis scripts in analysis/."""
+
+import json
+import sys
+import threading
+from argparse import Namespace
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import anthropic
+
+sys.path.insert(0, str(Path(__file__).parent / "analysis"))
+
+import analyze_batch
+from rate_limit import RateLimiter, TokenBucket, backoff_delay
+from stub_anthropic import StubAnthropicServer
+
+
+def _args(**overrides):
+    defaults = dict(
+        model="claude-test", temperature=None, prompt="prompts/prompt12.md", table="cards_to_analyze",
+        concurrency=1, rpm=None, tpm=None, cache_prompt=False, upsert=False, retries=0, bisect=True,
+    )
+    defaults.update(overrides)
+    return Namespace(**defaults)
+
+
+# ---------- rate_limit ----------
+
+
+class TestTokenBucket:
+    def test_reports_wait_when_empty(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        assert bucket.try_acquire(60) == 0.0
+        wait = bucket.try_acquire(30)
+        assert 29 < wait <= 30
+
+    def test_oversized_request_is_clamped_to_capacity(self):
+        bucket = TokenBucket(rate_per_minute=10)
+        assert bucket.try_acquire(1000) == 0.0
+
+    def test_unlimited_limiter_never_blocks(self):
+        RateLimiter().acquire(10**9)
+
+
+# ---------- analyze_batch.run_batches ----------
+
+
+class TestBackoff:
+    def test_full_jitter_within_cap(self):
+        assert all(0 <= backoff_delay(attempt, base=1, cap=10) <= 10 for attempt in range(20))
+
+    def test_honors_retry_after(self):
+        assert backoff_delay(0, base=1, cap=10, retry_after=30) == 30
+
+
+class TestRetries:
+    BATCH = [{"id": 1, "card_name": "Card 1"}]
+    OVERLOADED = (None, ({"error": "API error: overloaded", "upstream_status": 529, "retryable": True,
+                          "retry_after": None}, 502))
+
+    def test_retryable_error_is_retried(self):
+        with patch("analyze_batch.claude_utils.call_claude",
+                   side_effect=[self.OVERLOADED, self.OVERLOADED, ({"Card 1": {}}, None)]) as mock_call, \
+                patch("analyze_batch.time.sleep") as mock_sleep:
+            rows, error, kind = analyze_batch.analyze_one_batch("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m",
+                                                                max_retries=3)
+        assert error is None and kind is None
+        assert rows == [{"card_name": "Card 1"}]
+        assert mock_call.call_count == 3
+        assert mock_sleep.call_count == 2
+        # The SDK must not retry underneath this loop
+        assert all(call.kwargs["max_retries"] == 0 for call in mock_call.call_args_list)
+
+    def test_gives_up_after_max_retries(self):
+        with patch("analyze_batch.claude_utils.call_claude", return_value=self.OVERLOADED) as mock_call, \
+                patch("analyze_batch.time.sleep"):
+            rows, error, kind = analyze_batch.analyze_one_batch("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m",
+                                                                max_retries=2)
+        assert rows is None
+        assert error == "ERROR (HTTP 529) after 3 attempts: API error: overloaded"
+        assert kind == analyze_batch.ERROR_API
+        assert mock_call.call_count == 3
+
+    def test_non_retryable_error_fails_fast(self):
+        bad_request = (None, ({"error": "API error: bad", "upstream_status": 400, "retryable": False}, 502))
+        with patch("analyze_batch.claude_utils.call_claude", return_value=bad_request) as mock_call:
+            _, error, _ = analyze_batch.analyze_one_batch("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m",
+                                                          max_retries=5)
+        assert mock_call.call_count == 1
+        assert error == "ERROR (HTTP 400): API error: bad"
+
+    def test_unparseable_response_is_a_parse_error(self):
+        with patch("analyze_batch.claude_utils.call_claude", return_value=("Sorry, I can't do that.", None)):
+            rows, error, kind = analyze_batch.analyze_one_batch("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m")
+        assert rows is None
+        assert error == "ERROR: expected JSON object or list, got str"
+        assert kind == analyze_batch.ERROR_PARSE
+
+    def test_exhausted_batches_are_dead_lettered(self):
+        failed = []
+        with patch("analyze_batch.claude_utils.call_claude", return_value=self.OVERLOADED), \
+                patch("analyze_batch.save_results") as mock_save:
+            analyze_batch.run_batches(None, "sk", [self.BATCH], "CARD_LIST_PLACEHOLDER", "M", _args(), "m", 1,
+                                      on_batch_failed=lambda batch, error: failed.append((batch, error)))
+        assert failed == [(self.BATCH, "ERROR (HTTP 529): API error: overloaded")]
+        mock_save.assert_not_called()
+
+
+class TestBisection:
+    BATCH = [{"id": i, "card_name": f"Card {i}"} for i in range(8)]
+
+    @staticmethod
+    def _tagger(poison=(), drop=()):
+        """Fake call_claude: unparseable text if a poison card is in the prompt, else tag all but `drop`."""
+        calls = []
+
+        def fake_call(api_key, prompt, model, temperature, **kwargs):
+            names = [line for line in prompt.splitlines() if line.startswith("Card ")]
+            calls.append(names)
+            if any(name in poison for name in names):
+                return "Sorry, I can't do that.", None
+            return {name: {"ramp": "C-Tier"} for name in names if name not in drop}, None
+
+        return fake_call, calls
+
+    def test_poison_card_is_isolated(self):
+        fake_call, calls = self._tagger(poison={"Card 5"})
+        with patch("analyze_batch.claude_utils.call_claude", side_effect=fake_call):
+            rows, failures = analyze_batch.analyze_bisecting("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m")
+        assert sorted(row["card_name"] for row in rows) == [f"Card {i}" for i in range(8) if i != 5]
+        assert [[card["card_name"] for card in cards] for cards, _ in failures] == [["Card 5"]]
+        assert len(calls) == 7  # 8 -> 4+4 -> 2+2 -> 1+1
+
+    def test_only_missing_cards_are_resubmitted(self):
+        fake_call, calls = self._tagger(drop={"Card 2"})
+        with patch("analyze_batch.claude_utils.call_claude", side_effect=fake_call):
+            rows, failures = analyze_batch.analyze_bisecting("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m")
+        assert len(rows) == 7
+        assert calls[1:] == [["Card 2"]]
+        assert failures == [([self.BATCH[2]], "ERROR: card missing from response")]
+
+    def test_differently_spelled_names_count_as_answered(self):
+        batch = [{"id": 1, "card_name": "Lim-Dûl's Vault"}, {"id": 2, "card_name": "Sol Ring"}]
+        response = ({"Lim-Dul’s  Vault": {"tutor": "B-Tier"}, "sol ring": {"ramp": "S+ Tier"}}, None)
+        with patch("analyze_batch.claude_utils.call_claude", return_value=response) as mock_call:
+            rows, failures = analyze_batch.analyze_bisecting("sk", batch, "CARD_LIST_PLACEHOLDER", "M", "m")
+        assert mock_call.call_count == 1
+        assert failures == []
+        assert rows == [
+            {"card_name": "Lim-Dûl's Vault", "tutor": "B-Tier"},
+            {"card_name": "Sol Ring", "ramp": "S+ Tier"},
+        ]
+
+    def test_api_errors_are_not_split(self):
+        overloaded = (None, ({"error": "API error: overloaded", "upstream_status": 529, "retryable": False}, 502))
+        with patch("analyze_batch.claude_utils.call_claude", return_value=overloaded) as mock_call:
+            rows, failures = analyze_batch.analyze_bisecting("sk", self.BATCH, "CARD_LIST_PLACEHOLDER", "M", "m")
+        assert rows == []
+        assert failures == [(self.BATCH, "ERROR (HTTP 529): API error: overloaded")]
+        assert mock_call.call_count == 1
+
+
+class TestBatchPacking:
+    @staticmethod
+    def _packer(**kwargs):
+        from batch_packing import BatchPacker
+
+        return BatchPacker(lambda card: analyze_batch.format_card_data([card]), **kwargs)
+
+    @staticmethod
+    def _card(i, oracle_chars=0):
+        return {"id": i, "card_name": f"Card {i:03d}", "oracle_text": "x" * oracle_chars}
+
+    def test_long_oracle_text_gets_smaller_batches(self):
+        packer = self._packer(input_budget=1000, output_budget=100_000)
+        cards = [self._card(i, 20) for i in range(20)] + [self._card(i, 4000) for i in range(20, 24)]
+        batches = list(packer.pack(cards))
+        assert [len(b) for b in batches] == [20, 1, 1, 1, 1]
+        assert sum(len(b) for b in batches) == 24
+
+    def test_output_budget_and_card_cap(self):
+        packer = self._packer(input_budget=100_000, output_budget=500, output_tokens_per_card=98)
+        assert [len(b) for b in packer.pack(self._card(i) for i in range(12))] == [5, 5, 2]
+        packer = self._packer(input_budget=100_000, output_budget=100_000, max_cards=4)
+        assert [len(b) for b in packer.pack(self._card(i) for i in range(10))] == [4, 4, 2]
+        assert "10 cards in 3 batches" in packer.summary()
+
+    def test_calibrate_with_count_tokens_endpoint(self):
+        from batch_packing import calibrate_chars_per_token
+
+        with StubAnthropicServer() as stub:
+            client = anthropic.Anthropic(api_key="sk-test", base_url=stub.base_url)
+            ratio = calibrate_chars_per_token(client, "claude-test", "Sol Ring\n" * 200)
+        assert 3.9 < ratio < 4.1
+
+
+class TestFormatCardData:
+    def test_names_or_table_oracle_text(self):
+        assert analyze_batch.format_card_data([{"card_name": "Sol Ring"}, {"card_name": "Cultivate"}]) == (
+            "Sol Ring\nCultivate"
+        )
+        assert analyze_batch.format_card_data([{"card_name": "Sol Ring", "oracle_text": "{T}: Add {C}{C}."}]) == (
+            "Sol Ring | {T}: Add {C}{C}."
+        )
+
+    def test_card_db_fills_missing_oracle_text(self):
+        oracle_db = MagicMock()
+        oracle_db.oracle_text.side_effect = {"Cultivate": "Search your library."}.get
+        batch = [
+            {"card_name": "Sol Ring", "oracle_text": "{T}: Add {C}{C}."},
+            {"card_name": "Cultivate", "oracle_text": None},
+            {"card_name": "Unknown Card"},
+        ]
+        assert analyze_batch.format_card_data(batch, oracle_db) == (
+            "Sol Ring | {T}: Add {C}{C}.\nCultivate | Search your library.\nUnknown Card"
+        )
+
+
+class TestSaveResults:
+    BATCH = [{"id": 1, "card_name": "Sol Ring"}, {"id": 2, "card_name": "Cultivate"}]
+
+    def _save(self, results, upsert=False):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        with patch("analyze_batch.psycopg2.extras.execute_values") as mock_values:
+            analyze_batch.save_results(conn, results, self.BATCH, "p.md", "m", upsert=upsert)
+        return conn, cur, mock_values
+
+    def test_one_insert_and_one_update_per_batch(self):
+        conn, cur, mock_values = self._save([
+            {"card_name": "Sol Ring", "ramp": "S+ Tier"},
+            {"card_name": "cultivate", "ramp": "A-Tier"},
+            {"ramp": "nameless"},
+        ])
+        mock_values.assert_called_once()
+        sql, rows = mock_values.call_args.args[1:3]
+        assert "ON CONFLICT" not in sql
+        assert [row[0] for row in rows] == ["Sol Ring", "cultivate"]
+        cur.execute.assert_called_once()
+        assert "id = ANY(%s)" in cur.execute.call_args.args[0]
+        assert cur.execute.call_args.args[1] == ([1, 2],)
+        conn.commit.assert_called_once()
+
+    def test_upsert_keeps_last_duplicate(self):
+        _, _, mock_values = self._save([
+            {"card_name": "Sol Ring", "ramp": "A-Tier"},
+            {"card_name": "Sol Ring", "ramp": "S+ Tier"},
+        ], upsert=True)
+        sql, rows = mock_values.call_args.args[1:3]
+        assert "ON CONFLICT (card_name, prompt_file, model)" in sql
+        assert len(rows) == 1
+        assert "S+ Tier" in rows[0][3]
+
+
+class TestRunBatches:
+    def _batches(self, n_batches, size=3):
+        return [
+            [{"id": b * size + i, "card_name": f"Card {b * size + i}"} for i in range(size)]
+            for b in range(n_batches)
+        ]
+
+    def test_concurrent_run_saves_every_batch_on_calling_thread(self):
+        batches = self._batches(6)
+        saver_threads = set()
+        saved = []
+
+        def fake_call(api_key, prompt, model, temperature, **kwargs):
+            names = [line for line in prompt.splitlines() if line.startswith("Card ")]
+            return {name: {"ramp": "C-Tier"} for name in names}, None
+
+        def fake_save(conn, results, batch, prompt_file, model, table, upsert=False):
+            saver_threads.add(threading.get_ident())
+            saved.extend(r["card_name"] for r in results)
+
+        with patch("analyze_batch.claude_utils.call_claude", side_effect=fake_call), \
+                patch("analyze_batch.save_results", side_effect=fake_save):
+            processed = analyze_batch.run_batches(
+                None, "sk-test", batches, "CARD_LIST_PLACEHOLDER", "M", _args(concurrency=4), "claude-test", 18,
+            )
+
+        assert processed == 18
+        assert sorted(saved) == sorted(f"Card {i}" for i in range(18))
+        assert saver_threads == {threading.get_ident()}
+
+    def test_failed_batch_is_skipped(self):
+        batches = self._batches(2)
+        responses = [
+            (None, ({"error": "API error: overloaded"}, 502)),
+            ({"Card 3": {}, "Card 4": {}, "Card 5": {}}, None),
+        ]
+
+        with patch("analyze_batch.claude_utils.call_claude", side_effect=responses), \
+                patch("analyze_batch.save_results") as mock_save:
+            processed = analyze_batch.run_batches(
+                None, "sk-test", batches, "CARD_LIST_PLACEHOLDER", "M", _args(), "claude-test", 6,
+            )
+
+        assert processed == 3
+        assert mock_save.call_count == 1
+
+    def test_lazy_batches_and_done_callback(self):
+        """Claimed batches arrive from a generator; every batch is handed to on_batch_done."""
+        pulled = []
+
+        def claimed():
+            for batch in self._batches(3):
+                pulled.append(batch)
+                yield batch
+
+        done = []
+        with patch("analyze_batch.claude_utils.call_claude", return_value=({"Card 0": {}}, None)), \
+                patch("analyze_batch.save_results"):
+            analyze_batch.run_batches(
+                None, "sk-test", claimed(), "CARD_LIST_PLACEHOLDER", "M", _args(), "claude-test", 9,
+                on_batch_done=done.append,
+            )
+        assert sorted(done, key=lambda batch: batch[0]["id"]) == pulled
+        assert len(done) == 3
+
+
+# ---------- streaming queue reads ----------
+
+
+class TestStreamingFetch:
+    def test_batches_come_from_named_cursor(self):
+        read_conn = MagicMock()
+        cur = read_conn.cursor.return_value.__enter__.return_value
+        rows = [{"id": i, "card_name": f"Card {i}"} for i in range(5)]
+        cur.fetchmany.side_effect = [rows[:2], rows[2:4], rows[4:], []]
+
+        batches = analyze_batch.iter_card_batches(read_conn, "p.md", "m", True, 2)
+        assert not read_conn.cursor.called  # nothing runs until the first batch is requested
+        assert next(batches) == rows[:2]
+        assert list(batches) == [rows[2:4], rows[4:]]
+        assert read_conn.cursor.call_args.kwargs["name"]
+        sql, params = cur.execute.call_args.args
+        assert "NOT EXISTS" in sql and sql.endswith("ORDER BY c.id")
+        assert params == ("p.md", "m")
+
+    def test_count_matches_queue_query(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = (42,)
+        assert analyze_batch.count_cards(conn, "p.md", "m", False, "cards_to_analyze2") == 42
+        sql, params = cur.execute.call_args.args
+        assert sql.startswith("SELECT COUNT(*) FROM public.cards_to_analyze2 c")
+        assert params == ()
+
+    def test_count_runs_beside_the_first_batch(self):
+        progress = analyze_batch.Progress()
+        assert progress.summary().startswith("0/? total saved")
+        counted = threading.Event()
+        conn = MagicMock()
+
+        def slow_count(*args):
+            counted.wait(5)
+            return 42
+
+        with patch("analyze_batch.connect", return_value=conn), \
+                patch("analyze_batch.count_cards", side_effect=slow_count):
+            thread = analyze_batch.count_cards_in_background(progress, "p.md", "m", True)
+            assert progress.total_cards is None  # the caller is not held up by the count
+            counted.set()
+            thread.join(5)
+        assert progress.total_cards == 42
+        assert progress.summary().startswith("0/42 total saved")
+        conn.close.assert_called_once()
+
+
+# ---------- work-queue claims and migrations ----------
+
+
+class TestClaims:
+    def test_claim_uses_skip_locked_and_sorts_rows(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [{"id": 7, "card_name": "B"}, {"id": 3, "card_name": "A"}]
+
+        rows = analyze_batch.claim_cards(conn, "cards_to_analyze", 20, "host:1", "p.md", "m", skip_existing=True,
+                                         lease_minutes=15)
+
+        sql, params = cur.execute.call_args.args
+        assert "FOR UPDATE SKIP LOCKED" in sql
+        assert "NOT EXISTS" in sql
+        # Expired leases are claimed by the same query, not by a separate startup pass
+        assert "c.status = 'IN_PROGRESS' AND c.claimed_at < NOW()" in sql
+        assert params == ("host:1", 15, "p.md", "m", 20)
+        assert [row["id"] for row in rows] == [3, 7]
+        conn.commit.assert_called_once()
+
+    def test_release_only_touches_own_claims(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        analyze_batch.release_cards(conn, "cards_to_analyze", [1, 2], "host:1")
+        sql, params = cur.execute.call_args.args
+        assert "claimed_by = %s" in sql and "status = 'IN_PROGRESS'" in sql
+        assert params == ([1, 2], "host:1")
+
+    def test_failed_batch_is_claimed_once_per_run(self):
+        queue = {i: "NOT_STARTED" for i in range(1, 7)}
+        claims = []
+
+        def claim(conn, table, batch_size, worker_id, *args):
+            if len(claims) > 12:  # a re-claim loop; stop it so the assertions below fail
+                return []
+            ids = [i for i, status in sorted(queue.items()) if status == "NOT_STARTED"][:batch_size]
+            for i in ids:
+                queue[i] = "IN_PROGRESS"
+            claims.extend(ids)
+            return [{"id": i, "card_name": f"Card {i}"} for i in ids]
+
+        def set_status(status, from_status="IN_PROGRESS"):
+            def update(conn, table, card_ids, worker_id):
+                for i in card_ids:
+                    if queue[i] == from_status:
+                        queue[i] = status
+            return update
+
+        def save(conn, results, batch, *args):
+            set_status("COMPLETED")(conn, None, [row["id"] for row in batch
+                                                 if row["card_name"] in {r["card_name"] for r in results}], None)
+
+        def fake_call(api_key, prompt, model, temperature, **kwargs):
+            if "Card 3" in prompt.splitlines():
+                return "Sorry, I can't do that.", None
+            return {line: {} for line in prompt.splitlines() if line.startswith("Card ")}, None
+
+        with patch("analyze_batch.claim_cards", side_effect=claim), \
+                patch("analyze_batch.release_cards", side_effect=set_status("NOT_STARTED")), \
+                patch("analyze_batch.fail_cards", side_effect=set_status("FAILED")), \
+                patch("analyze_batch.save_results", side_effect=save), \
+                patch("analyze_batch.record_dead_letters") as mock_dead_letter, \
+                patch("analyze_batch.claude_utils.call_claude", side_effect=fake_call):
+            saved = analyze_batch.run_claimed(None, "sk", "CARD_LIST_PLACEHOLDER", "M",
+                                              _args(batch_size=2, skip_existing=False, with_oracle_text=False,
+                                                    lease_minutes=30),
+                                              "m", "host:1", 6)
+
+        assert sorted(claims) == [1, 2, 3, 4, 5, 6]
+        assert saved == 5
+        assert queue == {1: "COMPLETED", 2: "COMPLETED", 3: "FAILED", 4: "COMPLETED", 5: "COMPLETED",
+                         6: "COMPLETED"}
+        assert [call.args[1] for call in mock_dead_letter.call_args_list] == [[{"id": 3, "card_name": "Card 3"}]]
+
+    def test_migrate_skips_missing_tables(self):
+        import migrations
+
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        existing = {"public.labeled", "public.cards_to_analyze"}
+        statements = []
+
+        def execute(sql, params=None):
+            statements.append(sql)
+            cur.fetchone.return_value = (params[0] if params and params[0] in existing else None,)
+
+        cur.execute.side_effect = execute
+        assert migrations.migrate(conn) == ["labeled", "cards_to_analyze"]
+        assert not any("cards_to_analyze2" in sql for sql in statements)
+        assert any("claimed_by" in sql for sql in statements)
+
+
+# ---------- analyze_batch — Message Batches API mode ----------
+
+
+def _tag_card_lines(params):
+    """Stub responder: tag every "Card N" line in the prompt as C-Tier ramp."""
+    prompt = params["messages"][0]["content"]
+    if "POISON" in prompt:
+        raise RuntimeError("model refused")
+    names = [line for line in prompt.splitlines() if line.startswith("Card ")]
+    return json.dumps({name: {"ramp": "C-Tier"} for name in names})
+
+
+class TestMessageBatches:
+    def _batches(self):
+        return [
+            [{"id": 1, "card_name": "Card 1"}, {"id": 2, "card_name": "Card 2"}],
+            [{"id": 3, "card_name": "Card 3"}],
+        ]
+
+    def test_build_batch_requests(self):
+        requests = analyze_batch.build_batch_requests(
+            self._batches(), "CARD_LIST_PLACEHOLDER\nMECHANICS_PLACEHOLDER", "M", "claude-test", temperature=0.0,
+        )
+        assert [r["custom_id"] for r in requests] == ["batch-1", "batch-2"]
+        assert requests[0]["params"]["messages"][0]["content"] == "Card 1\nCard 2\nM"
+        assert requests[0]["params"]["temperature"] == 0.0
+
+    def test_build_batch_requests_with_prompt_cache(self):
+        requests = analyze_batch.build_batch_requests(
+            self._batches(), "Rules\nCARD_LIST_PLACEHOLDER\nMECHANICS_PLACEHOLDER", "M", "claude-test", cache_prompt=True,
+        )
+        params = requests[0]["params"]
+        assert params["messages"][0]["content"] == "<cards>\nCard 1\nCard 2\n</cards>"
+        assert all(block["cache_control"] == {"type": "ephemeral"} for block in params["system"])
+        assert params["system"] == requests[1]["params"]["system"]
+
+    def test_submit_and_collect_against_fake_endpoint(self):
+        with StubAnthropicServer(responder=_tag_card_lines, polls_until_ended=3) as stub:
+            client = anthropic.Anthropic(api_key="sk-test", base_url=stub.base_url)
+            requests = analyze_batch.build_batch_requests(
+                self._batches(), "CARD_LIST_PLACEHOLDER", "M", "claude-test",
+            )
+            batch = client.messages.batches.create(requests=requests)
+            with patch("analyze_batch.time.sleep") as mock_sleep:
+                results = list(analyze_batch.iter_message_batch_results(client, batch.id, poll_interval=5))
+
+        assert mock_sleep.call_count == 2
+        assert dict((custom_id, error) for custom_id, _, error in results) == {"batch-1": None, "batch-2": None}
+        rows = dict((custom_id, rows) for custom_id, rows, _ in results)
+        assert rows["batch-1"] == [
+            {"card_name": "Card 1", "ramp": "C-Tier"},
+            {"card_name": "Card 2", "ramp": "C-Tier"},
+        ]
+
+    def test_errored_requests_are_reported(self):
+        with StubAnthropicServer(responder=_tag_card_lines) as stub:
+            client = anthropic.Anthropic(api_key="sk-test", base_url=stub.base_url)
+            batch = client.messages.batches.create(requests=[
+                {"custom_id": "batch-1", "params": {
+                    "model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": "POISON"}],
+                }},
+            ])
+            results = list(analyze_batch.iter_message_batch_results(client, batch.id, poll_interval=0))
+
+        assert results == [("batch-1", None, "ERROR: request errored")]
+
+
+# ---------- run_matrix ----------
+
+
+class TestRunMatrix:
+    def test_parse_matrix(self):
+        import run_matrix
+
+        combos = run_matrix.parse_matrix(
+            "# comment\n"
+            "prompts/prompt.md claude-sonnet-4-6\n"
+            "\n"
+            "prompts/prompt10.md claude-opus-4-8 --with-oracle-text --temperature 0 --save-model opus-t0  # note\n"
+        )
+        assert [(c.prompt, c.model, c.save_model) for c in combos] == [
+            ("prompts/prompt.md", "claude-sonnet-4-6", "claude-sonnet-4-6"),
+            ("prompts/prompt10.md", "claude-opus-4-8", "opus-t0"),
+        ]
+        assert combos[1].with_oracle_text and combos[1].temperature == 0.0
+        assert not combos[0].with_oracle_text
+
+    def test_only_changed_combos_are_rendered(self, tmp_path):
+        import run_matrix
+
+        combos = run_matrix.parse_matrix("a.md m1\nb.md m2\nc.md m3\n")
+        fingerprints = {"a.md": [10, "t1"], "b.md": [12, "t2"], "c.md": [0, None]}
+        state_path = tmp_path / "state.json"
+        state_path.write_text(json.dumps({"a.md | m1": [10, "t1"], "b.md | m2": [11, "t0"]}))
+
+        with patch("run_matrix.connect"), \
+                patch("run_matrix.labeled_fingerprint", side_effect=lambda conn, c: fingerprints[c.prompt]), \
+                patch("run_matrix.subprocess.run") as mock_run:
+            rendered = run_matrix.render_changed_reports(combos, str(state_path))
+
+        assert rendered == 1
+        commands = [call.args[0] for call in mock_run.call_args_list]
+        assert commands == [
+            ["Rscript", "analysis/render_accuracy_report.R", "b.md", "m2"],
+            ["Rscript", "analysis/render_meta_report.R"],
+        ]
+        assert json.loads(state_path.read_text())["b.md | m2"] == [12, "t2"]
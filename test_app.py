@@ -4,20 +4,42 @@ import importlib
 import json
 import os
 import tempfile
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
+import anthropic
 import pytest
 
 
 def _make_app(env_key=""):
     """Import app.py with a controlled ANTHROPIC_API_KEY env var."""
     import app as app_module
+    import claude_utils
+    import sharding
 
+    claude_utils.reset_clients()
+    sharding.reset_sizers()
     importlib.reload(app_module)
     app_module.app.config["TESTING"] = True
     return app_module.app, app_module
 
 
+@pytest.fixture(autouse=True)
+def _no_result_store():
+    """Keep reloaded apps from saving results to results.sqlite3 in the working directory;
+    tests of the result store set app.RESULT_STORE themselves."""
+    with patch("result_store.make_result_store_from_env", return_value=None):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def _single_flight_in_tmp_path(tmp_path):
+    """Keep reloaded apps' single-flight lock files out of the shared temp directory."""
+    with patch("single_flight.tempfile.gettempdir", return_value=str(tmp_path)):
+        yield
+
+
 def _mock_anthropic_response(text):
     """Create a mock Anthropic API response."""
     message = MagicMock()
@@ -55,7 +77,8 @@ class TestAnalyzeAuthentication:
                 json={"card_data": "Name: Sol Ring. Text: {T}: Add {C}{C}."},
             )
             assert resp.status_code == 200
-            MockAnthropic.assert_called_once_with(api_key="sk-ant-env-key")
+            MockAnthropic.assert_called_once()
+            assert MockAnthropic.call_args.kwargs["api_key"] == "sk-ant-env-key"
 
     @patch("app.os.environ.get")
     def test_returns_500_when_no_api_key(self, mock_env_get):
@@ -103,7 +126,8 @@ class TestAnalyzeAuthentication:
                 },
             )
             assert resp.status_code == 200
-            MockAnthropic.assert_called_once_with(api_key="sk-ant-env-key")
+            MockAnthropic.assert_called_once()
+            assert MockAnthropic.call_args.kwargs["api_key"] == "sk-ant-env-key"
 
 
 # ---------- POST /analyze — validation ----------
@@ -117,6 +141,27 @@ class TestAnalyzeValidation:
             assert resp.status_code == 400
             assert "Card data is required" in resp.get_json()["error"]
 
+    def test_only_basic_lands(self):
+        app, _ = _make_app(env_key="sk-ant-env-key")
+        with app.test_client() as c:
+            resp = c.post("/analyze", json={"card_data": "10 Forest\n1 Command Tower (C21) 284"})
+            assert resp.status_code == 400
+            assert "No cards to analyze" in resp.get_json()["error"]
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_decklist_is_normalized_before_prompting(self, MockAnthropic):
+        app, _ = _make_app(env_key="sk-ant-env-key")
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response('{"Sol Ring": {}}')
+        with app.test_client() as c:
+            resp = c.post("/analyze", json={
+                "card_data": "Deck\n1x Sol Ring (cmr) 472 [Ramp]\n1 sol ring *F*\n8 Island\n1 Cultivate (M21) 177",
+                "prompt_template": "CARD_LIST_PLACEHOLDER",
+            })
+        assert resp.status_code == 200
+        assert mock_client.messages.create.call_args.kwargs["messages"][0]["content"] == "Sol Ring\nCultivate"
+
     def test_non_json_body(self):
         app, _ = _make_app(env_key="sk-ant-env-key")
         with app.test_client() as c:
@@ -379,6 +424,22 @@ class TestDefaultMechanicsEndpoint:
             assert mechanics.count("\n- ") >= 5
 
 
+# ---------- GET /api/prompts ----------
+
+
+class TestPromptsEndpoint:
+    """Test /api/prompts endpoint."""
+
+    def test_lists_prompt_files(self):
+        app, _ = _make_app()
+        with app.test_client() as c:
+            data = c.get("/api/prompts").get_json()
+            names = [p["name"] for p in data["prompts"]]
+            assert data["default"] in names
+            assert "README" not in names
+            assert all(len(p["hash"]) == 64 for p in data["prompts"])
+
+
 # ---------- POST /analyze — model and prompt overrides ----------
 
 
@@ -463,7 +524,7 @@ class TestAnalyzeModelAndPromptOverrides:
 
     @patch("claude_utils.anthropic.Anthropic")
     def test_prompt_template_overrides_default(self, MockAnthropic):
-        """prompt_template field should replace the default PROMPT_TEMPLATE."""
+        """prompt_template field should replace the default prompt template."""
         flask_app, _ = self._patched_app()
         mock_client = MagicMock()
         MockAnthropic.return_value = mock_client
@@ -536,3 +597,628 @@ class TestAnalyzeModelAndPromptOverrides:
                 "prompt_file": "../app",
             })
             assert resp.status_code == 400
+
+
+# ---------- POST /analyze — per-card result cache ----------
+
+
+class TestAnalyzeResultCache:
+    """Verify repeat cards are served from the card-level cache."""
+
+    def _patched_app(self):
+        with patch("app.os.environ.get") as mock_env:
+            def side(key, default=""):
+                if key == "ANTHROPIC_API_KEY":
+                    return "sk-ant-test-key"
+                return default
+            mock_env.side_effect = side
+            return _make_app()
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_repeat_request_skips_model(self, MockAnthropic):
+        """A second identical request should be answered without calling the API."""
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response(
+            '{"Sol Ring": {"ramp": "S+ Tier"}}'
+        )
+
+        with flask_app.test_client() as c:
+            first = c.post("/analyze", json={"card_data": "1 Sol Ring"})
+            second = c.post("/analyze", json={"card_data": "1x sol ring"})
+            assert first.status_code == 200
+            assert second.status_code == 200
+            assert second.get_json()["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+            assert mock_client.messages.create.call_count == 1
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_only_uncached_cards_sent_and_results_merged(self, MockAnthropic):
+        """Cached cards should be left out of the prompt and merged into the result."""
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.side_effect = [
+            _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}'),
+            _mock_anthropic_response('{"Cultivate": {"ramp": "A-Tier"}}'),
+        ]
+
+        template = "CARD_LIST_PLACEHOLDER\nMECHANICS_PLACEHOLDER"
+        with flask_app.test_client() as c:
+            c.post("/analyze", json={
+                "card_data": "1 Sol Ring",
+                "prompt_template": template,
+                "mechanics": "- ramp: mana",
+            })
+            resp = c.post("/analyze", json={
+                "card_data": "1 Sol Ring\n1 Cultivate",
+                "prompt_template": template,
+                "mechanics": "- ramp: mana",
+            })
+            assert resp.status_code == 200
+            prompt_sent = mock_client.messages.create.call_args.kwargs["messages"][0]["content"]
+            assert prompt_sent.startswith("Cultivate\n")
+            assert "Sol Ring" not in prompt_sent
+            assert resp.get_json()["result"] == {
+                "Sol Ring": {"ramp": "S+ Tier"},
+                "Cultivate": {"ramp": "A-Tier"},
+            }
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_different_mechanics_is_a_miss(self, MockAnthropic):
+        """Changing the mechanics text should bypass earlier cached results."""
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response(
+            '{"Sol Ring": {"ramp": "S+ Tier"}}'
+        )
+
+        with flask_app.test_client() as c:
+            c.post("/analyze", json={"card_data": "Sol Ring"})
+            c.post("/analyze", json={"card_data": "Sol Ring", "mechanics": "- ramp: mana"})
+            assert mock_client.messages.create.call_count == 2
+
+
+# ---------- POST /analyze — sharding large inputs ----------
+
+
+class TestAnalyzeSharding:
+    """Verify large card lists are split into concurrent sub-requests and merged."""
+
+    def _patched_app(self, extra_env=None):
+        env = {"ANTHROPIC_API_KEY": "sk-ant-test-key", "RESULT_CACHE_BACKEND": "off", **(extra_env or {})}
+        with patch("app.os.environ.get") as mock_env:
+            mock_env.side_effect = lambda key, default="": env.get(key, default)
+            return _make_app()
+
+    tokens_per_card = 10
+
+    def _echo_tags(self, **kwargs):
+        """Tag every card line in the prompt, reporting tokens_per_card output tokens per card."""
+        prompt = kwargs["messages"][0]["content"]
+        names = [line for line in prompt.splitlines() if line.startswith("Card ")]
+        message = _mock_anthropic_response(json.dumps({name: {"ramp": "C-Tier"} for name in names}))
+        message.usage.output_tokens = self.tokens_per_card * len(names)
+        return message
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_large_input_is_split_and_merged(self, MockAnthropic):
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.side_effect = self._echo_tags
+
+        card_data = "\n".join(f"Card {i}" for i in range(250))
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze", json={"card_data": card_data, "prompt_template": "CARD_LIST_PLACEHOLDER"})
+            assert resp.status_code == 200
+            data = resp.get_json()
+            assert data["model_used"]
+            assert len(data["result"]) == 250
+            assert data["usage"]["output_tokens"] == 10 * 250
+            # 100 cards per shard at the initial estimate -> three shards of 84/83/83
+            assert mock_client.messages.create.call_count == 3
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_shard_size_adapts_to_observed_output(self, MockAnthropic):
+        """More output tokens per card than expected should shrink the shards."""
+        self.tokens_per_card = 40
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.side_effect = self._echo_tags
+
+        card_data = "\n".join(f"Card {i}" for i in range(150))
+        with flask_app.test_client() as c:
+            c.post("/analyze", json={"card_data": card_data, "prompt_template": "CARD_LIST_PLACEHOLDER"})
+            first_calls = mock_client.messages.create.call_count
+            for _ in range(5):
+                c.post("/analyze", json={"card_data": "Card 0", "prompt_template": "CARD_LIST_PLACEHOLDER"})
+            mock_client.messages.create.reset_mock()
+            c.post("/analyze", json={"card_data": card_data, "prompt_template": "CARD_LIST_PLACEHOLDER"})
+            assert first_calls == 2
+            assert mock_client.messages.create.call_count == 3
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_shard_error_fails_request(self, MockAnthropic):
+        flask_app, _ = self._patched_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+
+        def create(**kwargs):
+            if "Card 0\n" in kwargs["messages"][0]["content"]:
+                raise anthropic.APIConnectionError(request=MagicMock())
+            return self._echo_tags(**kwargs)
+
+        mock_client.messages.create.side_effect = create
+        card_data = "\n".join(f"Card {i}" for i in range(150))
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze", json={"card_data": card_data, "prompt_template": "CARD_LIST_PLACEHOLDER"})
+            assert resp.status_code == 502
+            # Upstream status and retry details stay server-side
+            assert set(resp.get_json()) == {"error"}
+
+
+# ---------- POST /analyze — single-flight coalescing ----------
+
+
+class TestAnalyzeSingleFlight:
+    """Verify identical concurrent requests share one model call."""
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_concurrent_identical_requests_call_once(self, MockAnthropic):
+        release = threading.Event()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+
+        def create(**kwargs):
+            release.wait(5)
+            return _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+
+        mock_client.messages.create.side_effect = create
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = {"ANTHROPIC_API_KEY": "sk-ant-test-key", "RESULT_CACHE_BACKEND": "off", "SINGLE_FLIGHT_DIR": tmpdir}
+            with patch("app.os.environ.get") as mock_env:
+                mock_env.side_effect = lambda key, default="": env.get(key, default)
+                flask_app, _ = _make_app()
+
+            responses = []
+
+            def post():
+                with flask_app.test_client() as c:
+                    responses.append(c.post("/analyze", json={"card_data": "Sol Ring"}))
+
+            threads = [threading.Thread(target=post) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.2)
+            release.set()
+            for thread in threads:
+                thread.join()
+        assert [r.status_code for r in responses] == [200] * 3
+        assert all(r.get_json()["result"] == {"Sol Ring": {"ramp": "S+ Tier"}} for r in responses)
+        assert mock_client.messages.create.call_count == 1
+
+
+# ---------- POST /analyze — prompt caching layout ----------
+
+
+class TestAnalyzePromptCache:
+    """Verify PROMPT_CACHE moves the template into cached system blocks."""
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_card_list_sent_last(self, MockAnthropic):
+        env = {"ANTHROPIC_API_KEY": "sk-ant-test-key", "PROMPT_CACHE": "1", "RESULT_CACHE_BACKEND": "off"}
+        with patch("app.os.environ.get") as mock_env:
+            mock_env.side_effect = lambda key, default="": env.get(key, default)
+            flask_app, _ = _make_app()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        message = _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+        message.usage.cache_read_input_tokens = 3000
+        mock_client.messages.create.return_value = message
+
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze", json={"card_data": "Sol Ring"})
+            assert resp.status_code == 200
+            assert resp.get_json()["usage"] == {"cache_read_input_tokens": 3000}
+            kwargs = mock_client.messages.create.call_args.kwargs
+            assert kwargs["messages"][0]["content"] == "<cards>\nSol Ring\n</cards>"
+            assert kwargs["system"][-1]["cache_control"] == {"type": "ephemeral"}
+            assert "Sol Ring\n" not in "".join(block["text"] for block in kwargs["system"])
+
+
+# ---------- POST /analyze/stream ----------
+
+
+class TestAnalyzeStream:
+    """Verify /analyze/stream emits one NDJSON line per card as it is tagged."""
+
+    def _patched_app(self):
+        with patch("app.os.environ.get") as mock_env:
+            def side(key, default=""):
+                if key == "ANTHROPIC_API_KEY":
+                    return "sk-ant-test-key"
+                return default
+            mock_env.side_effect = side
+            return _make_app()
+
+    def _mock_stream(self, MockAnthropic, chunks):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        stream = mock_client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(chunks)
+        return mock_client
+
+    @staticmethod
+    def _lines(resp):
+        return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_streams_each_card_then_done(self, MockAnthropic):
+        self._mock_stream(MockAnthropic, [
+            '```json\n{"Sol Ring": {"ra', 'mp": "S+ Tier"},\n "Savannah',
+            ' Lions": {}}\n```',
+        ])
+        flask_app, _ = self._patched_app()
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze/stream", json={"card_data": "Sol Ring\nSavannah Lions"})
+            assert resp.status_code == 200
+            assert resp.mimetype == "application/x-ndjson"
+            assert self._lines(resp) == [
+                {"card": "Sol Ring", "tags": {"ramp": "S+ Tier"}},
+                {"card": "Savannah Lions", "tags": {}},
+                {"done": True, "model_used": "claude-opus-4-8"},
+            ]
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_cached_cards_stream_first_and_are_not_resent(self, MockAnthropic):
+        mock_client = self._mock_stream(MockAnthropic, ['{"Sol Ring": {"ramp": "S+ Tier"}}'])
+        flask_app, _ = self._patched_app()
+        with flask_app.test_client() as c:
+            c.post("/analyze/stream", json={"card_data": "Sol Ring"}).get_data()
+            mock_client.messages.stream.return_value.__enter__.return_value.text_stream = iter(
+                ['{"Cultivate": {"ramp": "A-Tier"}}']
+            )
+            resp = c.post("/analyze/stream", json={"card_data": "Sol Ring\nCultivate"})
+            lines = self._lines(resp)
+            assert lines[0] == {"card": "Sol Ring", "tags": {"ramp": "S+ Tier"}}
+            assert lines[1] == {"card": "Cultivate", "tags": {"ramp": "A-Tier"}}
+            assert mock_client.messages.stream.call_count == 2
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_non_json_response_returned_as_raw(self, MockAnthropic):
+        self._mock_stream(MockAnthropic, ["Sorry, I could ", "not parse those cards."])
+        flask_app, _ = self._patched_app()
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze/stream", json={"card_data": "Sol Ring"})
+            assert self._lines(resp) == [
+                {"done": True, "model_used": "claude-opus-4-8", "raw": "Sorry, I could not parse those cards."},
+            ]
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_api_error_line_has_message_and_status_only(self, MockAnthropic):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.stream.side_effect = anthropic.APIConnectionError(request=MagicMock())
+        flask_app, _ = self._patched_app()
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze/stream", json={"card_data": "Sol Ring"})
+            assert self._lines(resp) == [{"error": "API error: Connection error.", "status": 502}]
+
+    def test_validation_errors_are_plain_json(self):
+        flask_app, _ = self._patched_app()
+        with flask_app.test_client() as c:
+            resp = c.post("/analyze/stream", json={"card_data": ""})
+            assert resp.status_code == 400
+            assert "Card data is required" in resp.get_json()["error"]
+
+
+# ---------- gunicorn.conf.py ----------
+
+class TestGunicornConfig:
+    CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+    def _load(self, env):
+        import runpy
+
+        with patch.dict("os.environ", env, clear=True):
+            return runpy.run_path(self.CONFIG)
+
+    def test_threaded_workers_by_default(self):
+        config = self._load({})
+        assert config["worker_class"] == "gthread"
+        assert config["threads"] == 16
+        # Model calls take 30-90s; the sync default of 30s would kill them
+        assert config["timeout"] > 90
+        assert config["bind"] == "0.0.0.0:5000"
+
+    def test_env_overrides(self):
+        config = self._load({
+            "GUNICORN_WORKER_CLASS": "gevent", "WEB_CONCURRENCY": "3", "GUNICORN_CONNECTIONS": "500", "PORT": "10000",
+        })
+        assert config["worker_class"] == "gevent"
+        assert config["workers"] == 3
+        assert config["worker_connections"] == 500
+        assert config["bind"] == "0.0.0.0:10000"
+
+
+# ---------- POST /analyze — background jobs ----------
+
+
+class TestAnalyzeJobs:
+    """Verify "async": true runs the analysis as a job served by /jobs/<id>."""
+
+    def _patched_app(self, tmpdir):
+        env = {
+            "ANTHROPIC_API_KEY": "sk-ant-test-key", "RESULT_CACHE_BACKEND": "off",
+            "JOB_STORE_PATH": os.path.join(tmpdir, "jobs.sqlite3"), "JOB_POLL_INTERVAL": "0.01",
+        }
+        with patch("app.os.environ.get") as mock_env:
+            mock_env.side_effect = lambda key, default="": env.get(key, default)
+            return _make_app()
+
+    def _wait(self, client, job_id):
+        for _ in range(500):
+            data = client.get(f"/jobs/{job_id}").get_json()
+            if data["status"] in ("done", "failed"):
+                return data
+            time.sleep(0.01)
+        raise AssertionError("job did not finish")
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_async_returns_job_and_result(self, MockAnthropic):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, _ = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                resp = c.post("/analyze", json={"card_data": "Sol Ring", "async": True})
+                assert resp.status_code == 202
+                job_id = resp.get_json()["job_id"]
+                assert resp.headers["Location"] == f"/jobs/{job_id}"
+                data = self._wait(c, job_id)
+        assert data["status"] == "done"
+        assert data["http_status"] == 200
+        assert data["progress"] == {"done": 1, "total": 1}
+        assert data["response"]["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_identical_submissions_coalesce(self, MockAnthropic):
+        release = threading.Event()
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+
+        def create(**kwargs):
+            release.wait(5)
+            return _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+
+        mock_client.messages.create.side_effect = create
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, _ = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                first = c.post("/analyze", json={"card_data": "Sol Ring", "async": True}).get_json()
+                second = c.post("/analyze", json={"card_data": "Sol Ring", "async": True}).get_json()
+                other = c.post("/analyze", json={"card_data": "Cultivate", "async": True}).get_json()
+                release.set()
+                for job in (first, other):
+                    self._wait(c, job["job_id"])
+        assert second["job_id"] == first["job_id"]
+        assert second["coalesced"] is True
+        assert other["job_id"] != first["job_id"]
+        assert mock_client.messages.create.call_count == 2
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_events_stream_ends_with_done(self, MockAnthropic):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, _ = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                job_id = c.post("/analyze", json={"card_data": "Sol Ring", "async": True}).get_json()["job_id"]
+                resp = c.get(f"/jobs/{job_id}/events")
+                assert resp.mimetype == "text/event-stream"
+                events = [block for block in resp.get_data(as_text=True).split("\n\n") if block.startswith("event:")]
+        event, data = events[-1].split("\n")
+        assert event == "event: done"
+        assert json.loads(data[len("data: "):])["response"]["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+
+    def test_unknown_job_is_404(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, _ = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                assert c.get("/jobs/nope").status_code == 404
+                assert c.get("/jobs/nope/events").status_code == 404
+
+
+# ---------- GET /api/art ----------
+
+
+class TestArtEndpoint:
+    """Verify batched art lookups from the local Scryfall index."""
+
+    BULK = [
+        {"name": "Sol Ring", "layout": "normal", "image_uris": {"art_crop": "https://img/sol-ring.jpg"}},
+        {"name": "Cultivate", "layout": "normal", "image_uris": {"art_crop": "https://img/cultivate.jpg"}},
+    ]
+
+    def _patched_app(self, tmpdir):
+        bulk_path = os.path.join(tmpdir, "bulk.json")
+        with open(bulk_path, "w", encoding="utf-8") as f:
+            json.dump(self.BULK, f)
+        env = {"SCRYFALL_BULK_PATH": bulk_path, "CARD_DB_PATH": os.path.join(tmpdir, "card_db.sqlite3")}
+        with patch("app.os.environ.get") as mock_env:
+            mock_env.side_effect = lambda key, default="": env.get(key, default)
+            return _make_app()
+
+    def test_batched_lookup_with_caching_headers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, _ = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                resp = c.get("/api/art?names=sol ring|Cultivate|Not A Card")
+                assert resp.status_code == 200
+                assert resp.get_json()["art"] == {
+                    "sol ring": "https://img/sol-ring.jpg",
+                    "Cultivate": "https://img/cultivate.jpg",
+                    "Not A Card": None,
+                }
+                assert "max-age=86400" in resp.headers["Cache-Control"]
+                etag = resp.headers["ETag"]
+                again = c.get("/api/art?names=sol ring|Cultivate|Not A Card", headers={"If-None-Match": etag})
+                assert again.status_code == 304
+
+    def test_validation(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            flask_app, app_module = self._patched_app(tmpdir)
+            with flask_app.test_client() as c:
+                assert c.get("/api/art").status_code == 400
+                names = "|".join(f"Card {i}" for i in range(app_module.ART_MAX_NAMES + 1))
+                assert c.get(f"/api/art?names={names}").status_code == 400
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_oracle_text_mode_enriches_card_list(self, MockAnthropic):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+        self.BULK[0]["oracle_text"] = "{T}: Add {C}{C}."
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                bulk_path = os.path.join(tmpdir, "bulk.json")
+                with open(bulk_path, "w", encoding="utf-8") as f:
+                    json.dump(self.BULK, f)
+                env = {
+                    "ANTHROPIC_API_KEY": "sk-ant-test-key", "RESULT_CACHE_BACKEND": "off", "ORACLE_TEXT": "1",
+                    "SCRYFALL_BULK_PATH": bulk_path, "CARD_DB_PATH": os.path.join(tmpdir, "card_db.sqlite3"),
+                }
+                with patch("app.os.environ.get") as mock_env:
+                    mock_env.side_effect = lambda key, default="": env.get(key, default)
+                    flask_app, _ = _make_app()
+                with flask_app.test_client() as c:
+                    resp = c.post("/analyze", json={"card_data": "1 Sol Ring\nMystery Card"})
+        finally:
+            del self.BULK[0]["oracle_text"]
+        assert resp.status_code == 200
+        prompt = mock_client.messages.create.call_args.kwargs["messages"][0]["content"]
+        assert "Sol Ring | {T}: Add {C}{C}.\nMystery Card\n" in prompt
+        assert "Card Name | Oracle Text" in prompt
+
+    def test_not_configured_is_503(self):
+        with patch("app.os.environ.get") as mock_env:
+            mock_env.side_effect = lambda key, default="": {"CARD_DB_PATH": "/nonexistent/card_db.sqlite3"}.get(key, default)
+            flask_app, _ = _make_app()
+        with flask_app.test_client() as c:
+            assert c.get("/api/art?names=Sol Ring").status_code == 503
+
+
+# ---------- Stored results: /analyze result_id and GET /r/<id> ----------
+
+
+class TestStoredResults:
+    """Verify finished analyses are stored under a content-addressed id and reused."""
+
+    @pytest.fixture
+    def app_with_store(self):
+        from result_store import ResultStore, SQLiteResultStore
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = {"ANTHROPIC_API_KEY": "sk-ant-test-key", "RESULT_CACHE_BACKEND": "off"}
+            with patch("app.os.environ.get") as mock_env:
+                mock_env.side_effect = lambda key, default="": env.get(key, default)
+                flask_app, app_module = _make_app()
+            path = os.path.join(tmpdir, "results.sqlite3")
+            app_module.RESULT_STORE = ResultStore(lambda: SQLiteResultStore(path))
+            yield flask_app
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_same_deck_is_served_from_the_store(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response(
+            '{"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": "A-Tier"}}'
+        )
+        with app_with_store.test_client() as c:
+            first = c.post("/analyze", json={"card_data": "1 Sol Ring\n1 Cultivate"}).get_json()
+            second = c.post("/analyze", json={"card_data": "Cultivate\nsol ring"}).get_json()
+        assert mock_client.messages.create.call_count == 1
+        assert first["result_id"] == second["result_id"]
+        assert second["result"] == {"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": "A-Tier"}}
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_get_result_is_immutable_and_conditional(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}')
+        with app_with_store.test_client() as c:
+            result_id = c.post("/analyze", json={"card_data": "Sol Ring"}).get_json()["result_id"]
+            resp = c.get(f"/r/{result_id}")
+            assert resp.status_code == 200
+            assert resp.get_json()["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+            assert "immutable" in resp.headers["Cache-Control"]
+            assert c.get(f"/r/{result_id}", headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+            assert c.get("/r/" + "0" * 32).status_code == 404
+            assert c.get("/r/not-an-id").status_code == 404
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_raw_results_are_not_stored(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.return_value = _mock_anthropic_response("Sorry, I can't.")
+        with app_with_store.test_client() as c:
+            resp = c.post("/analyze", json={"card_data": "Sol Ring"}).get_json()
+        assert "result_id" not in resp
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_incomplete_results_are_not_stored(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        mock_client.messages.create.side_effect = [
+            _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}}'),
+            _mock_anthropic_response('{"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": "A-Tier"}}'),
+        ]
+        with app_with_store.test_client() as c:
+            first = c.post("/analyze", json={"card_data": "Sol Ring\nCultivate"}).get_json()
+            second = c.post("/analyze", json={"card_data": "Sol Ring\nCultivate"}).get_json()
+        assert "result_id" not in first
+        assert first["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+        # The missing card is analyzed again rather than served from the store
+        assert mock_client.messages.create.call_count == 2
+        assert second["result"] == {"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": "A-Tier"}}
+        assert "result_id" in second
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_truncated_stream_is_not_stored(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        stream = mock_client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(['{"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": '])
+        with app_with_store.test_client() as c:
+            body = c.post("/analyze/stream", json={"card_data": "Sol Ring"}).get_data(as_text=True)
+        lines = [json.loads(line) for line in body.splitlines()]
+        assert lines[0] == {"card": "Sol Ring", "tags": {"ramp": "S+ Tier"}}
+        assert lines[-1]["done"] is True
+        assert "result_id" not in lines[-1]
+
+    @patch("claude_utils.anthropic.Anthropic")
+    def test_stream_stores_and_replays(self, MockAnthropic, app_with_store):
+        mock_client = MagicMock()
+        MockAnthropic.return_value = mock_client
+        stream = mock_client.messages.stream.return_value.__enter__.return_value
+        stream.text_stream = iter(['{"Sol Ring": {"ramp": "S+ Tier"}}'])
+        with app_with_store.test_client() as c:
+            first = c.post("/analyze/stream", json={"card_data": "Sol Ring"}).get_data(as_text=True)
+            replay = c.post("/analyze/stream", json={"card_data": "Sol Ring"}).get_data(as_text=True)
+        first_done = json.loads(first.splitlines()[-1])
+        assert "result_id" in first_done
+        assert [json.loads(line) for line in replay.splitlines()] == [
+            {"card": "Sol Ring", "tags": {"ramp": "S+ Tier"}},
+            {"done": True, "model_used": first_done["model_used"], "result_id": first_done["result_id"]},
+        ]
+        assert mock_client.messages.stream.call_count == 1
+
+    def test_not_configured_is_503(self):
+        flask_app, _ = _make_app(env_key="sk-ant-test-key")
+        with flask_app.test_client() as c:
+            assert c.get("/r/" + "0" * 32).status_code == 503
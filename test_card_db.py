@@ -0,0 +1,102 @@
+"""Tests for the local Scryfall card database."""
+
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from card_db import CardDB, build_index, make_card_db_from_env, normalize_name
+
+BULK = [
+    {"name": "Sol Ring", "layout": "normal", "oracle_text": "{T}: Add {C}{C}.",
+     "image_uris": {"art_crop": "https://img/sol-ring.jpg"}},
+    {"name": "Sol Ring", "layout": "normal", "image_uris": {"art_crop": "https://img/sol-ring-reprint.jpg"}},
+    {"name": "Lim-Dûl's Vault", "layout": "normal", "image_uris": {"art_crop": "https://img/vault.jpg"}},
+    {
+        "name": "Delver of Secrets // Insectile Aberration",
+        "layout": "transform",
+        "card_faces": [
+            {"name": "Delver of Secrets", "oracle_text": "At the beginning of your upkeep, look at the top card.\nTransform it.",
+             "image_uris": {"art_crop": "https://img/delver.jpg"}},
+            {"name": "Insectile Aberration", "oracle_text": "Flying",
+             "image_uris": {"art_crop": "https://img/aberration.jpg"}},
+        ],
+    },
+    {"name": "Sol Ring", "layout": "art_series", "image_uris": {"art_crop": "https://img/art-series.jpg"}},
+]
+
+
+@pytest.fixture
+def paths():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bulk_path = os.path.join(tmpdir, "oracle-cards.json")
+        with open(bulk_path, "w", encoding="utf-8") as f:
+            json.dump(BULK, f)
+        yield bulk_path, os.path.join(tmpdir, "card_db.sqlite3")
+
+
+class TestNormalizeName:
+    def test_ignores_case_accents_and_spacing(self):
+        assert normalize_name("Lim-Dûl’s  Vault") == normalize_name("lim-dul's vault")
+
+
+class TestCardDB:
+    def test_exact_and_normalized_lookup(self, paths):
+        db = CardDB(paths[1], bulk_path=paths[0])
+        assert db.canonical_name("Sol Ring") == "Sol Ring"
+        assert db.canonical_name("SOL  RING") == "Sol Ring"
+        assert db.canonical_name("Lim-Dul's Vault") == "Lim-Dûl's Vault"
+        assert db.canonical_name("Insectile Aberration") == "Delver of Secrets // Insectile Aberration"
+        assert db.canonical_name("Not A Card") is None
+
+    def test_art_urls_first_printing_and_faces(self, paths):
+        db = CardDB(paths[1], bulk_path=paths[0])
+        assert db.art_urls(["sol ring", "Delver of Secrets", "Nope"]) == {
+            "sol ring": "https://img/sol-ring.jpg",
+            "Delver of Secrets": "https://img/delver.jpg",
+            "Nope": None,
+        }
+
+    def test_index_is_reused_and_rebuilt_when_bulk_changes(self, paths):
+        bulk_path, db_path = paths
+        assert build_index(bulk_path, db_path) == 3
+        db = CardDB(db_path, bulk_path)
+        with patch("card_db.build_index") as mock_build:
+            db.ensure_loaded()
+        mock_build.assert_not_called()
+        first = db.version
+
+        with open(bulk_path, "w", encoding="utf-8") as f:
+            json.dump(BULK[:1] + [{"name": "Cultivate", "layout": "normal", "image_uris": {}}], f)
+        os.utime(bulk_path, ns=(1, 1))
+        db = CardDB(db_path, bulk_path)
+        assert db.canonical_name("Cultivate") == "Cultivate"
+        assert db.version != first
+        # Without a bulk path, the existing index is used as-is
+        assert CardDB(db_path).art_urls(["Cultivate"]) == {"Cultivate": None}
+
+    def test_oracle_text_on_one_line(self, paths):
+        db = CardDB(paths[1], bulk_path=paths[0])
+        assert db.oracle_text("sol ring") == "{T}: Add {C}{C}."
+        assert db.oracle_text("Delver of Secrets") == (
+            "At the beginning of your upkeep, look at the top card. Transform it. // Flying"
+        )
+        assert db.oracle_text("Nope") is None
+
+    def test_with_oracle_text_rewrites_known_lines(self, paths):
+        db = CardDB(paths[1], bulk_path=paths[0])
+        card_data = "1x Sol Ring\nMystery Card\nLim-Dul's Vault | Custom text"
+        assert db.with_oracle_text(card_data) == (
+            "Sol Ring | {T}: Add {C}{C}.\nMystery Card\nLim-Dul's Vault | Custom text"
+        )
+
+    def test_outdated_index_without_bulk_file_is_an_error(self, paths):
+        build_index(*paths)
+        with patch("card_db.SCHEMA_VERSION", 999), pytest.raises(RuntimeError):
+            CardDB(paths[1]).ensure_loaded()
+
+    def test_not_configured(self, paths):
+        with patch.dict("os.environ", {"CARD_DB_PATH": paths[1] + ".missing"}, clear=True):
+            assert make_card_db_from_env() is None
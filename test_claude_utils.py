@@ -0,0 +1,278 @@
+"""Tests for claude_utils helpers."""
+
+import threading
+from unittest.mock import patch
+
+import anthropic
+import httpx
+
+import claude_utils
+
+
+class TestClientRegistry:
+    def setup_method(self):
+        claude_utils.reset_clients()
+
+    def teardown_method(self):
+        claude_utils.reset_clients()
+
+    def test_same_key_reuses_client(self):
+        assert claude_utils.get_client("sk-a") is claude_utils.get_client("sk-a")
+        assert claude_utils.get_client("sk-a") is not claude_utils.get_client("sk-b")
+
+    def test_max_retries_gets_its_own_client(self):
+        assert claude_utils.get_client("sk-a").max_retries == anthropic.DEFAULT_MAX_RETRIES
+        assert claude_utils.get_client("sk-a", max_retries=0).max_retries == 0
+        assert claude_utils.get_client("sk-a", max_retries=0) is not claude_utils.get_client("sk-a")
+
+    def test_pool_settings_from_env(self):
+        env = {"ANTHROPIC_POOL_SIZE": "3", "ANTHROPIC_CONNECT_TIMEOUT": "2"}
+        with patch.dict("os.environ", env):
+            with patch("claude_utils.anthropic.DefaultHttpxClient") as MockHttpx, \
+                    patch("claude_utils.anthropic.Anthropic") as MockAnthropic:
+                claude_utils.get_client("sk-a")
+        assert MockAnthropic.call_args.kwargs["http_client"] is MockHttpx.return_value
+        kwargs = MockHttpx.call_args.kwargs
+        assert kwargs["limits"].max_connections == 3
+        assert kwargs["timeout"].connect == 2.0
+
+    def test_concurrent_first_use_creates_one_client(self):
+        clients = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            clients.append(claude_utils.get_client("sk-a"))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(c) for c in clients}) == 1
+
+    def test_registry_cleared_after_fork(self):
+        client = claude_utils.get_client("sk-a")
+        claude_utils._reset_after_fork()
+        assert claude_utils.get_client("sk-a") is not client
+
+
+class TestCardStreamParser:
+    RESPONSE = (
+        "Sol Ring: {T}: Add {C}{C}.\n"
+        "```json\n"
+        '{\n  "Sol Ring": {"ramp": "S+ Tier"},\n'
+        '  "Kaheera, the \\"Orphanguard\\"": {"anthem": "B-Tier"},\n'
+        '  "Odd": {"notes": ["}", {"x": 1}]},\n'
+        '  "Savannah Lions": {}\n}\n```'
+    )
+    EXPECTED = [
+        ("Sol Ring", {"ramp": "S+ Tier"}),
+        ('Kaheera, the "Orphanguard"', {"anthem": "B-Tier"}),
+        ("Odd", {"notes": ["}", {"x": 1}]}),
+        ("Savannah Lions", {}),
+    ]
+
+    def test_whole_response(self):
+        parser = claude_utils.CardStreamParser()
+        assert parser.feed(self.RESPONSE) == self.EXPECTED
+        assert parser.done
+
+    def test_any_chunking_gives_same_entries(self):
+        for size in (1, 2, 3, 5, 8, 13):
+            parser = claude_utils.CardStreamParser()
+            entries = []
+            for i in range(0, len(self.RESPONSE), size):
+                entries.extend(parser.feed(self.RESPONSE[i:i + size]))
+            assert entries == self.EXPECTED, size
+
+    def test_entry_emitted_as_soon_as_it_closes(self):
+        parser = claude_utils.CardStreamParser()
+        assert parser.feed('{"Sol Ring": {"ramp": "S+ Tier"}') == [("Sol Ring", {"ramp": "S+ Tier"})]
+        assert parser.feed(', "Cultivate": {"ramp"') == []
+        assert not parser.done
+
+    def test_number_split_across_chunks(self):
+        parser = claude_utils.CardStreamParser()
+        assert parser.feed('{"count": 1') == []
+        assert parser.feed('2, "x": {}}') == [("count", 12), ("x", {})]
+
+    def test_every_two_chunk_split_matches_whole_parse(self):
+        response = (
+            "Recall: Lim-D\u00fbl's Vault — {T}: Add {C}.\n```json\n"
+            '{"Lim-D\\u00fbl\'s Vault": {"ramp": "S-Tier"}, "A": {"score": 2.5, "delta": -1e-3},\n'
+            ' "B": {"ramp": "S-Tier", "legendary": true, "note": null, "tags": ["x\\"y", {"n": 10}]},'
+            ' "C": {}}\n```'
+        )
+        expected = list(claude_utils.parse_claude_response(response).items())
+        assert [name for name, _ in expected] == ["Lim-D\u00fbl's Vault", "A", "B", "C"]
+        for offset in range(len(response) + 1):
+            parser = claude_utils.CardStreamParser()
+            entries = parser.feed(response[:offset]) + parser.feed(response[offset:])
+            assert entries == expected, offset
+            assert parser.done and not parser.truncated, offset
+
+    def test_invalid_object_stops_without_emitting_nested_keys(self):
+        parser = claude_utils.CardStreamParser()
+        parser.feed('{"A": {"ramp": "S-Tier"}, "B": {"ramp": S-Tier}, "C": {"x": 1}}')
+        assert parser.entries == [("A", {"ramp": "S-Tier"})]
+        assert parser.truncated
+
+    def test_truncated_output_keeps_closed_entries(self):
+        parser = claude_utils.CardStreamParser()
+        parser.feed('{"Sol Ring": {"ramp": "S+ Tier"}, "Cultivate": {"ramp": "A-Ti')
+        assert parser.entries == [("Sol Ring", {"ramp": "S+ Tier"})]
+        assert parser.truncated
+        assert not parser.done
+
+
+class TestParseClaudeResponse:
+    def test_bare_object(self):
+        assert claude_utils.parse_claude_response('{"Sol Ring": {"ramp": "S+ Tier"}}') == {
+            "Sol Ring": {"ramp": "S+ Tier"},
+        }
+
+    def test_recall_prose_then_fenced_object(self):
+        text = (
+            "Sol Ring — {T}: Add {C}{C}.\n"
+            "Cyclonic Rift — Return target nonland permanent you don't control; overload {6}{U}.\n"
+            '```json\n{"Sol Ring": {"ramp": "S+ Tier"}, "Cyclonic Rift": {"mass_disruption": "S-Tier"}}\n```'
+        )
+        assert claude_utils.parse_claude_response(text) == {
+            "Sol Ring": {"ramp": "S+ Tier"},
+            "Cyclonic Rift": {"mass_disruption": "S-Tier"},
+        }
+
+    def test_truncated_response_recovers_partial_result(self):
+        text = '```json\n{"Sol Ring": {"ramp": "S+ Tier"}, "Savannah Lions": {}, "Cultivate": {"ra'
+        assert claude_utils.parse_claude_response(text) == {"Sol Ring": {"ramp": "S+ Tier"}, "Savannah Lions": {}}
+
+    def test_list_response(self):
+        text = '```json\n[{"card_name": "Sol Ring", "ramp": "S+ Tier"}]\n```'
+        assert claude_utils.parse_claude_response(text) == [{"card_name": "Sol Ring", "ramp": "S+ Tier"}]
+
+    def test_empty_object(self):
+        assert claude_utils.parse_claude_response("```json\n{}\n```") == {}
+
+    def test_non_json_returned_as_text(self):
+        text = "Sorry, I could not parse those cards."
+        assert claude_utils.parse_claude_response(text) == text
+
+
+class TestCachedPrompt:
+    TEMPLATE = "Intro\n<cards>\nCARD_LIST_PLACEHOLDER\n</cards>\nMechanics:\nMECHANICS_PLACEHOLDER\nAnchors"
+
+    def test_static_content_in_system_blocks_and_cards_last(self):
+        blocks, user_text = claude_utils.build_cached_prompt(self.TEMPLATE, "Sol Ring", "- ramp", system="JSON only")
+        assert blocks[0] == {"type": "text", "text": "JSON only"}
+        assert [b["cache_control"] for b in blocks[1:]] == [{"type": "ephemeral"}] * 2
+        assert claude_utils.CARD_LIST_REFERENCE in blocks[1]["text"]
+        assert blocks[2]["text"].startswith("- ramp")
+        assert "Sol Ring" not in "".join(b["text"] for b in blocks)
+        assert user_text == "<cards>\nSol Ring\n</cards>"
+
+    def test_plain_layout_by_default(self):
+        prompt, system = claude_utils.build_request_prompt(self.TEMPLATE, "Sol Ring", "- ramp")
+        assert system is None
+        assert prompt == claude_utils.build_prompt(self.TEMPLATE, "Sol Ring", "- ramp")
+
+    def test_cache_tokens_reported_in_usage(self):
+        from stub_anthropic import StubAnthropicServer
+
+        claude_utils.reset_clients()
+        with StubAnthropicServer() as stub, patch.dict("os.environ", {"ANTHROPIC_BASE_URL": stub.base_url}):
+            usages = []
+            for _ in range(2):
+                usage = {}
+                prompt, system = claude_utils.build_request_prompt(self.TEMPLATE, "Sol Ring", "- ramp", cache_prompt=True)
+                claude_utils.call_claude("sk-test", prompt, system=system, usage=usage)
+                usages.append(usage)
+        claude_utils.reset_clients()
+        assert usages[0]["cache_creation_input_tokens"] > 0
+        assert usages[0]["cache_read_input_tokens"] == 0
+        assert usages[1]["cache_read_input_tokens"] == usages[0]["cache_creation_input_tokens"]
+
+
+class TestApiErrorResponse:
+    @staticmethod
+    def _error(cls, status, headers=None):
+        request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+        response = httpx.Response(status, headers=headers or {}, request=request)
+        return cls("boom", response=response, body=None)
+
+    def test_rate_limit_is_retryable_with_retry_after(self):
+        error_dict, status = claude_utils.api_error_response(
+            self._error(anthropic.RateLimitError, 429, {"retry-after": "7"})
+        )
+        assert status == 502
+        assert error_dict["upstream_status"] == 429
+        assert error_dict["retry_after"] == 7.0
+        assert error_dict["retryable"] is True
+
+    def test_retry_after_ms_preferred(self):
+        error_dict, _ = claude_utils.api_error_response(
+            self._error(anthropic.InternalServerError, 529, {"retry-after-ms": "1500", "retry-after": "9"})
+        )
+        assert error_dict["retry_after"] == 1.5
+        assert error_dict["retryable"] is True
+
+    def test_client_errors_are_not_retryable(self):
+        error_dict, status = claude_utils.api_error_response(self._error(anthropic.AuthenticationError, 401))
+        assert status == 401
+        assert error_dict["retryable"] is False
+        error_dict, _ = claude_utils.api_error_response(self._error(anthropic.BadRequestError, 400))
+        assert error_dict["retryable"] is False
+        assert error_dict["retry_after"] is None
+
+
+class TestStubServer:
+    TEMPLATE = "Tag these cards.\n\nCARD_LIST_PLACEHOLDER\n\n[Mechanics]\n\nMECHANICS_PLACEHOLDER\n"
+    MECHANICS = "- ramp: Adds mana.\n- card_advantage: Draws cards."
+
+    def setup_method(self):
+        claude_utils.reset_clients()
+
+    def teardown_method(self):
+        claude_utils.reset_clients()
+
+    def test_prompt12_responder_tags_every_card(self):
+        from stub_anthropic import prompt12_responder
+
+        for cache_prompt in (False, True):
+            prompt, system = claude_utils.build_request_prompt(
+                self.TEMPLATE, "Sol Ring\nMulldrifter | Draw two cards.", self.MECHANICS, cache_prompt=cache_prompt,
+            )
+            params = {"system": system or [], "messages": [{"role": "user", "content": prompt}]}
+            result = claude_utils.parse_claude_response(prompt12_responder(params))
+            assert list(result) == ["Sol Ring", "Mulldrifter"]
+            for tags in result.values():
+                assert set(tags) <= {"ramp", "card_advantage"}
+
+    def test_stream_claude_against_stub(self):
+        from stub_anthropic import StubAnthropicServer, prompt12_responder
+
+        prompt = claude_utils.build_prompt(self.TEMPLATE, "Sol Ring\nCultivate", self.MECHANICS)
+        with StubAnthropicServer(responder=prompt12_responder) as stub, \
+                patch.dict("os.environ", {"ANTHROPIC_BASE_URL": stub.base_url}):
+            stub.stream_chunk_chars = 8
+            usage = {}
+            chunks = list(claude_utils.stream_claude("sk-test", prompt, usage=usage))
+        assert len(chunks) > 1
+        assert list(claude_utils.parse_claude_response("".join(chunks))) == ["Sol Ring", "Cultivate"]
+        assert usage["output_tokens"] > 1
+
+    def test_injected_errors_and_stats(self):
+        from stub_anthropic import StubAnthropicServer
+
+        with StubAnthropicServer(error_rate=1.0, error_status=429, retry_after=3) as stub:
+            client = anthropic.Anthropic(api_key="sk-test", base_url=stub.base_url, max_retries=0)
+            try:
+                client.messages.create(model="m", max_tokens=8, messages=[{"role": "user", "content": "x"}])
+            except anthropic.RateLimitError as e:
+                error_dict, _ = claude_utils.api_error_response(e)
+            stats = httpx.get(f"{stub.base_url}/_stats").json()
+        assert error_dict["upstream_status"] == 429
+        assert error_dict["retry_after"] == 3.0
+        assert stats["errors_injected"] == 1
+        assert stats["messages"] == 1
+        assert stats["in_flight"] == 0
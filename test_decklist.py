@@ -0,0 +1,45 @@
+"""Tests for decklist parsing."""
+
+from decklist import KNOWN_LANDS, parse_card_line, parse_decklist
+
+
+class TestParseCardLine:
+    def test_strips_export_annotations(self):
+        assert parse_card_line("1x Sol Ring (cmr) 472 [Ramp] ^Have,#37d67a^") == ("Sol Ring", "")
+        assert parse_card_line("1 Sol Ring (CMR) 472 *F*") == ("Sol Ring", "")
+        assert parse_card_line("1 Fire // Ice (MH2) 290") == ("Fire // Ice", "")
+        assert parse_card_line("4 Jace’s  Erasure") == ("Jace's Erasure", "")
+
+    def test_keeps_names_and_oracle_text(self):
+        assert parse_card_line("B.F.M. (Big Furry Monster)") == ("B.F.M. (Big Furry Monster)", "")
+        assert parse_card_line("1 Sol Ring | {T}: Add {C}{C}.") == ("Sol Ring", "{T}: Add {C}{C}.")
+
+
+class TestParseDecklist:
+    def test_archidekt_export(self):
+        text = (
+            "1x Atraxa, Praetors' Voice (c16) 28 [Commander{top}]\n"
+            "1x Sol Ring (cmr) 472 [Ramp]\n"
+            "1x Cultivate (m21) 177 [Ramp,Land Fetch]\n"
+            "10x Forest (znr) 381 [Land]\n"
+            "1x Command Tower (c21) 284 [Land]\n"
+        )
+        assert parse_decklist(text) == ["Atraxa, Praetors' Voice", "Sol Ring", "Cultivate"]
+
+    def test_moxfield_export_with_sections(self):
+        text = "Commander\n1 Atraxa, Praetors' Voice (C16) 28\n\nDeck\n1 Sol Ring (CMR) 472 *F*\n8 Snow-Covered Island (KHM) 278\n"
+        assert parse_decklist(text) == ["Atraxa, Praetors' Voice", "Sol Ring"]
+
+    def test_mtgo_export_with_sideboard(self):
+        text = "4 Lightning Bolt\n20 Mountain\n\nSIDEBOARD:\n2 Smash to Smithereens\n// comment\n"
+        assert parse_decklist(text) == ["Lightning Bolt", "Smash to Smithereens"]
+
+    def test_dedupes_across_spellings(self):
+        assert parse_decklist("1 Sol Ring\n1x sol  ring (CMR) 472\nSOL RING | text") == ["Sol Ring"]
+
+    def test_canonical_name_lookup(self):
+        canonical = {"sol ring": "Sol Ring"}.get
+        assert parse_decklist("1 sol ring\nHomebrew Card", canonical) == ["Sol Ring", "Homebrew Card"]
+
+    def test_known_lands_are_dropped(self):
+        assert parse_decklist("\n".join(sorted(KNOWN_LANDS)) + "\nWastes") == []
@@ -0,0 +1,113 @@
+"""Tests for the background job store and queue."""
+
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from jobs import JobQueue, PostgresJobStore, SQLiteJobStore
+
+
+@pytest.fixture
+def store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield SQLiteJobStore(os.path.join(tmpdir, "jobs.sqlite3"))
+
+
+def _wait(store, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+class TestSQLiteJobStore:
+    def test_same_key_coalesces_while_active(self, store):
+        job_id, created = store.submit("deck")
+        assert created
+        assert store.submit("deck") == (job_id, False)
+        assert store.submit("other")[1]
+
+        store.update(job_id, "done", http_status=200, response={"result": {}})
+        new_id, created = store.submit("deck")
+        assert created
+        assert new_id != job_id
+
+    def test_update_and_get(self, store):
+        job_id, _ = store.submit("deck")
+        store.update(job_id, "running", done=1, total=3)
+        store.update(job_id, "done", http_status=200, response={"result": {"Sol Ring": {}}})
+        job = store.get(job_id)
+        assert (job["status"], job["done"], job["total"]) == ("done", 1, 3)
+        assert job["response"] == {"result": {"Sol Ring": {}}}
+        assert store.get("missing") is None
+
+    def test_stale_jobs_fail_and_stop_coalescing(self, store):
+        with patch("jobs.time.time", return_value=1000.0):
+            job_id, _ = store.submit("deck")
+        with patch("jobs.time.time", return_value=1000.0 + store.stale_seconds + 1):
+            new_id, created = store.submit("deck")
+        assert created
+        assert store.get(job_id)["status"] == "failed"
+        assert store.get(job_id)["http_status"] == 500
+
+
+class TestPostgresJobStore:
+    def test_get_uses_decoded_jsonb_and_closes_connections(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = ("j1", "done", 1, 1, 200, {"result": {}}, 1.0, 2.0)
+
+        job = PostgresJobStore(connect=lambda: conn).get("j1")
+
+        assert job["response"] == {"result": {}}
+        assert conn.close.call_count == 2  # CREATE TABLE, then the SELECT
+
+
+class TestJobQueue:
+    def test_runs_work_and_records_progress(self, store):
+        queue = JobQueue(lambda: store)
+
+        def work(report):
+            report(1, 2)
+            report(2, 2)
+            return {"result": {"Sol Ring": {"ramp": "S+ Tier"}}}, 200
+
+        job_id, _ = queue.submit("deck", work)
+        job = _wait(store, job_id)
+        assert job["status"] == "done"
+        assert (job["done"], job["total"]) == (2, 2)
+        assert job["response"]["result"] == {"Sol Ring": {"ramp": "S+ Tier"}}
+
+    def test_duplicate_submission_runs_once(self, store):
+        queue = JobQueue(lambda: store)
+        release = threading.Event()
+        calls = []
+
+        def work(report):
+            calls.append(1)
+            release.wait(5)
+            return {"result": {}}, 200
+
+        first, _ = queue.submit("deck", work)
+        second, created = queue.submit("deck", work)
+        release.set()
+        _wait(store, first)
+        assert (second, created) == (first, False)
+        assert len(calls) == 1
+
+    def test_error_status_and_exceptions_fail_the_job(self, store):
+        queue = JobQueue(lambda: store)
+        errored, _ = queue.submit("a", lambda report: ({"error": "Rate limited"}, 429))
+        crashed, _ = queue.submit("b", lambda report: 1 / 0)
+        assert _wait(store, errored)["http_status"] == 429
+        job = _wait(store, crashed)
+        assert job["status"] == "failed"
+        assert job["http_status"] == 500
+        assert "division by zero" in job["response"]["error"]
@@ -0,0 +1,65 @@
+"""Tests for the prompt template registry."""
+
+import os
+import tempfile
+
+import pytest
+
+from claude_utils import build_feedback_prompt, build_prompt
+from prompt_registry import PromptRegistry
+
+
+def _write(path, text, mtime_ns=None):
+    with open(path, "w") as f:
+        f.write(text)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class TestBuildPrompt:
+    def test_fills_every_placeholder(self):
+        template = "A CARD_LIST_PLACEHOLDER B MECHANICS_PLACEHOLDER C CARD_LIST_PLACEHOLDER"
+        assert build_prompt(template, "cards", "mechs") == "A cards B mechs C cards"
+
+    def test_inputs_are_not_rescanned(self):
+        """Placeholder text inside the card list is left alone."""
+        assert build_prompt("CARD_LIST_PLACEHOLDER", "MECHANICS_PLACEHOLDER", "x") == "MECHANICS_PLACEHOLDER"
+
+    def test_feedback_prompt(self):
+        template = "CARD_LIST_PLACEHOLDER|MECHANICS_PLACEHOLDER|PASS1_RESULTS_PLACEHOLDER"
+        assert build_feedback_prompt(template, "c", "m", "{}") == "c|m|{}"
+
+
+class TestPromptRegistry:
+    def test_reuses_loaded_template(self):
+        registry = PromptRegistry()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write(os.path.join(tmpdir, "p.md"), "CARD_LIST_PLACEHOLDER")
+            assert registry.get(tmpdir, "p") is registry.get(tmpdir, "p")
+
+    def test_reloads_when_file_changes(self):
+        registry = PromptRegistry()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "p.md")
+            _write(path, "old CARD_LIST_PLACEHOLDER", mtime_ns=1_000_000_000)
+            first = registry.get(tmpdir, "p")
+            _write(path, "new CARD_LIST_PLACEHOLDER", mtime_ns=2_000_000_000)
+            second = registry.get(tmpdir, "p")
+            assert second.text.startswith("new")
+            assert second.hash != first.hash
+
+    def test_missing_and_invalid_names(self):
+        registry = PromptRegistry()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            assert registry.get(tmpdir, "nope") is None
+            with pytest.raises(ValueError):
+                registry.get(tmpdir, "../app")
+
+    def test_list_only_includes_card_templates(self):
+        registry = PromptRegistry()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _write(os.path.join(tmpdir, "b.md"), "CARD_LIST_PLACEHOLDER")
+            _write(os.path.join(tmpdir, "a.md"), "CARD_LIST_PLACEHOLDER MECHANICS_PLACEHOLDER")
+            _write(os.path.join(tmpdir, "README.md"), "# Prompts")
+            _write(os.path.join(tmpdir, "notes.txt"), "CARD_LIST_PLACEHOLDER")
+            assert [t.name for t in registry.list(tmpdir)] == ["a", "b"]
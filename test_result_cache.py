@@ -0,0 +1,117 @@
+"""Tests for the card-level result cache backends."""
+
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from result_cache import (
+    CardResultCache, MemoryBackend, PostgresBackend, SQLiteBackend, make_cache_from_env, parse_card_line,
+)
+
+
+def _entry(key, card_name, tags):
+    return {"key": key, "card_name": card_name, "tags": tags, "model": "m", "prompt_file": "p"}
+
+
+class TestParseCardLine:
+    def test_strips_quantity(self):
+        assert parse_card_line("1x Sol Ring") == ("Sol Ring", "")
+        assert parse_card_line("11 Forest") == ("Forest", "")
+
+    def test_splits_oracle_text(self):
+        assert parse_card_line("Sol Ring | {T}: Add {C}{C}.") == ("Sol Ring", "{T}: Add {C}{C}.")
+
+
+class TestMemoryBackend:
+    def test_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set_many([_entry("a", "A", {}), _entry("b", "B", {})])
+        backend.get_many(["a"])
+        backend.set_many([_entry("c", "C", {})])
+        assert set(backend.get_many(["a", "b", "c"])) == {"a", "c"}
+
+    def test_expired_entries_are_misses(self):
+        backend = MemoryBackend(ttl=10)
+        with patch("result_cache.time.monotonic", return_value=100.0):
+            backend.set_many([_entry("a", "A", {"ramp": "S+ Tier"})])
+        with patch("result_cache.time.monotonic", return_value=105.0):
+            assert backend.get_many(["a"]) == {"a": ("A", {"ramp": "S+ Tier"})}
+        with patch("result_cache.time.monotonic", return_value=111.0):
+            assert backend.get_many(["a"]) == {}
+
+
+class TestSQLiteBackend:
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backend = SQLiteBackend(os.path.join(tmpdir, "cache.sqlite3"))
+            backend.set_many([_entry("a", "Sol Ring", {"ramp": "S+ Tier"})])
+            assert backend.get_many(["a", "b"]) == {"a": ("Sol Ring", {"ramp": "S+ Tier"})}
+
+
+class TestPostgresBackend:
+    def test_uses_its_own_table(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        statements = []
+        cur.execute.side_effect = lambda sql, params=None: statements.append(sql)
+        cur.fetchall.return_value = [("k1", "Sol Ring", {"ramp": "S+ Tier"})]
+
+        backend = PostgresBackend(connect=lambda: conn)
+        assert backend.get_many(["k1"]) == {"k1": ("Sol Ring", {"ramp": "S+ Tier"})}
+        with patch("psycopg2.extras.execute_values") as mock_execute_values:
+            backend.set_many([_entry("k2", "Cultivate", {"ramp": "A-Tier"})])
+
+        statements.append(mock_execute_values.call_args.args[1])
+        assert all("public.result_cache" in sql for sql in statements)
+        assert not any("labeled" in sql for sql in statements)
+
+
+    def test_duplicate_keys_are_written_once(self):
+        conn = MagicMock()
+        backend = PostgresBackend(connect=lambda: conn)
+        with patch("psycopg2.extras.execute_values") as mock_execute_values:
+            backend.set_many([_entry("k", "Sol Ring", {"ramp": "B-Tier"}),
+                              _entry("k", "Sol Ring", {"ramp": "S+ Tier"})])
+        rows = mock_execute_values.call_args.args[2]
+        assert [row[0] for row in rows] == ["k"]
+        assert '"S+ Tier"' in rows[0][4]
+
+    def test_opened_on_first_use(self):
+        with patch.dict("os.environ", {"RESULT_CACHE_BACKEND": "postgres"}), \
+                patch("result_cache.PostgresBackend") as MockBackend:
+            cache = make_cache_from_env()
+            MockBackend.assert_not_called()
+            MockBackend.return_value.get_many.return_value = {}
+            cache.partition("Sol Ring", "T", "M", "model")
+        MockBackend.assert_called_once_with()
+
+
+class TestCardResultCache:
+    def test_backend_errors_are_misses(self):
+        backend = MagicMock()
+        backend.get_many.side_effect = RuntimeError("database is down")
+        backend.set_many.side_effect = RuntimeError("database is down")
+        cache = CardResultCache(backend)
+        cached, uncached, pending = cache.partition("Sol Ring", "T", "M", "model")
+        assert (cached, uncached) == ({}, ["Sol Ring"])
+        cache.store({"Sol Ring": {"ramp": "S+ Tier"}}, pending, model="model", prompt_file="p")
+        backend.set_many.assert_called_once()
+
+    def test_partition_and_store(self):
+        cache = CardResultCache(MemoryBackend())
+        cached, uncached, pending = cache.partition("1 Sol Ring\n1 Cultivate\n", "T", "M", "model")
+        assert cached == {}
+        assert uncached == ["1 Sol Ring", "1 Cultivate"]
+
+        cache.store({"Sol Ring": {"ramp": "S+ Tier"}, "cards": []}, pending, model="model", prompt_file="p")
+        cached, uncached, _ = cache.partition("1 Sol Ring\n1 Cultivate", "T", "M", "model")
+        assert cached == {"Sol Ring": {"ramp": "S+ Tier"}}
+        assert uncached == ["1 Cultivate"]
+
+    def test_model_is_part_of_key(self):
+        cache = CardResultCache(MemoryBackend())
+        _, _, pending = cache.partition("Sol Ring", "T", "M", "model-a")
+        cache.store({"Sol Ring": {"ramp": "S+ Tier"}}, pending, model="model-a", prompt_file="p")
+        cached, uncached, _ = cache.partition("Sol Ring", "T", "M", "model-b")
+        assert cached == {}
+        assert uncached == ["Sol Ring"]
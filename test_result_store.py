@@ -0,0 +1,54 @@
+"""Tests for the content-addressed result store."""
+
+import os
+import tempfile
+
+import pytest
+
+from result_store import ResultStore, SQLiteResultStore, result_id
+
+
+@pytest.fixture
+def store():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield SQLiteResultStore(os.path.join(tmpdir, "results.sqlite3"))
+
+
+class TestResultId:
+    def test_ignores_order_case_and_duplicates(self):
+        rid = result_id("Sol Ring\nCultivate", "- ramp: mana", "t", "m")
+        assert len(rid) == 32
+        assert result_id("cultivate\nSol Ring\nsol ring", "- ramp: mana", "t", "m") == rid
+
+    def test_covers_everything_that_shapes_the_result(self):
+        rid = result_id("Sol Ring", "- ramp: mana", "t", "m")
+        assert result_id("Sol Ring | {T}: Add {C}{C}.", "- ramp: mana", "t", "m") != rid
+        assert result_id("Sol Ring", "- ramp: more mana", "t", "m") != rid
+        assert result_id("Sol Ring", "- ramp: mana", "t2", "m") != rid
+        assert result_id("Sol Ring", "- ramp: mana", "t", "m2") != rid
+
+
+class TestSQLiteResultStore:
+    def test_put_and_get(self, store):
+        response = {"result": {"Sol Ring": {"ramp": "S+ Tier"}}, "model_used": "m"}
+        store.put("a" * 32, response)
+        assert store.get("a" * 32) == response
+        assert store.get("b" * 32) is None
+
+    def test_first_result_is_kept(self, store):
+        store.put("a" * 32, {"result": {"Sol Ring": {}}, "model_used": "m"})
+        store.put("a" * 32, {"result": {"Cultivate": {}}, "model_used": "m"})
+        assert store.get("a" * 32)["result"] == {"Sol Ring": {}}
+
+
+class TestResultStore:
+    def test_opens_store_on_first_use(self, store):
+        made = []
+        results = ResultStore(lambda: made.append(1) or store)
+        assert made == []
+        results.put("a" * 32, {"result": {}, "model_used": "m"})
+        assert results.get("a" * 32) == {"result": {}, "model_used": "m"}
+        assert made == [1]
+
+    def test_malformed_ids_are_not_looked_up(self, store):
+        assert ResultStore(lambda: store).get("../etc") is None
@@ -0,0 +1,129 @@
+"""Tests for single-flight call deduplication."""
+
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from single_flight import SingleFlight, request_key
+
+
+def _slow(release, calls, value):
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return value
+    return fn
+
+
+def _start(target, results):
+    thread = threading.Thread(target=lambda: results.append(target()))
+    thread.start()
+    return thread
+
+
+class TestInProcess:
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        release, calls, results = threading.Event(), [], []
+        threads = [_start(lambda: flight.do("k", _slow(release, calls, {"Sol Ring": {}})), results) for _ in range(5)]
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert all(value == {"Sol Ring": {}} for value, _ in results)
+
+    def test_exception_reaches_waiters(self):
+        flight = SingleFlight()
+        release, errors = threading.Event(), []
+
+        def fail():
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        def call():
+            try:
+                flight.do("k", fail)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert errors == ["boom"] * 3
+
+    def test_unshareable_value_is_recomputed_by_waiters(self):
+        flight = SingleFlight()
+        release, calls, results = threading.Event(), [], []
+        shareable = lambda value: value != "error"  # noqa: E731
+        first = _start(lambda: flight.do("k", _slow(release, calls, "error"), shareable), results)
+        time.sleep(0.1)
+        second = _start(lambda: flight.do("k", lambda: "own", shareable), results)
+        time.sleep(0.1)
+        release.set()
+        first.join()
+        second.join()
+        assert sorted(results) == [("error", False), ("own", False)]
+
+    def test_sequential_calls_are_not_coalesced(self):
+        flight = SingleFlight()
+        assert flight.do("k", lambda: 1) == (1, False)
+        assert flight.do("k", lambda: 2) == (2, False)
+
+    def test_key_covers_model_and_temperature(self):
+        assert request_key("p", "m") == request_key("p", "m")
+        assert request_key("p", "m") != request_key("p", "m2")
+        assert request_key("p", "m") != request_key("p", "m", temperature=0.5)
+
+
+class TestAcrossWorkers:
+    """Two SingleFlight instances on one lock directory stand in for two gunicorn workers."""
+
+    @pytest.fixture
+    def lock_dir(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            yield tmpdir
+
+    def _race(self, lock_dir, leader_value, shareable=None):
+        leader, follower = SingleFlight(lock_dir), SingleFlight(lock_dir)
+        release, leader_calls, follower_calls, results = threading.Event(), [], [], []
+        ready = threading.Event()
+        ready.set()
+        first = _start(lambda: leader.do("k", _slow(release, leader_calls, leader_value), shareable), results)
+        time.sleep(0.1)
+        second = _start(lambda: follower.do("k", _slow(ready, follower_calls, "own"), shareable), results)
+        time.sleep(0.1)
+        release.set()
+        first.join()
+        second.join()
+        # The follower can finish before the leader's thread records its result
+        return sorted(results, key=lambda result: result[1]), leader_calls, follower_calls
+
+    def test_waiting_worker_reads_leaders_value(self, lock_dir):
+        results, leader_calls, follower_calls = self._race(lock_dir, {"Sol Ring": {"ramp": "S+ Tier"}})
+        assert results == [({"Sol Ring": {"ramp": "S+ Tier"}}, False), ({"Sol Ring": {"ramp": "S+ Tier"}}, True)]
+        assert (len(leader_calls), len(follower_calls)) == (1, 0)
+
+    def test_unshareable_value_is_recomputed(self, lock_dir):
+        results, _, follower_calls = self._race(lock_dir, "error", shareable=lambda value: value != "error")
+        assert sorted(value for value, _ in results) == ["error", "own"]
+        assert all(not shared for _, shared in results)
+        assert len(follower_calls) == 1
+
+    def test_value_from_an_earlier_call_is_not_reused(self, lock_dir):
+        SingleFlight(lock_dir).do("k", lambda: "old")
+        assert SingleFlight(lock_dir).do("k", lambda: "new") == ("new", False)
+
+    def test_value_written_in_the_same_clock_tick_is_not_reused(self, lock_dir):
+        # With whole-second mtimes, an earlier value would look as new as the waiter
+        with patch("single_flight.time.time", return_value=1000.0):
+            SingleFlight(lock_dir).do("k", lambda: "old")
+            assert SingleFlight(lock_dir).do("k", lambda: "new") == ("new", False)